@@ -1,26 +1,26 @@
 from datetime import datetime
-import json
-import logging
-import os
- 
-from flask import Blueprint, jsonify, request, abort, current_app, url_for
-from werkzeug.security import check_password_hash
+
+from flask import Blueprint, jsonify, request, abort, current_app, stream_with_context
+from flask_babel import gettext
 from marshmallow import ValidationError
 
-from ..models import db, Item, Order, OrderItem, Category, ORDER_STATUSES
+from ..models import db, Item, Order, Category, ORDER_STATUSES
 from ..schemas import ItemSchema, CategorySchema
 from ..events import push_event
-from ..services import order_service, item_service
+from ..services import order_service, item_service, category_service, image_service, token_service, credential_cache, sales_service, analytics_service, log_store
 
 admin_bp = Blueprint('admin', __name__)
 
+LOG_PAGE_SIZE = 100
+LOG_MAX_PAGE_SIZE = 1000
+
 
 def auth_required():
+    claims = token_service.bearer_claims()
+    if claims is not None and claims.is_admin:
+        return
     auth = request.authorization
-    if not auth or not (
-        auth.username == current_app.config['ADMIN_USERNAME'] and
-        check_password_hash(current_app.config['ADMIN_PASSWORD_HASH'], auth.password)
-    ):
+    if not auth or auth.type != 'basic' or not credential_cache.check_admin(auth.username, auth.password):
         abort(401)
 
 
@@ -52,6 +52,11 @@ def list_orders():
           type: string
           format: date-time
         description: End of creation period
+      - in: query
+        name: format
+        schema:
+          type: string
+        description: Stream one JSON order per line when equal to 'ndjson'
     responses:
       200:
         description: List of orders
@@ -61,44 +66,64 @@ def list_orders():
               type: array
               items:
                 type: object
+          application/x-ndjson:
+            schema:
+              type: object
     """
     auth_required()
-    qs = Order.query
+    criteria = []
     status_f = request.args.get('status')
     if status_f:
-        qs = qs.filter(Order.status == status_f)
+        criteria.append(Order.status == status_f)
     seat_f = request.args.get('seat')
     if seat_f:
-        qs = qs.filter(Order.seat == seat_f)
+        criteria.append(Order.seat == seat_f)
     if request.args.get('from'):
         try:
             dt_from = datetime.fromisoformat(request.args['from'])
-            qs = qs.filter(Order.created_at >= dt_from)
+            criteria.append(Order.created_at >= dt_from)
         except ValueError:
             pass
     if request.args.get('to'):
         try:
             dt_to = datetime.fromisoformat(request.args['to'])
-            qs = qs.filter(Order.created_at <= dt_to)
+            criteria.append(Order.created_at <= dt_to)
         except ValueError:
             pass
-    orders = qs.all()
     lang = request.args.get('lang') or request.accept_languages.best_match(['ru', 'en']) or 'ru'
-    return jsonify([
-        {
-            'id': o.id,
-            'seat': o.seat,
-            'status': o.status,
-            'items': [
-                {
-                    'name': oi.item.name_en if lang == 'en' else oi.item.name_ru,
-                    'quantity': oi.quantity,
-                }
-                for oi in o.items
-            ],
-        }
-        for o in orders
-    ])
+    if request.args.get('format') == 'ndjson':
+        return _stream_orders(criteria, lang)
+    orders = order_service.order_views(*criteria)
+    return jsonify([_admin_order_json(o, lang) for o in orders])
+
+
+def _admin_order_json(o, lang):
+    return {
+        'id': o.id,
+        'seat': o.seat,
+        'status': o.status,
+        'total': o.total,
+        'item_count': o.item_count,
+        'items': [
+            {
+                'name': line.name_en if lang == 'en' else line.name_ru,
+                'quantity': line.quantity,
+                'price': line.price,
+            }
+            for line in o.lines
+        ],
+    }
+
+
+def _stream_orders(criteria, lang):
+    """Send matching orders as NDJSON while they are read in chunks."""
+    dumps = current_app.json.dumps
+
+    def rows():
+        for o in order_service.iter_order_views(*criteria):
+            yield dumps(_admin_order_json(o, lang)) + '\n'
+
+    return current_app.response_class(stream_with_context(rows()), mimetype='application/x-ndjson')
 
 
 @admin_bp.route('/orders/<int:order_id>', methods=['PATCH'])
@@ -189,12 +214,12 @@ def admin_items():
             'name_en': i.name_en,
             'description_ru': i.description_ru,
             'description_en': i.description_en,
-            'image': url_for('serve_image', filename=i.image) if i.image else None,
             'price': i.price,
             'available': i.available,
             'service': i.is_service,
             'category_id': i.category_id,
             'image': i.image,
+            'images': image_service.image_urls(i.image),
         }
         for i in items
     ])
@@ -288,15 +313,10 @@ def admin_categories():
             data = CategorySchema().load(request.get_json() or {})
         except ValidationError as err:
             return jsonify(err.messages), 400
-        cat = Category(
-            name_ru=data['name_ru'],
-            name_en=data['name_en'],
-            parent_id=data.get('parent_id'),
-            image=data.get('image'),
-        )
-        db.session.add(cat)
-        db.session.commit()
-        logging.info('category_created %s', cat.id)
+        try:
+            cat = category_service.create_category(data)
+        except ValueError as err:
+            return jsonify({'error': str(err)}), 400
         return jsonify({'id': cat.id}), 201
     cats = Category.query.all()
     return jsonify([
@@ -304,7 +324,8 @@ def admin_categories():
             'id': c.id,
             'name_ru': c.name_ru,
             'name_en': c.name_en,
-            'image': url_for('serve_image', filename=c.image) if c.image else None,
+            'image': image_service.image_url(c.image),
+            'images': image_service.image_urls(c.image),
             'parent_id': c.parent_id,
         }
         for c in cats
@@ -352,20 +373,12 @@ def admin_category_detail(cat_id):
             data = CategorySchema(partial=True).load(request.get_json() or {})
         except ValidationError as err:
             return jsonify(err.messages), 400
-        if 'name_ru' in data:
-            cat.name_ru = data['name_ru']
-        if 'name_en' in data:
-            cat.name_en = data['name_en']
-        if 'image' in data:
-            cat.image = data['image']
-        if 'parent_id' in data:
-            cat.parent_id = data['parent_id']
-        db.session.commit()
-        logging.info('category_updated %s', cat.id)
+        try:
+            cat = category_service.update_category(cat, data)
+        except ValueError as err:
+            return jsonify({'error': str(err)}), 400
         return jsonify({'id': cat.id})
-    db.session.delete(cat)
-    db.session.commit()
-    logging.info('category_deleted %s', cat.id)
+    category_service.delete_category(cat)
     return '', 204
 
 
@@ -373,6 +386,8 @@ def admin_category_detail(cat_id):
 def sales_report():
     """Get monthly sales totals.
 
+    Read from the sales rollup; cancelled orders are not counted.
+
     ---
     parameters:
       - in: query
@@ -380,6 +395,11 @@ def sales_report():
         schema:
           type: integer
         description: Filter report by year
+      - in: query
+        name: category
+        schema:
+          type: integer
+        description: Only sales of this category and its subcategories
       - in: query
         name: format
         schema:
@@ -391,26 +411,9 @@ def sales_report():
     """
     auth_required()
     year = request.args.get('year', type=int)
+    category_id = request.args.get('category', type=int)
     as_csv = request.args.get('format') == 'csv'
-    qs = db.session.query(
-        db.func.extract('year', Order.created_at).label('year'),
-        db.func.extract('month', Order.created_at).label('month'),
-        db.func.sum(OrderItem.quantity * Item.price).label('total'),
-        Item.is_service
-    ).join(OrderItem, Order.id == OrderItem.order_id)
-    qs = qs.join(Item, Item.id == OrderItem.item_id)
-    if year:
-        qs = qs.filter(db.func.extract('year', Order.created_at) == year)
-    qs = qs.group_by('year', 'month', Item.is_service).order_by('year', 'month')
-    rows = qs.all()
-    result = {}
-    for r in rows:
-        key = f"{int(r.year):04d}-{int(r.month):02d}"
-        result.setdefault(key, {'goods': 0, 'services': 0})
-        if r.is_service:
-            result[key]['services'] += float(r.total or 0)
-        else:
-            result[key]['goods'] += float(r.total or 0)
+    result = sales_service.report(year, category_id)
     if as_csv:
         import csv
         from io import StringIO
@@ -424,6 +427,114 @@ def sales_report():
     return jsonify(result)
 
 
+@admin_bp.route('/reports/sales/cube')
+def sales_cube():
+    """Break sales down by several dimensions.
+
+    Cancelled orders are not counted. Requires NumPy.
+    ---
+    parameters:
+      - in: query
+        name: dims
+        required: true
+        schema:
+          type: string
+        description: Comma-separated item, category, zone, hour, payment_method, month, kind
+      - in: query
+        name: metrics
+        schema:
+          type: string
+        description: Comma-separated revenue (default), quantity, lines, orders, avg_price
+      - in: query
+        name: from
+        schema:
+          type: string
+          format: date-time
+        description: Start of creation period
+      - in: query
+        name: to
+        schema:
+          type: string
+          format: date-time
+        description: End of creation period (exclusive)
+      - in: query
+        name: top
+        schema:
+          type: integer
+        description: Keep the groups with the largest first metric
+      - in: query
+        name: pivot
+        schema:
+          type: string
+        description: One of dims whose values become columns of the first metric
+    responses:
+      200:
+        description: Groups sorted by the first metric, largest first
+      400:
+        description: Unknown dimension, metric or date
+      501:
+        description: NumPy is not installed
+    """
+    auth_required()
+    dims = [d for d in request.args.get('dims', '').split(',') if d]
+    metrics = [m for m in request.args.get('metrics', 'revenue').split(',') if m]
+    column_dim = request.args.get('pivot')
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': gettext('Invalid report parameters')}), 400
+    if (not dims or not metrics or len(set(dims)) != len(dims)
+            or not set(dims) <= set(analytics_service.DIMENSIONS)
+            or not set(metrics) <= set(analytics_service.METRICS)
+            or (column_dim is not None and column_dim not in dims)):
+        return jsonify({'error': gettext('Invalid report parameters')}), 400
+    top_n = request.args.get('top', type=int)
+    lang = request.args.get('lang') or request.accept_languages.best_match(['ru', 'en']) or 'ru'
+    try:
+        lines = analytics_service.fetch_lines(start, end)
+    except RuntimeError:
+        return jsonify({'error': gettext('Sales analytics are not available')}), 501
+
+    zones = analytics_service.parse_zones(current_app.config.get('ANALYTICS_SEAT_ZONES', analytics_service.DEFAULT_ZONES))
+    keys, values = analytics_service.cube(lines, dims, metrics, zones)
+    names = analytics_service.names(dims, keys, lang)
+    _, totals = analytics_service.cube(lines, [], metrics)
+
+    def dim_values(dim_list, key):
+        row = {}
+        for dim, value in zip(dim_list, key):
+            if dim == 'kind':
+                value = 'services' if value else 'goods'
+            elif dim == 'payment_method':
+                value = value or None
+            elif dim in ('item', 'category'):
+                row[f'{dim}_name'] = names[dim].get(value)
+                value = value or None
+            row[dim] = value
+        return row
+
+    result = {
+        'dims': dims,
+        'metrics': metrics,
+        'totals': {m: totals[m].tolist()[0] for m in metrics},
+    }
+    if column_dim is not None:
+        columns, rows = analytics_service.pivot(keys, values, dims, column_dim, metrics[0])
+        other = [d for d in dims if d != column_dim]
+        result.update(
+            pivot=column_dim,
+            columns=[dim_values([column_dim], (c,)) for c in columns],
+            rows=[dict(dim_values(other, key), values=cells) for key, cells in rows[:top_n or None]],
+        )
+    else:
+        result['rows'] = [
+            dict(dim_values(dims, keys[i]), **{m: values[m][i].item() for m in metrics})
+            for i in analytics_service.top(keys, values, metrics[0], top_n)
+        ]
+    return jsonify(result)
+
+
 @admin_bp.route('/logs')
 def search_logs():
     """Search server logs.
@@ -457,14 +568,27 @@ def search_logs():
           type: string
           format: date-time
         description: End of time range
+      - in: query
+        name: limit
+        schema:
+          type: integer
+          minimum: 1
+          maximum: 1000
+        description: Page size; when given the response is a page object
+      - in: query
+        name: cursor
+        schema:
+          type: string
+        description: Opaque next_cursor from the previous page
     responses:
       200:
-        description: Matching log entries
+        description: >
+          Matching log entries newest first, or a page object with items and
+          next_cursor when limit or cursor is given
+      400:
+        description: Invalid cursor
     """
     auth_required()
-    query = request.args.get('q')
-    user_f = request.args.get('user')
-    endpoint_f = request.args.get('endpoint')
     dt_from = None
     if request.args.get('from'):
         try:
@@ -477,32 +601,24 @@ def search_logs():
             dt_to = datetime.fromisoformat(request.args['to'])
         except ValueError:
             pass
+    before = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            before = log_store.decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': gettext('Invalid cursor')}), 400
+    limit = request.args.get('limit', type=int)
+    if limit is not None or cursor:
+        limit = min(max(limit or LOG_PAGE_SIZE, 1), LOG_MAX_PAGE_SIZE)
 
-    entries = []
-    if os.path.exists('airservice.log'):
-        with open('airservice.log') as f:
-            for ln in f:
-                try:
-                    entry = json.loads(ln)
-                except json.JSONDecodeError:
-                    continue
-                if query and query not in entry.get('message', ''):
-                    continue
-                if user_f and entry.get('user') != user_f:
-                    continue
-                if endpoint_f and entry.get('endpoint') != endpoint_f:
-                    continue
-                ts_str = entry.get('timestamp')
-                if ts_str:
-                    try:
-                        ts = datetime.fromisoformat(ts_str)
-                    except ValueError:
-                        ts = None
-                else:
-                    ts = None
-                if dt_from and ts and ts < dt_from:
-                    continue
-                if dt_to and ts and ts > dt_to:
-                    continue
-                entries.append(entry)
-    return jsonify(entries)
+    entries, next_key = log_store.get_store().search(
+        dt_from, dt_to, user=request.args.get('user') or None, endpoint=request.args.get('endpoint') or None,
+        text=request.args.get('q'), before=before, limit=limit,
+    )
+    if limit is None:
+        return jsonify(entries)
+    return jsonify({
+        'items': entries,
+        'next_cursor': log_store.encode_cursor(next_key) if next_key else None,
+    })
@@ -1,10 +1,11 @@
-from flask import Blueprint, request, jsonify, abort
+from flask import Blueprint, request, jsonify, abort, current_app
 from werkzeug.security import check_password_hash
 from flask_babel import gettext
 from marshmallow import ValidationError
 from marshmallow.validate import Email
 
 from ..models import User
+from ..services import token_service
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -24,4 +25,10 @@ def login():
     user = User.query.filter_by(email=email).first()
     if not user or not check_password_hash(user.password_hash, password):
         return jsonify({'error': gettext('Invalid credentials')}), 401
-    return jsonify({'seat': user.seat, 'is_admin': user.is_admin})
+    return jsonify({
+        'seat': user.seat,
+        'is_admin': user.is_admin,
+        'token': token_service.issue(user),
+        'token_type': 'Bearer',
+        'expires_in': current_app.config.get('AUTH_TOKEN_TTL', 3600),
+    })
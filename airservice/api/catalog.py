@@ -1,21 +1,162 @@
-from flask import Blueprint, jsonify, request, url_for
+from flask import Blueprint, jsonify, request, current_app
+from flask_babel import gettext
+from sqlalchemy.orm import aliased
 
-from ..models import Item, Category
+from ..models import db, Item, Category, CategoryClosure
+from ..services import catalog_service, changes_service, image_service, search_service
 
 catalog_bp = Blueprint('catalog', __name__)
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _flag(name):
+    value = request.args.get(name)
+    if value == '1':
+        return True
+    if value == '0':
+        return False
+    return None
+
+
+def _catalog_filters():
+    return {
+        'category': request.args.get('category', type=int),
+        'price_min': request.args.get('price_min', type=float),
+        'price_max': request.args.get('price_max', type=float),
+        'available': _flag('available'),
+        'service': _flag('service'),
+        'q': request.args.get('q') or None,
+    }
+
+
+def _apply_filters(qs, filters):
+    """Apply catalog ``filters`` to an item query.
+
+    Returns the query and, for text searches, the matching ids ranked by
+    relevance.
+    """
+    ranked_ids = None
+    if filters['category'] is not None:
+        subtree = aliased(CategoryClosure)
+        qs = qs.join(subtree, subtree.descendant_id == Item.category_id) \
+            .filter(subtree.ancestor_id == filters['category'])
+    if filters['price_min'] is not None:
+        qs = qs.filter(Item.price >= filters['price_min'])
+    if filters['price_max'] is not None:
+        qs = qs.filter(Item.price <= filters['price_max'])
+    if filters['available'] is not None:
+        qs = qs.filter(Item.available.is_(filters['available']))
+    if filters['service'] is not None:
+        qs = qs.filter(Item.is_service.is_(filters['service']))
+    if filters['q']:
+        ranked_ids = search_service.search_item_ids(filters['q'])
+        qs = qs.filter(Item.id.in_(ranked_ids))
+    return qs, ranked_ids
+
+
+def _page_params(filters):
+    """Parse ``sort``, ``cursor`` and ``limit``; raise ``ValueError`` if invalid."""
+    sort = request.args.get('sort')
+    descending = False
+    if sort:
+        descending = sort.startswith('-')
+        sort = sort[1:] if descending else sort
+        if sort not in catalog_service.SORT_KEYS or (sort == 'relevance' and not filters['q']):
+            raise ValueError(gettext('Invalid sort'))
+    else:
+        sort = 'relevance' if filters['q'] else 'id'
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_sort, cursor_desc, after = catalog_service.decode_cursor(cursor)
+        except ValueError:
+            raise ValueError(gettext('Invalid cursor'))
+        if (cursor_sort, cursor_desc) != (sort, descending):
+            raise ValueError(gettext('Invalid cursor'))
+    limit = request.args.get('limit', type=int)
+    if limit is not None or cursor:
+        limit = min(max(limit or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    return sort, descending, after, limit
+
+
+def _next_cursor(sort, descending, page):
+    if page.next_key is None:
+        return None
+    return catalog_service.encode_cursor(sort, descending, page.next_key)
+
+
+def _conditional(lang, render):
+    """Answer with 304 when the client already holds the current revision.
+
+    The entity tag is computed before ``render`` runs, so a matching
+    ``If-None-Match`` costs only the revision read. Errors are neither
+    tagged nor cacheable.
+    """
+    # the raw ``lang`` argument is left out: ``lang`` is the locale it resolved to
+    args = sorted((k, v) for k, v in request.args.items(multi=True) if k != 'lang')
+    tag = catalog_service.etag(request.path, lang, args)
+    if request.if_none_match.contains(tag):
+        rv = current_app.response_class(status=304)
+    else:
+        rv = render()
+        if not 200 <= rv.status_code < 300:
+            return rv
+    rv.set_etag(tag)
+    rv.cache_control.public = True
+    rv.cache_control.max_age = current_app.config.get('CATALOG_CACHE_MAX_AGE', 0)
+    rv.cache_control.must_revalidate = True
+    rv.vary.add('Accept-Language')
+    return rv
+
 
 @catalog_bp.route('/catalog')
 def catalog():
     """List items available for order.
 
     ---
+    definitions:
+      CatalogItem:
+        type: object
+        properties:
+          id:
+            type: integer
+          name:
+            type: string
+          description:
+            type: string
+          image:
+            type: string
+            description: URL of the card-sized image
+          images:
+            type: object
+            nullable: true
+            description: Image URLs by size
+            properties:
+              thumb:
+                type: string
+              card:
+                type: string
+              detail:
+                type: string
+          price:
+            type: number
+          available:
+            type: boolean
+          service:
+            type: boolean
+          category:
+            type: string
+          category_id:
+            type: integer
     parameters:
       - in: query
         name: category
         schema:
           type: integer
-        description: Filter by category id
+        description: Filter by category id, including all of its subcategories
       - in: query
         name: price_min
         schema:
@@ -42,88 +183,330 @@ def catalog():
         name: q
         schema:
           type: string
-        description: Search string
+        description: Full-text search over names and descriptions; results are ordered by relevance
       - in: query
         name: lang
         schema:
           type: string
           enum: [ru, en]
         description: Localisation language
+      - in: query
+        name: sort
+        schema:
+          type: string
+          enum: [id, price, name, relevance, -id, -price, -name, -relevance]
+        description: >
+          Sort key, prefix with '-' for descending order. Defaults to
+          relevance when q is given and to id otherwise
+      - in: query
+        name: limit
+        schema:
+          type: integer
+          minimum: 1
+          maximum: 200
+        description: Page size; when given the response is a page object
+      - in: query
+        name: cursor
+        schema:
+          type: string
+        description: Opaque next_cursor from the previous page (same sort)
     responses:
       200:
-        description: List of catalog items
+        description: >
+          List of catalog items, or a page object with items and
+          next_cursor when limit or cursor is given
         content:
           application/json:
             schema:
-              type: array
-              items:
-                type: object
-                properties:
-                  id:
-                    type: integer
-                  name:
-                    type: string
-                  description:
-                    type: string
-                  image:
-                    type: string
-                  price:
-                    type: number
-                  available:
-                    type: boolean
-                  service:
-                    type: boolean
-                  category:
-                    type: string
-                  category_id:
-                    type: integer
+              oneOf:
+                - type: array
+                  items:
+                    $ref: '#/definitions/CatalogItem'
+                - type: object
+                  properties:
+                    items:
+                      type: array
+                      items:
+                        $ref: '#/definitions/CatalogItem'
+                    next_cursor:
+                      type: string
+                      nullable: true
+                      description: Cursor of the next page, null on the last page
+      400:
+        description: Invalid sort or cursor
+      304:
+        description: Catalog unchanged since the revision in If-None-Match
     """
-    qs = Item.query
-    category = request.args.get('category')
-    if category:
-        qs = qs.join(Category).filter(Category.id == category)
-    price_min = request.args.get('price_min', type=float)
-    price_max = request.args.get('price_max', type=float)
-    if price_min is not None:
-        qs = qs.filter(Item.price >= price_min)
-    if price_max is not None:
-        qs = qs.filter(Item.price <= price_max)
-    if request.args.get('available') == '1':
-        qs = qs.filter(Item.available.is_(True))
-    elif request.args.get('available') == '0':
-        qs = qs.filter(Item.available.is_(False))
-    if request.args.get('service') == '1':
-        qs = qs.filter(Item.is_service.is_(True))
-    elif request.args.get('service') == '0':
-        qs = qs.filter(Item.is_service.is_(False))
-    query = request.args.get('q')
-    if query:
-        like = f"%{query}%"
-        qs = qs.filter(
-            Item.name_ru.ilike(like) |
-            Item.name_en.ilike(like) |
-            Item.description_ru.ilike(like) |
-            Item.description_en.ilike(like)
+    lang = request.args.get('lang') or request.accept_languages.best_match(['ru', 'en']) or 'ru'
+    lang_item = 'en' if lang == 'en' else 'ru'
+    return _conditional(lang_item, lambda: _catalog_response(lang_item))
+
+
+def _catalog_response(lang_item):
+    filters = _catalog_filters()
+    try:
+        sort, descending, after, limit = _page_params(filters)
+    except ValueError as err:
+        rv = jsonify({'error': str(err)})
+        rv.status_code = 400
+        return rv
+    paginated = limit is not None
+    if current_app.config.get('CATALOG_SNAPSHOT'):
+        if not paginated and sort == 'id' and not descending:
+            body = catalog_service.render(lang_item, filters)
+        else:
+            page = catalog_service.select(
+                lang_item, filters, sort=sort, descending=descending, after=after, limit=limit,
+            )
+            body = b'[' + b','.join(r.encoded for r in page.rows) + b']'
+            if paginated:
+                next_cursor = _next_cursor(sort, descending, page)
+                body = (b'{"items":' + body + b',"next_cursor":'
+                        + current_app.json.dumps(next_cursor).encode() + b'}')
+        return current_app.response_class(body, mimetype='application/json')
+
+    name_col = Item.name_en if lang_item == 'en' else Item.name_ru
+    qs, ranked_ids = _apply_filters(catalog_service.catalog_query(), filters)
+
+    if sort == 'relevance':
+        rank = {item_id: n for n, item_id in enumerate(ranked_ids)}
+        rows = sorted(qs.all(), key=lambda r: rank[r.id])
+        page = catalog_service.paginate(
+            rows, [(rank[r.id], r.id) for r in rows], lambda r: True,
+            descending=descending, after=after, limit=limit,
         )
-    items = qs.all()
+    else:
+        col = {
+            'id': Item.id,
+            'price': Item.price,
+            'name': db.func.coalesce(name_col, ''),
+        }[sort]
+        if after is not None:
+            value, last_id = after
+            if descending:
+                qs = qs.filter((col < value) | ((col == value) & (Item.id < last_id)))
+            else:
+                qs = qs.filter((col > value) | ((col == value) & (Item.id > last_id)))
+        if descending:
+            qs = qs.order_by(col.desc(), Item.id.desc())
+        else:
+            qs = qs.order_by(col, Item.id)
+        if limit is not None:
+            qs = qs.limit(limit + 1)
+        rows = qs.all()
+        next_key = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            value = {
+                'id': last.id,
+                'price': last.price,
+                'name': (last.name_en if lang_item == 'en' else last.name_ru) or '',
+            }[sort]
+            next_key = (value, last.id)
+        page = catalog_service.Page(rows, next_key)
+
+    items = [catalog_service.project(r, lang_item) for r in page.rows]
+    if not paginated:
+        return jsonify(items)
+    return jsonify({'items': items, 'next_cursor': _next_cursor(sort, descending, page)})
+
+
+@catalog_bp.route('/catalog/facets')
+def catalog_facets():
+    """Count the items matching the catalog filters by facet.
+
+    Accepts the same filters as ``/catalog``. Category counts include items of
+    all subcategories; categories without matches are omitted.
+    ---
+    parameters:
+      - in: query
+        name: category
+        schema:
+          type: integer
+      - in: query
+        name: price_min
+        schema:
+          type: number
+      - in: query
+        name: price_max
+        schema:
+          type: number
+      - in: query
+        name: available
+        schema:
+          type: integer
+          enum: [0, 1]
+      - in: query
+        name: service
+        schema:
+          type: integer
+          enum: [0, 1]
+      - in: query
+        name: q
+        schema:
+          type: string
+    responses:
+      200:
+        description: Facet counts
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                total:
+                  type: integer
+                categories:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      id:
+                        type: integer
+                      count:
+                        type: integer
+                service:
+                  type: object
+                  properties:
+                    goods:
+                      type: integer
+                    services:
+                      type: integer
+                available:
+                  type: object
+                  properties:
+                    available:
+                      type: integer
+                    unavailable:
+                      type: integer
+                price:
+                  type: array
+                  description: Price histogram; max is null for the last bucket
+                  items:
+                    type: object
+                    properties:
+                      min:
+                        type: number
+                      max:
+                        type: number
+                        nullable: true
+                      count:
+                        type: integer
+      304:
+        description: Catalog unchanged since the revision in If-None-Match
+    """
     lang = request.args.get('lang') or request.accept_languages.best_match(['ru', 'en']) or 'ru'
-    data = []
-    for i in items:
-        lang_item = 'en' if lang == 'en' else 'ru'
-        name = i.name_en if lang_item == 'en' else i.name_ru
-        desc = i.description_en if lang_item == 'en' else i.description_ru
-        data.append({
-            'id': i.id,
-            'name': name,
-            'description': desc,
-            'image': url_for('serve_image', filename=i.image) if i.image else None,
-            'price': i.price,
-            'available': i.available,
-            'service': i.is_service,
-            'category': i.category.name_en if lang_item == 'en' else (i.category.name_ru if i.category else None),
-            'category_id': i.category.id if i.category else None,
-        })
-    return jsonify(data)
+    lang_item = 'en' if lang == 'en' else 'ru'
+    return _conditional(lang_item, lambda: _facets_response(lang_item))
+
+
+def _facets_response(lang_item):
+    filters = _catalog_filters()
+    if current_app.config.get('CATALOG_SNAPSHOT'):
+        body = catalog_service.facets(lang_item, filters)
+        return current_app.response_class(body, mimetype='application/json')
+
+    # one grouped query: rows with depth 0 (or no category) give the totals,
+    # every closure row adds the item to one of its ancestor categories
+    edges = catalog_service.price_buckets()
+    bucket = db.case(
+        *((Item.price >= edge, n) for n, edge in reversed(list(enumerate(edges, 1)))),
+        else_=0,
+    ) if edges else db.literal(0)
+    ancestor = aliased(CategoryClosure)
+    qs = db.session.query(
+        ancestor.ancestor_id, ancestor.depth, Item.is_service, Item.available,
+        bucket.label('bucket'), db.func.count(Item.id),
+    ).select_from(Item).outerjoin(ancestor, ancestor.descendant_id == Item.category_id)
+    qs, _ = _apply_filters(qs, filters)
+    qs = qs.group_by(ancestor.ancestor_id, ancestor.depth, Item.is_service,
+                     Item.available, bucket)
+
+    total = services = available = 0
+    buckets = [0] * (len(edges) + 1)
+    categories = {}
+    for ancestor_id, depth, is_service, is_available, n, count in qs:
+        if ancestor_id is not None:
+            categories[ancestor_id] = categories.get(ancestor_id, 0) + count
+        if depth is None or depth == 0:
+            total += count
+            services += count if is_service else 0
+            available += count if is_available else 0
+            buckets[n] += count
+    return jsonify(catalog_service.facet_payload(total, services, available, buckets, categories))
+
+
+@catalog_bp.route('/catalog/changes')
+def catalog_changes():
+    """Return catalog rows changed since a revision.
+
+    Clients keep a local copy of the catalog and pass the ``revision`` of
+    their last sync as ``since``.
+    ---
+    parameters:
+      - in: query
+        name: since
+        schema:
+          type: integer
+        description: Revision of the last sync; omit for a full download
+      - in: query
+        name: lang
+        schema:
+          type: string
+          enum: [ru, en]
+        description: Localisation language
+    responses:
+      200:
+        description: Changed and deleted rows
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                revision:
+                  type: integer
+                  description: Pass as since on the next sync
+                reset:
+                  type: boolean
+                  description: The response holds the whole catalog; drop the local copy
+                items:
+                  type: array
+                  items:
+                    $ref: '#/definitions/CatalogItem'
+                categories:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      id:
+                        type: integer
+                      name:
+                        type: string
+                      image:
+                        type: string
+                      parent_id:
+                        type: integer
+                        nullable: true
+                deleted:
+                  type: object
+                  properties:
+                    items:
+                      type: array
+                      items:
+                        type: integer
+                    categories:
+                      type: array
+                      items:
+                        type: integer
+      304:
+        description: Catalog unchanged since the revision in If-None-Match
+    """
+    lang = request.args.get('lang') or request.accept_languages.best_match(['ru', 'en']) or 'ru'
+    lang_item = 'en' if lang == 'en' else 'ru'
+    since = request.args.get('since', type=int)
+    return _conditional(lang_item, lambda: jsonify(
+        changes_service.changes(since, lang_item)._asdict()
+    ))
 
 
 @catalog_bp.route('/catalog/categories')
@@ -147,6 +530,10 @@ def catalog_categories():
                     type: string
                   image:
                     type: string
+                  images:
+                    type: object
+                    nullable: true
+                    description: Image URLs by size (thumb, card, detail)
                   children:
                     type: array
                     items:
@@ -161,14 +548,22 @@ def catalog_categories():
                         children:
                           type: array
                           items: {}
+      304:
+        description: Categories unchanged since the revision in If-None-Match
     """
     lang = request.args.get('lang') or request.accept_languages.best_match(['ru', 'en']) or 'ru'
+    lang_cat = 'ru' if lang == 'ru' else 'en'
+    return _conditional(lang_cat, lambda: _categories_response(lang_cat))
+
+
+def _categories_response(lang_cat):
     cats = Category.query.order_by(Category.id).all()
     nodes = {
         c.id: {
             'id': c.id,
-            'name': c.name_en if lang != 'ru' else c.name_ru,
-            'image': url_for('serve_image', filename=c.image) if c.image else None,
+            'name': c.name_en if lang_cat == 'en' else c.name_ru,
+            'image': image_service.image_url(c.image),
+            'images': image_service.image_urls(c.image),
             'children': [],
         }
         for c in cats
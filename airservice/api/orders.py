@@ -1,15 +1,19 @@
-from flask import Blueprint, jsonify, request, abort
+from flask import Blueprint, jsonify, request, abort, current_app
 import logging
 from flask_babel import gettext
 from marshmallow import ValidationError
 
-from ..schemas import OrderSchema
-from ..services import order_service
-from ..models import Order, User
+from ..schemas import OrderSchema, OrderBatchSchema, OrderBatchEntrySchema
+from ..services import idempotency, order_service, order_writer, token_service
+from ..models import db, Order, User
+from .admin import auth_required
 from werkzeug.security import check_password_hash
 
 orders_bp = Blueprint('orders', __name__)
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
 
 @orders_bp.route('/orders', methods=['POST'])
 def create_order():
@@ -55,30 +59,167 @@ def create_order():
         return jsonify({'error': gettext('Invalid payload'), 'details': err.messages}), 400
 
     auth = request.authorization
-    user = None
-    if auth:
+    seat = payload.get('seat')
+    if auth and auth.type == 'bearer':
+        claims = token_service.bearer_claims()
+        if claims is None:
+            abort(401)
+        seat = claims.seat
+    elif auth:
         user = User.query.filter_by(email=auth.username).first()
         if not user or not check_password_hash(user.password_hash, auth.password):
             abort(401)
+        seat = user.seat
 
-    seat = user.seat if user else payload.get('seat')
     if not seat:
         return jsonify({'error': gettext('Seat is required')}), 400
 
     items = payload['items']
     payment_method = payload.get('payment_method')
     idem_key = request.headers.get('Idempotency-Key')
+    owned = False
+    if idem_key:
+        store = idempotency.get_store()
+        order_id, owned = store.claim(idem_key)
+        if order_id is not None:
+            return jsonify({'order_id': order_id}), 200
     try:
-        order, created = order_service.create_order(
-            seat,
-            items,
-            payment_method=payment_method,
-            idempotency_key=idem_key,
-        )
+        if current_app.config.get('ORDER_GROUP_COMMIT'):
+            order_id, created = _group_commit(seat, items, payment_method, idem_key)
+        else:
+            order, created = order_service.create_order(
+                seat,
+                items,
+                payment_method=payment_method,
+                idempotency_key=idem_key,
+            )
+            order_id = order.id
     except ValueError as err:
+        if owned:
+            store.release(idem_key)
         return jsonify({'error': str(err)}), 400
+    except Exception:
+        if owned:
+            store.release(idem_key)
+        raise
+    if owned:
+        store.complete(idem_key, order_id)
     status_code = 201 if created else 200
-    return jsonify({'order_id': order.id}), status_code
+    return jsonify({'order_id': order_id}), status_code
+
+
+def _group_commit(seat, items, payment_method, idem_key):
+    """Validate the order here and let the writer thread store it."""
+    if idem_key:
+        existing = db.session.scalar(db.select(Order.id).filter_by(idempotency_key=idem_key))
+        if existing:
+            return existing, False
+    lines = order_service.price_lines(items)
+    # release the connection before waiting on the writer
+    db.session.close()
+    return order_writer.submit(order_service.NewOrder(
+        seat, lines, payment_method, idem_key,
+    ))
+
+
+@orders_bp.route('/orders/batch', methods=['POST'])
+def create_orders_batch():
+    """Create many orders at once, e.g. a row taken by cabin crew.
+
+    Requires admin credentials. Entries are stored in one transaction and
+    announced with a single ``orders_created`` event; an invalid entry is
+    reported in its result without failing the others.
+    ---
+    requestBody:
+      required: true
+      content:
+        application/json:
+          schema:
+            type: object
+            properties:
+              orders:
+                type: array
+                items:
+                  type: object
+                  properties:
+                    seat:
+                      type: string
+                    items:
+                      type: array
+                      items:
+                        type: object
+                        properties:
+                          item_id:
+                            type: integer
+                          quantity:
+                            type: integer
+                    payment_method:
+                      type: string
+                    idempotency_key:
+                      type: string
+    responses:
+      200:
+        description: One result per entry, in request order
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                results:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      order_id:
+                        type: integer
+                      status:
+                        type: string
+                        enum: [created, existing]
+                      error:
+                        type: string
+      400:
+        description: Invalid payload
+      401:
+        description: Unauthorized
+    """
+    auth_required()
+    try:
+        entries = OrderBatchSchema().load(request.get_json() or {})['orders']
+    except ValidationError as err:
+        return jsonify({'error': gettext('Invalid payload'), 'details': err.messages}), 400
+
+    results = [None] * len(entries)
+    loaded = {}
+    schema = OrderBatchEntrySchema()
+    for n, entry in enumerate(entries):
+        try:
+            loaded[n] = schema.load(entry if isinstance(entry, dict) else {})
+        except ValidationError as err:
+            results[n] = {'error': gettext('Invalid payload'), 'details': err.messages}
+
+    prices = order_service.item_prices(
+        it['item_id'] for entry in loaded.values() for it in entry['items']
+    )
+    pending = {}
+    for n, entry in loaded.items():
+        try:
+            lines = order_service.price_lines(entry['items'], prices)
+        except ValueError as err:
+            results[n] = {'error': str(err)}
+            continue
+        pending[n] = order_service.NewOrder(
+            entry['seat'], lines, entry.get('payment_method'), entry.get('idempotency_key'),
+        )
+
+    if pending:
+        stored = order_service.create_orders(list(pending.values()), coalesce_events=True)
+        for n, result in zip(pending, stored):
+            if isinstance(result, ValueError):
+                results[n] = {'error': str(result)}
+                continue
+            order_id, created = result
+            results[n] = {'order_id': order_id, 'status': 'created' if created else 'existing'}
+    return jsonify({'results': results})
 
 
 @orders_bp.route('/orders/<int:order_id>')
@@ -119,60 +260,90 @@ def get_order(order_id):
       404:
         description: Order not found
     """
-    order = order_service.get_order(order_id)
+    order = order_service.get_order_view(order_id)
     if not order:
         abort(404)
     lang = request.args.get('lang') or request.accept_languages.best_match(['ru', 'en']) or 'ru'
+    return jsonify(_order_json(order, lang))
+
+
+def _order_json(order, lang):
     items = [
         {
-            'item_id': oi.item.id,
-            'name': oi.item.name_en if lang == 'en' else oi.item.name_ru,
-            'price': oi.item.price,
-            'quantity': oi.quantity,
+            'item_id': line.item_id,
+            'name': line.name_en if lang == 'en' else line.name_ru,
+            'price': line.price,
+            'quantity': line.quantity,
         }
-        for oi in order.items
+        for line in order.lines
     ]
-    total = sum(i['price'] * i['quantity'] for i in items)
-    return jsonify({
+    return {
         'id': order.id,
         'seat': order.seat,
         'status': order.status,
         'items': items,
-        'total': total,
+        'total': order.total,
+        'item_count': order.item_count,
         'created_at': order.created_at.isoformat(),
-    })
+    }
 
 
 @orders_bp.get('/orders')
 def list_orders():
-    """List orders for the specified seat with optional status filter."""
+    """List orders for the specified seat with optional status filter.
+
+    ---
+    parameters:
+      - in: query
+        name: seat
+        schema:
+          type: string
+        required: true
+      - in: query
+        name: status
+        schema:
+          type: string
+      - in: query
+        name: limit
+        schema:
+          type: integer
+          minimum: 1
+          maximum: 200
+        description: Page size; when given the response is a page object
+      - in: query
+        name: cursor
+        schema:
+          type: string
+        description: Opaque next_cursor from the previous page
+    responses:
+      200:
+        description: >
+          Orders oldest first, or a page object with items and next_cursor
+          when limit or cursor is given
+      400:
+        description: Missing seat or invalid cursor
+    """
     seat = request.args.get('seat')
     if not seat:
         return jsonify({'error': gettext('Seat is required')}), 400
-    qs = Order.query.filter(Order.seat == seat)
-    status_f = request.args.get('status')
-    if status_f:
-        qs = qs.filter(Order.status == status_f)
-    orders = qs.order_by(Order.created_at).all()
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after = order_service.decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': gettext('Invalid cursor')}), 400
+    limit = request.args.get('limit', type=int)
+    if limit is not None or cursor:
+        limit = min(max(limit or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    orders, next_key = order_service.history_page(
+        seat, request.args.get('status'), after=after, limit=limit,
+    )
     lang = request.args.get('lang') or request.accept_languages.best_match(['ru', 'en']) or 'ru'
-    response = []
-    for o in orders:
-        items = [
-            {
-                'item_id': i.item.id,
-                'name': i.item.name_en if lang == 'en' else i.item.name_ru,
-                'price': i.item.price,
-                'quantity': i.quantity,
-            }
-            for i in o.items
-        ]
-        total = sum(it['price'] * it['quantity'] for it in items)
-        response.append({
-            'id': o.id,
-            'seat': o.seat,
-            'status': o.status,
-            'items': items,
-            'total': total,
-            'created_at': o.created_at.isoformat(),
-        })
-    return jsonify(response)
+    items = [_order_json(o, lang) for o in orders]
+    if limit is None:
+        return jsonify(items)
+    return jsonify({
+        'items': items,
+        'next_cursor': order_service.encode_cursor(next_key) if next_key else None,
+    })
@@ -1,10 +1,11 @@
-from flask import Flask, request, g, has_request_context, send_from_directory
+from flask import Flask, request, g, has_request_context, send_from_directory, send_file, abort, redirect
 from flask.cli import with_appcontext
+import click
 from flask import current_app
 import logging
 import os
-from datetime import datetime, timezone
-from pythonjsonlogger import json
+import secrets
+import warnings
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_babel import Babel
@@ -14,6 +15,8 @@ from flask_cors import CORS
 
 from .config import DevConfig
 from .models import db
+from . import sqlite_profile
+from .services import log_store, log_writer, token_service
 from .api.catalog import catalog_bp
 from .api.orders import orders_bp
 from .api.admin import admin_bp
@@ -33,6 +36,19 @@ def create_app(config_object=None):
         cfg = config_object() if isinstance(config_object, type) else config_object
         app.config.from_object(cfg)
 
+    if not app.config.get('SECRET_KEY'):
+        if not (app.debug or app.testing):
+            raise RuntimeError('SECRET_KEY must be set; tokens signed with a per-process key '
+                               'are rejected by other workers and after a restart')
+        app.config['SECRET_KEY'] = secrets.token_hex(32)
+        if not app.testing:
+            warnings.warn('SECRET_KEY is not set; using a random key, so login tokens are only '
+                          'valid in this process until it restarts', RuntimeWarning, stacklevel=2)
+
+    if app.config.get('CATALOG_FILTER_ENGINE') == 'numpy':
+        from .services.columnar import require_numpy
+        require_numpy()
+
     CORS(app, origins=os.getenv("FRONTEND_ORIGIN", "*"))
 
     class RequestFilter(logging.Filter):
@@ -43,22 +59,42 @@ def create_app(config_object=None):
             else:
                 record.user = 'system'
                 record.endpoint = ''
-            record.timestamp = datetime.now(timezone.utc).isoformat()
             return True
 
-    handler = logging.FileHandler('airservice.log')
-    formatter = json.JsonFormatter('%(timestamp)s %(user)s %(endpoint)s %(message)s')
-    handler.setFormatter(formatter)
+    store = log_store.LogStore(
+        app.config['LOG_DIR'], app.config['LOG_SEGMENT_SECONDS'], app.config['LOG_SEGMENT_MAX_BYTES'],
+    )
+    app.extensions['log_store'] = store
+    if app.config['LOG_ASYNC']:
+        handler = log_writer.LogQueueHandler(
+            store, app.config['LOG_QUEUE_SIZE'], app.config['LOG_QUEUE_OVERFLOW'], app.config['LOG_BATCH_SIZE'],
+            app.config['LOG_FLUSH_INTERVAL_MS'] / 1000,
+        )
+    else:
+        handler = log_store.SegmentedLogHandler(store)
+    # request context is only available on the request thread
     handler.addFilter(RequestFilter())
 
     logger = logging.getLogger()
+    for old in logger.handlers:
+        old.close()
     logger.handlers = []
     logger.addHandler(handler)
     logger.setLevel(logging.INFO)
 
     @app.before_request
     def set_log_context():
-        user = request.authorization.username if request.authorization else 'guest'
+        auth = request.authorization
+        if auth is None:
+            user = 'guest'
+        elif auth.type == 'bearer':
+            claims = token_service.bearer_claims()
+            if claims is None:
+                user = 'guest'
+            else:
+                user = 'admin' if claims.is_admin else f'seat:{claims.seat}'
+        else:
+            user = auth.username
         g.log_user = user
         g.log_endpoint = request.path
 
@@ -78,7 +114,9 @@ def create_app(config_object=None):
     Babel(app, locale_selector=get_locale)
     Swagger(app)
 
+    sqlite_profile.configure_engine_options(app)
     db.init_app(app)
+    sqlite_profile.install_pragmas(app)
     Migrate(app, db)
 
     app.register_blueprint(catalog_bp)
@@ -94,6 +132,51 @@ def create_app(config_object=None):
         from .sample_data import load_demo_data
         load_demo_data(current_app)
 
+    @app.cli.command('rebuild-search-index')
+    @with_appcontext
+    def rebuild_search_index():
+        """Re-index all items for full-text catalog search."""
+        from .services import search_service
+        count = search_service.rebuild_index()
+        db.session.commit()
+        print(f'Indexed {count} items')
+
+    @app.cli.command('rebuild-category-closure')
+    @with_appcontext
+    def rebuild_category_closure():
+        """Recompute the category closure table from parent links."""
+        from .services import category_service
+        count = category_service.rebuild_closure()
+        db.session.commit()
+        print(f'Stored {count} category paths')
+
+    @app.cli.command('rebuild-sales-rollup')
+    @with_appcontext
+    def rebuild_sales_rollup():
+        """Recompute the monthly sales rollup from stored orders."""
+        from .services import sales_service
+        count = sales_service.rebuild()
+        db.session.commit()
+        print(f'Stored {count} rollup rows')
+
+    @app.cli.command('import-logs')
+    @click.argument('path', default='airservice.log')
+    @with_appcontext
+    def import_logs(path):
+        """Copy a single-file JSON log into the searchable log segments."""
+        store = log_store.get_store()
+        count = store.import_file(path)
+        store.close()
+        print(f'Imported {count} log entries')
+
+    @app.cli.command('build-image-derivatives')
+    @with_appcontext
+    def build_image_derivatives():
+        """Generate missing resized WebP copies of all images."""
+        from .services import image_service
+        count = image_service.build_all()
+        print(f'Generated {count} image derivatives')
+
     @app.route('/')
     def index():
         return app.send_static_file('index.html')
@@ -102,6 +185,25 @@ def create_app(config_object=None):
     def serve_image(filename):
         return send_from_directory(os.path.join(app.root_path, 'static', 'images'), filename)
 
+    @app.route('/img/<variant>/<digest>/<path:filename>')
+    def serve_image_variant(variant, digest, filename):
+        from .services import image_service
+        if variant not in image_service.VARIANTS or not image_service.enabled():
+            abort(404)
+        path = image_service.derivative_path(variant, digest)
+        if not os.path.exists(path):
+            source = image_service.source_path(filename)
+            if source is None:
+                abort(404)
+            if image_service.digest(source, variant) != digest:
+                # the source changed since this URL was issued
+                return redirect(image_service.image_url(filename, variant))
+            path = image_service.generate(source, variant)
+        rv = send_file(path, mimetype='image/webp', max_age=31536000, conditional=True)
+        rv.cache_control.public = True
+        rv.cache_control.immutable = True
+        return rv
+
     return app
 
 
@@ -8,14 +8,69 @@ class BaseConfig:
     def __init__(self):
         self.SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///airservice.db")
         self.SQLALCHEMY_TRACK_MODIFICATIONS = False
+        # "production": WAL and tuned pragmas for SQLite files; "default": driver defaults
+        self.SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+        self.SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+        self.SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+        self.SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+        self.SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "16"))
+        # how often a write is retried after "database is locked"
+        self.SQLITE_BUSY_RETRIES = int(os.getenv("SQLITE_BUSY_RETRIES", "3"))
         self.ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
         pwd_hash = os.getenv("ADMIN_PASSWORD_HASH")
         if not pwd_hash:
             pwd_hash = generate_password_hash(os.getenv("ADMIN_PASSWORD", "admin"))
         self.ADMIN_PASSWORD_HASH = pwd_hash
+        # remember successful admin Basic logins instead of re-hashing ("0" disables)
+        self.ADMIN_AUTH_CACHE_TTL = int(os.getenv("ADMIN_AUTH_CACHE_TTL", "300"))
+        self.ADMIN_AUTH_CACHE_SIZE = int(os.getenv("ADMIN_AUTH_CACHE_SIZE", "64"))
+        # signs bearer tokens; must be shared by all processes (create_app
+        # only generates one for debug and testing)
+        self.SECRET_KEY = os.getenv("SECRET_KEY")
+        self.AUTH_TOKEN_TTL = int(os.getenv("AUTH_TOKEN_TTL", "3600"))
+        # server log segments searched by /admin/logs: one per period, rotated by size
+        self.LOG_DIR = os.getenv("LOG_DIR", "logs")
+        self.LOG_SEGMENT_SECONDS = int(os.getenv("LOG_SEGMENT_SECONDS", "3600"))
+        self.LOG_SEGMENT_MAX_BYTES = int(os.getenv("LOG_SEGMENT_MAX_BYTES", str(16 * 1024 * 1024)))
+        # write log records from a background thread; the queue is bounded and
+        # on overflow either drops records ("drop") or makes the caller wait ("block")
+        self.LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+        self.LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+        self.LOG_QUEUE_OVERFLOW = os.getenv("LOG_QUEUE_OVERFLOW", "drop")
+        self.LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "512"))
+        self.LOG_FLUSH_INTERVAL_MS = float(os.getenv("LOG_FLUSH_INTERVAL_MS", "50"))
         self.BABEL_DEFAULT_LOCALE = os.getenv("BABEL_DEFAULT_LOCALE", "ru")
         self.API_RATE_LIMIT = os.getenv("API_RATE_LIMIT", "10000 per hour")
         self.RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", "memory://")
+        # serve /catalog from an in-process snapshot invalidated on catalog writes
+        self.CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT", "1") == "1"
+        # seconds a process may trust its last read of the catalog revision;
+        # 0 reads it on every request, so writes of other workers show at once
+        self.CATALOG_REVISION_TTL = float(os.getenv("CATALOG_REVISION_TTL", "0"))
+        # how snapshot filters are evaluated: "python" row by row or "numpy" masks
+        self.CATALOG_FILTER_ENGINE = os.getenv("CATALOG_FILTER_ENGINE", "python")
+        # upper bounds of the /catalog/facets price histogram buckets
+        self.CATALOG_PRICE_BUCKETS = [
+            float(v) for v in os.getenv("CATALOG_PRICE_BUCKETS", "250,500,1000,2000").split(",") if v
+        ]
+        # link resized WebP derivatives instead of original images (needs Pillow)
+        self.IMAGE_DERIVATIVES = os.getenv("IMAGE_DERIVATIVES", "1") == "1"
+        # where derivatives are stored; defaults to <instance>/image-cache
+        self.IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR")
+        # hand POST /orders to a writer thread that commits orders in batches
+        self.ORDER_GROUP_COMMIT = os.getenv("ORDER_GROUP_COMMIT", "0") == "1"
+        # how long the writer collects orders before committing, and batch cap
+        self.ORDER_GROUP_COMMIT_WINDOW_MS = float(os.getenv("ORDER_GROUP_COMMIT_WINDOW_MS", "2"))
+        self.ORDER_GROUP_COMMIT_MAX_BATCH = int(os.getenv("ORDER_GROUP_COMMIT_MAX_BATCH", "100"))
+        self.REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        # where Idempotency-Key results are remembered: "memory" or "redis"
+        self.IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+        self.IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+        self.IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+        # seat rows per zone for /admin/reports/sales/cube, "name:first-last,..."
+        self.ANALYTICS_SEAT_ZONES = os.getenv("ANALYTICS_SEAT_ZONES", "business:1-4,premium:5-9,economy:10-99")
+        # max-age for catalog responses; clients revalidate with If-None-Match
+        self.CATALOG_CACHE_MAX_AGE = int(os.getenv("CATALOG_CACHE_MAX_AGE", "0"))
 
 
 class DevConfig(BaseConfig):
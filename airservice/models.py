@@ -1,5 +1,6 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
 
 # allowed order statuses
 ORDER_STATUSES = ['new', 'forming', 'done', 'cancelled']
@@ -21,8 +22,17 @@ class Category(db.Model):
     name_ru = db.Column(db.String(120), nullable=False)
     name_en = db.Column(db.String(120), nullable=False)
     image = db.Column(db.String(255))
-    parent_id = db.Column(db.Integer, db.ForeignKey('category.id'))
+    parent_id = db.Column(db.Integer, db.ForeignKey('category.id'), index=True)
     parent = db.relationship('Category', remote_side=[id])
+    # catalog revision of the last change, see CatalogRevision
+    revision = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+
+class CategoryClosure(db.Model):
+    """Ancestor/descendant pairs of the category tree, including self pairs."""
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('category.id'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('category.id'), primary_key=True, index=True)
+    depth = db.Column(db.Integer, nullable=False)
 
 
 class Item(db.Model):
@@ -35,31 +45,107 @@ class Item(db.Model):
     price = db.Column(db.Float, nullable=False)
     available = db.Column(db.Boolean, default=True)
     is_service = db.Column(db.Boolean, default=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), index=True)
     category = db.relationship('Category')
+    # catalog revision of the last change, see CatalogRevision
+    revision = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+
+class CatalogRevision(db.Model):
+    """Single-row counter numbering catalog write transactions.
+
+    Incrementing the row locks it until commit, so revisions become visible
+    in increasing order.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CatalogTombstone(db.Model):
+    """Revision at which a catalog row was deleted."""
+    kind = db.Column(db.String(20), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, index=True)
+
+
+# full-text search index over items, maintained by services.search_service
+ITEM_FTS_SQLITE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS item_fts USING fts5("
+    "name_ru, name_en, description_ru, description_en, "
+    "tokenize = 'porter unicode61')"
+)
+ITEM_SEARCH_VECTOR_POSTGRES = (
+    "ALTER TABLE item ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', coalesce(name_ru, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(name_en, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(description_ru, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description_en, '')), 'B')"
+    ") STORED"
+)
+ITEM_SEARCH_INDEX_POSTGRES = (
+    "CREATE INDEX IF NOT EXISTS ix_item_search_vector ON item USING GIN (search_vector)"
+)
+
+event.listen(Item.__table__, 'after_create', DDL(ITEM_FTS_SQLITE).execute_if(dialect='sqlite'))
+event.listen(Item.__table__, 'after_create', DDL(ITEM_SEARCH_VECTOR_POSTGRES).execute_if(dialect='postgresql'))
+event.listen(Item.__table__, 'after_create', DDL(ITEM_SEARCH_INDEX_POSTGRES).execute_if(dialect='postgresql'))
+event.listen(Item.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS item_fts').execute_if(dialect='sqlite'))
 
 
 class Order(db.Model):
+    # per-seat history in creation order; status filters are checked
+    # while walking the same index. The admin list filters by status and
+    # date range, the sales report by date range alone.
+    __table_args__ = (
+        db.Index('ix_order_seat_created_at', 'seat', 'created_at'),
+        db.Index('ix_order_status_created_at', 'status', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     seat = db.Column(db.String(10), nullable=False)
     idempotency_key = db.Column(db.String(64), unique=True)
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
     status = db.Column(db.String(20), default='new')
     payment_method = db.Column(db.String(20))
+    # set when the order is created from the prices of that moment
+    total = db.Column(db.Float)
+    item_count = db.Column(db.Integer)
 
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), index=True)
     order = db.relationship('Order', backref=db.backref('items', lazy=True))
-    item_id = db.Column(db.Integer, db.ForeignKey('item.id'))
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), index=True)
     item = db.relationship('Item')
+    # item price, kind and category at the time of the order; the price is
+    # also kept in hundredths, rounded once, for exact sales totals
+    unit_price = db.Column(db.Float)
+    unit_price_minor = db.Column(db.BigInteger)
+    is_service = db.Column(db.Boolean)
+    category_id = db.Column(db.Integer)
     quantity = db.Column(db.Integer, default=1)
 
 
+class SalesRollup(db.Model):
+    """Sales per month, kind and category, kept current by order_service.
+
+    ``period`` is ``year * 100 + month`` of the order's creation time and
+    ``category_id`` is 0 for items without a category. Cancelled orders are
+    not counted. ``total_minor`` is in hundredths of the currency unit, so
+    adding and subtracting orders never accumulates rounding error.
+    """
+    period = db.Column(db.Integer, primary_key=True)
+    is_service = db.Column(db.Boolean, primary_key=True)
+    category_id = db.Column(db.Integer, primary_key=True)
+    total_minor = db.Column(db.BigInteger, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+
 class OutgoingMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     payload = db.Column(db.Text, nullable=False)
     target = db.Column(db.String(120))
-    sent = db.Column(db.Boolean, default=False)
+    sent = db.Column(db.Boolean, default=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.now)
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 
 from .models import db, Category, Item, Order, OrderItem
+from .services import search_service, category_service, order_service
 
 
 def load_demo_data(app):
@@ -316,6 +317,9 @@ def load_demo_data(app):
                 in items_data
             ]
             db.session.add_all(items)
+            db.session.flush()
+            search_service.rebuild_index()
+            category_service.rebuild_closure()
             db.session.commit()
 
         if Order.query.first() is None:
@@ -350,4 +354,5 @@ def load_demo_data(app):
                 db.session.flush()
                 for name_ru, qty in items:
                     db.session.add(OrderItem(order_id=order.id, item_id=name_to_id[name_ru], quantity=qty))
+            order_service.backfill_totals()
             db.session.commit()
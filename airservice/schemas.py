@@ -9,6 +9,14 @@ class OrderSchema(Schema):
     items = fields.List(fields.Nested(OrderItemSchema), required=True)
     payment_method = fields.Str()
 
+class OrderBatchEntrySchema(OrderSchema):
+    seat = fields.Str(required=True)
+    idempotency_key = fields.Str(validate=validate.Length(max=64))
+
+class OrderBatchSchema(Schema):
+    # entries are validated one by one so a bad entry fails alone
+    orders = fields.List(fields.Raw(), required=True, validate=validate.Length(min=1, max=500))
+
 class ItemSchema(Schema):
     name_ru = fields.Str(required=True)
     name_en = fields.Str(required=True)
@@ -24,4 +32,4 @@ class CategorySchema(Schema):
     name_ru = fields.Str(required=True)
     name_en = fields.Str(required=True)
     image = fields.Str()
-    parent_id = fields.Int()
+    parent_id = fields.Int(allow_none=True)
@@ -0,0 +1,208 @@
+"""Multi-dimensional sales breakdowns computed with NumPy.
+
+``/admin/reports/sales/cube`` fetches the lines of all non-cancelled orders
+in the requested period in one query, streaming the result in partitions
+that are converted to column arrays as they arrive.
+Each dimension is factorised into integer codes, and the codes are combined
+into a single group key. Metrics are then summed per group with
+``np.bincount``, so grouping costs a few passes over the arrays rather than
+Python work per line. NumPy is listed in the requirements; on an install
+without it the endpoint answers 501.
+
+Seat zones come from the row number of the seat and ``ANALYTICS_SEAT_ZONES``
+(``name:first-last`` row ranges).
+"""
+import re
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+from sqlalchemy import Integer, cast, func, select
+
+from ..models import db, Category, Item, Order, OrderItem
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+DIMENSIONS = ('item', 'category', 'zone', 'hour', 'payment_method', 'month', 'kind')
+METRICS = ('revenue', 'quantity', 'lines', 'orders', 'avg_price')
+DEFAULT_ZONES = 'business:1-4,premium:5-9,economy:10-99'
+OTHER_ZONE = 'other'
+CANCELLED = 'cancelled'
+# rows converted to arrays at a time by fetch_lines
+FETCH_PARTITION = 10000
+
+
+def require_numpy() -> None:
+    if np is None:
+        raise RuntimeError('sales analytics require the numpy package')
+
+
+def parse_zones(spec: str) -> List[Tuple[str, int, int]]:
+    """``'business:1-4,economy:5-60'`` -> ``[('business', 1, 4), ('economy', 5, 60)]``."""
+    zones = []
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, rows = part.split(':')
+        first, last = rows.split('-')
+        zones.append((name, int(first), int(last)))
+    return zones
+
+
+def seat_zone(seat: str | None, zones: Sequence[Tuple[str, int, int]]) -> str:
+    match = re.match(r'\d+', seat or '')
+    if match:
+        row = int(match.group())
+        for name, first, last in zones:
+            if first <= row <= last:
+                return name
+    return OTHER_ZONE
+
+
+class SalesLines(NamedTuple):
+    """Column arrays of order lines, one element per line."""
+    order_id: Any
+    item_id: Any
+    category_id: Any
+    is_service: Any
+    revenue: Any
+    quantity: Any
+    hour: Any
+    month: Any
+    seat: Any
+    payment_method: Any
+
+
+def fetch_lines(start: datetime | None = None, end: datetime | None = None) -> SalesLines:
+    """Load the lines of non-cancelled orders created in ``[start, end)``."""
+    require_numpy()
+    hour = cast(func.extract('hour', Order.created_at), Integer)
+    month = cast(
+        func.extract('year', Order.created_at) * 100 + func.extract('month', Order.created_at), Integer,
+    )
+    # NULLs are replaced in SQL so every column converts to a typed array
+    qs = select(
+        OrderItem.order_id, OrderItem.item_id, func.coalesce(OrderItem.category_id, 0),
+        func.coalesce(OrderItem.is_service, False), OrderItem.unit_price, OrderItem.quantity,
+        hour, month, Order.seat, func.coalesce(Order.payment_method, ''),
+    ).join(Order, Order.id == OrderItem.order_id) \
+        .where(Order.status != CANCELLED, OrderItem.unit_price.is_not(None))
+    if start is not None:
+        qs = qs.where(Order.created_at >= start)
+    if end is not None:
+        qs = qs.where(Order.created_at < end)
+    dtypes = (np.int64, np.int64, np.int64, np.bool_, np.float64, np.int64, np.int64, np.int64, object, object)
+    chunks: List[List[Any]] = [[] for _ in dtypes]
+    result = db.session.execute(qs.execution_options(yield_per=FETCH_PARTITION))
+    for part in result.partitions():
+        # one array per column of the partition; the rows are dropped right after
+        for chunk, dtype, values in zip(chunks, dtypes, zip(*part)):
+            chunk.append(np.fromiter(values, dtype=dtype, count=len(part)))
+    (order_id, item_id, category_id, is_service, price, quantity,
+     hours, months, seat, payment) = (
+        np.concatenate(chunk) if chunk else np.empty(0, dtype=dtype) for chunk, dtype in zip(chunks, dtypes)
+    )
+    return SalesLines(
+        order_id, item_id, category_id, is_service, price * quantity, quantity, hours, months, seat, payment,
+    )
+
+
+def _factorize(lines: SalesLines, dim: str, zones) -> Tuple[Any, List[Any]]:
+    """Return integer codes per line and the value of each code."""
+    if dim == 'zone':
+        # zones are resolved once per distinct seat
+        seats, codes = np.unique(lines.seat, return_inverse=True)
+        names, zone_codes = np.unique(
+            np.array([seat_zone(s, zones) for s in seats], dtype=object), return_inverse=True,
+        )
+        return zone_codes.ravel()[codes.ravel()], names.tolist()
+    column = {
+        'item': lines.item_id,
+        'category': lines.category_id,
+        'hour': lines.hour,
+        'month': lines.month,
+        'kind': lines.is_service,
+        'payment_method': lines.payment_method,
+    }[dim]
+    values, codes = np.unique(column, return_inverse=True)
+    return codes.ravel(), values.tolist()
+
+
+def cube(lines: SalesLines, dims: Sequence[str], metrics: Sequence[str],
+         zones=()) -> Tuple[List[tuple], Dict[str, Any]]:
+    """Group ``lines`` by ``dims``.
+
+    Returns ``(keys, values)``: one tuple of dimension values per group and,
+    per metric, an array aligned with ``keys``.
+    """
+    require_numpy()
+    n = len(lines.order_id)
+    if dims:
+        codes, labels = zip(*(_factorize(lines, d, zones) for d in dims))
+        shape = tuple(max(len(v), 1) for v in labels)
+        key = np.ravel_multi_index(codes, shape) if n else np.empty(0, dtype=np.int64)
+        groups, inverse = np.unique(key, return_inverse=True)
+        inverse = inverse.ravel()
+        keys = [
+            tuple(labels[d][i] for d, i in enumerate(idx))
+            for idx in zip(*np.unravel_index(groups, shape))
+        ]
+    else:
+        inverse = np.zeros(n, dtype=np.int64)
+        keys = [()]
+    size = len(keys)
+    values: Dict[str, Any] = {}
+    for m in metrics:
+        if m == 'revenue':
+            values[m] = np.bincount(inverse, weights=lines.revenue, minlength=size)
+        elif m == 'quantity':
+            values[m] = np.bincount(inverse, weights=lines.quantity, minlength=size).astype(np.int64)
+        elif m == 'lines':
+            values[m] = np.bincount(inverse, minlength=size)
+        elif m == 'orders':
+            # distinct (group, order) pairs, counted per group
+            stride = int(lines.order_id.max(initial=0)) + 1
+            pairs = np.unique(inverse.astype(np.int64) * stride + lines.order_id)
+            values[m] = np.bincount(pairs // stride, minlength=size)
+        elif m == 'avg_price':
+            revenue = np.bincount(inverse, weights=lines.revenue, minlength=size)
+            quantity = np.bincount(inverse, weights=lines.quantity, minlength=size)
+            values[m] = np.divide(revenue, quantity, out=np.zeros(size), where=quantity > 0)
+    return keys, values
+
+
+def top(keys: List[tuple], values: Dict[str, Any], by: str, n: int | None) -> List[int]:
+    """Indexes of the groups with the largest ``by`` metric, largest first."""
+    order = np.argsort(-values[by], kind='stable')
+    return order[:n].tolist() if n else order.tolist()
+
+
+def pivot(keys: List[tuple], values: Dict[str, Any], dims: Sequence[str], column_dim: str,
+          metric: str) -> Tuple[List[Any], List[Tuple[tuple, List[float]]]]:
+    """Spread ``metric`` over the values of ``column_dim``.
+
+    Returns the column values and, per combination of the other dimensions,
+    one cell per column (0 where there were no sales).
+    """
+    pos = list(dims).index(column_dim)
+    columns = sorted({k[pos] for k in keys})
+    col_index = {c: i for i, c in enumerate(columns)}
+    rows: Dict[tuple, Any] = {}
+    for key, value in zip(keys, values[metric].tolist()):
+        row_key = key[:pos] + key[pos + 1:]
+        cells = rows.setdefault(row_key, [0] * len(columns))
+        cells[col_index[key[pos]]] = value
+    return columns, sorted(rows.items(), key=lambda r: -sum(r[1]))
+
+
+def names(dims: Sequence[str], keys: List[tuple], lang: str) -> Dict[str, Dict[Any, Any]]:
+    """Display names for item and category codes present in ``keys``."""
+    names: Dict[str, Dict[Any, Any]] = {}
+    for dim, model in (('item', Item), ('category', Category)):
+        if dim not in dims:
+            continue
+        pos = list(dims).index(dim)
+        ids = {k[pos] for k in keys}
+        column = model.name_en if lang == 'en' else model.name_ru
+        names[dim] = dict(db.session.execute(select(model.id, column).where(model.id.in_(ids))).all())
+    return names
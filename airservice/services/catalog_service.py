@@ -0,0 +1,545 @@
+import base64
+import hashlib
+import json
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+from flask import current_app, has_request_context, request
+
+from ..models import db, Item, Category, CategoryClosure, CatalogRevision
+from . import image_service, search_service
+from .columnar import CatalogColumns, NO_CATEGORY, np
+
+SORT_KEYS = ('id', 'price', 'name', 'relevance')
+# facet responses kept per snapshot, least recently used dropped first
+FACETS_CACHE_SIZE = 128
+REQUEST_REVISION_KEY = 'airservice.catalog_revision'
+
+
+class SnapshotRow(NamedTuple):
+    id: int
+    price: float
+    name: str
+    available: bool
+    is_service: bool
+    category_id: int | None
+    encoded: bytes
+
+
+class SortedView(NamedTuple):
+    """Snapshot rows in ascending key order, with their snapshot positions."""
+    rows: List[SnapshotRow]
+    keys: List[tuple]
+    positions: array
+
+
+class CatalogSnapshot:
+    """Projected catalog rows of one language at one catalog version.
+
+    Rows are ordered by id. Sorted views, category subtrees and column
+    arrays are derived lazily and live as long as the snapshot.
+    """
+
+    def __init__(self, version: int, rows: List[SnapshotRow],
+                 subtrees: Dict[int, frozenset] | None = None,
+                 columns: CatalogColumns | None = None):
+        self.version = version
+        self.rows = rows
+        self.body = _encode_rows(rows)
+        self.views: Dict[str, SortedView] = {}
+        self.subtrees = subtrees if subtrees is not None else {}
+        self.columns = columns
+        self.ancestors: Dict[int, List[int]] | None = None
+        self.facets: OrderedDict = OrderedDict()
+
+    def get_columns(self) -> CatalogColumns:
+        if self.columns is None:
+            self.columns = CatalogColumns.from_rows(self.rows)
+        return self.columns
+
+
+class Page(NamedTuple):
+    rows: List[Any]
+    next_key: tuple | None
+
+
+class CatalogState:
+    """Per-application snapshot store, keyed to the persisted catalog revision.
+
+    Every catalog write transaction takes the next ``catalog_revision``
+    (see ``changes_service``), so a snapshot tagged with revision ``N`` is
+    current as long as the database still reports ``N``, whichever process
+    made the write.
+    """
+
+    def __init__(self):
+        self.revision = 0  # last revision read or written by this process
+        self.checked_at = float('-inf')
+        self.snapshots: Dict[str, CatalogSnapshot] = {}
+        self.lock = threading.Lock()
+
+
+def _state() -> CatalogState:
+    state = current_app.extensions.get('catalog_state')
+    if state is None:
+        state = current_app.extensions.setdefault('catalog_state', CatalogState())
+    return state
+
+
+def read_revision() -> int:
+    """Return the committed catalog revision (one primary-key read)."""
+    return db.session.scalar(db.select(CatalogRevision.value).where(CatalogRevision.id == 1)) or 0
+
+
+def get_version() -> int:
+    """Return the catalog revision snapshots and entity tags are valid for.
+
+    The revision is read at most once per request. With
+    ``CATALOG_REVISION_TTL`` set, a process reads it at most once per that
+    many seconds, so writes from other processes may show up that much later.
+    """
+    if has_request_context() and REQUEST_REVISION_KEY in request.environ:
+        return request.environ[REQUEST_REVISION_KEY]
+    state = _state()
+    ttl = current_app.config.get('CATALOG_REVISION_TTL', 0)
+    now = time.monotonic()
+    if ttl and now - state.checked_at < ttl:
+        revision = state.revision
+    else:
+        revision = read_revision()
+        with state.lock:
+            state.revision, state.checked_at = revision, now
+    if has_request_context():
+        request.environ[REQUEST_REVISION_KEY] = revision
+    return revision
+
+
+def etag(*parts: Any) -> str:
+    """Return a strong entity tag for the current catalog revision.
+
+    ``parts`` describe the representation (path, language, filters) so each
+    variant of a resource gets its own tag.
+    """
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+    return f'{get_version()}-{digest}'
+
+
+def _written(state: CatalogState, revision: int) -> None:
+    # this process sees its own writes at once, even within the TTL
+    if revision > state.revision:
+        state.revision = revision
+    if has_request_context():
+        request.environ.pop(REQUEST_REVISION_KEY, None)
+
+
+def item_changed(item_id: int, revision: int) -> None:
+    """Patch the snapshots after a committed write of ``revision`` to one item.
+
+    A snapshot taken at the revision just before is patched in place of a
+    rebuild: only the changed row is re-read and re-encoded, and column
+    arrays are updated at its position. Older snapshots are left to be
+    rebuilt on their next use.
+    """
+    state = _state()
+    with state.lock:
+        _written(state, revision)
+        current = {
+            lang: snap for lang, snap in state.snapshots.items()
+            if snap.version == revision - 1
+        }
+    if not current:
+        return
+    # query and patch outside the lock; only snapshots still current are swapped
+    row = catalog_query().filter(Item.id == item_id).first()
+    patched = {lang: _patched(snap, lang, item_id, row, revision) for lang, snap in current.items()}
+    with state.lock:
+        for lang, snap in patched.items():
+            if state.snapshots.get(lang) is current[lang]:
+                state.snapshots[lang] = snap
+
+
+def catalog_changed(revision: int) -> None:
+    """Note a committed catalog write that snapshots cannot be patched for."""
+    state = _state()
+    with state.lock:
+        _written(state, revision)
+
+
+def _encode_rows(rows: List[SnapshotRow]) -> bytes:
+    return b'[' + b','.join(r.encoded for r in rows) + b']'
+
+
+def catalog_query():
+    """Select the serialised item columns joined to their category."""
+    return db.session.query(
+        Item.id, Item.name_ru, Item.name_en, Item.description_ru, Item.description_en,
+        Item.image, Item.price, Item.available, Item.is_service, Item.category_id,
+        Category.name_ru.label('category_ru'), Category.name_en.label('category_en'),
+    ).outerjoin(Category, Item.category_id == Category.id)
+
+
+def project(row, lang: str) -> Dict[str, Any]:
+    """Return the public catalog representation of a ``catalog_query`` row."""
+    return {
+        'id': row.id,
+        'name': row.name_en if lang == 'en' else row.name_ru,
+        'description': row.description_en if lang == 'en' else row.description_ru,
+        'image': image_service.image_url(row.image),
+        'images': image_service.image_urls(row.image),
+        'price': row.price,
+        'available': row.available,
+        'service': row.is_service,
+        'category': row.category_en if lang == 'en' else row.category_ru,
+        'category_id': row.category_id if row.category_ru is not None else None,
+    }
+
+
+def _snapshot_row(r, lang: str) -> SnapshotRow:
+    return SnapshotRow(
+        r.id, r.price, (r.name_en if lang == 'en' else r.name_ru) or '',
+        bool(r.available), bool(r.is_service), r.category_id,
+        current_app.json.dumps(project(r, lang)).encode(),
+    )
+
+
+def _build_snapshot(lang: str, version: int) -> CatalogSnapshot:
+    rows = [_snapshot_row(r, lang) for r in catalog_query().order_by(Item.id)]
+    return CatalogSnapshot(version, rows)
+
+
+def _patched(snap: CatalogSnapshot, lang: str, item_id: int, row, version: int) -> CatalogSnapshot:
+    rows = list(snap.rows)
+    pos = bisect_left(rows, item_id, key=attrgetter('id'))
+    exists = pos < len(rows) and rows[pos].id == item_id
+    columns = snap.columns
+    if row is None:
+        if not exists:
+            return CatalogSnapshot(version, rows, snap.subtrees, columns)
+        del rows[pos]
+        if columns is not None:
+            columns = columns.deleted(pos)
+    else:
+        new = _snapshot_row(row, lang)
+        if exists:
+            rows[pos] = new
+            if columns is not None:
+                columns = columns.replaced(pos, new)
+        else:
+            rows.insert(pos, new)
+            if columns is not None:
+                columns = columns.inserted(pos, new)
+    # item writes leave the category tree alone, so subtrees stay valid
+    patched = CatalogSnapshot(version, rows, snap.subtrees, columns)
+    patched.ancestors = snap.ancestors
+    return patched
+
+
+def get_snapshot(lang: str) -> CatalogSnapshot:
+    """Return the catalog snapshot for ``lang``, rebuilding it if stale."""
+    state = _state()
+    version = get_version()
+    snap = state.snapshots.get(lang)
+    if snap is not None and snap.version == version:
+        return snap
+    # tag with the revision read before querying so a concurrent write
+    # committed during the build leaves this snapshot stale
+    snap = _build_snapshot(lang, version)
+    with state.lock:
+        current = state.snapshots.get(lang)
+        if current is None or current.version < version:
+            state.snapshots[lang] = snap
+    return snap
+
+
+def encode_cursor(sort: str, descending: bool, key: tuple) -> str:
+    raw = json.dumps([sort, descending, *key], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, bool, tuple]:
+    """Return ``(sort, descending, key)`` or raise ``ValueError``."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort, descending, value, last_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('malformed cursor')
+    expected = {'id': int, 'relevance': int, 'price': (int, float), 'name': str}.get(sort)
+    if (expected is None or not isinstance(descending, bool)
+            or not isinstance(value, expected) or not isinstance(last_id, int)
+            # json booleans are ints to isinstance
+            or isinstance(value, bool) or isinstance(last_id, bool)):
+        raise ValueError('malformed cursor')
+    return sort, descending, (value, last_id)
+
+
+def _subtree(snap: CatalogSnapshot, category_id: int) -> frozenset:
+    ids = snap.subtrees.get(category_id)
+    if ids is None:
+        # query outside the lock; subtrees may be shared with patched snapshots
+        ids = frozenset(db.session.scalars(
+            db.select(CategoryClosure.descendant_id)
+            .where(CategoryClosure.ancestor_id == category_id)
+        ))
+        with _state().lock:
+            ids = snap.subtrees.setdefault(category_id, ids)
+    return ids
+
+
+def _matcher(filters: Dict[str, Any], rank: Dict[int, int] | None,
+             categories: frozenset | None) -> Callable[[SnapshotRow], bool]:
+    price_min = filters.get('price_min')
+    price_max = filters.get('price_max')
+    available = filters.get('available')
+    service = filters.get('service')
+
+    def match(r: SnapshotRow) -> bool:
+        return (
+            (categories is None or r.category_id in categories)
+            and (price_min is None or r.price >= price_min)
+            and (price_max is None or r.price <= price_max)
+            and (available is None or r.available is available)
+            and (service is None or r.is_service is service)
+            and (rank is None or r.id in rank)
+        )
+    return match
+
+
+def _sorted(snap: CatalogSnapshot, sort: str) -> SortedView:
+    view = snap.views.get(sort)
+    if view is None:
+        rows = snap.rows
+        positions = array('q', sorted(range(len(rows)), key=lambda i: (getattr(rows[i], sort), rows[i].id)))
+        view = SortedView(
+            [rows[i] for i in positions],
+            [(getattr(rows[i], sort), rows[i].id) for i in positions],
+            positions,
+        )
+        # sort outside the lock; a concurrent request may have won the race
+        with _state().lock:
+            view = snap.views.setdefault(sort, view)
+    return view
+
+
+def paginate(rows: List[Any], keys: List[tuple], match: Callable[[Any], bool], *,
+             descending: bool = False, after: tuple | None = None,
+             limit: int | None = None) -> Page:
+    """Walk ``rows`` (ascending by ``keys``) from the keyset position ``after``.
+
+    Only rows past the cursor are visited, so a page deep into the catalog
+    costs about as much as the first one.
+    """
+    if descending:
+        start = len(rows) - 1 if after is None else bisect_left(keys, after) - 1
+        indices = range(start, -1, -1)
+    else:
+        start = 0 if after is None else bisect_right(keys, after)
+        indices = range(start, len(rows))
+    out = []
+    last = None
+    for i in indices:
+        if not match(rows[i]):
+            continue
+        if limit is not None and len(out) == limit:
+            return Page(out, keys[last])
+        out.append(rows[i])
+        last = i
+    return Page(out, None)
+
+
+def _paginate_mask(snap: CatalogSnapshot, view, keys: List[tuple], mask, key: Callable,
+                   *, descending: bool, after: tuple | None, limit: int | None) -> Page:
+    """``paginate`` for the numpy engine; ``view`` holds snapshot positions."""
+    if descending:
+        start = len(keys) if after is None else bisect_left(keys, after)
+        candidates = view[:start][::-1]
+    else:
+        start = 0 if after is None else bisect_right(keys, after)
+        candidates = view[start:]
+    selected = candidates[mask[candidates]]
+    next_key = None
+    if limit is not None and len(selected) > limit:
+        selected = selected[:limit]
+        next_key = key(snap.rows[selected[-1]])
+    return Page([snap.rows[i] for i in selected.tolist()], next_key)
+
+
+def select(lang: str, filters: Dict[str, Any], *, sort: str | None = None,
+           descending: bool = False, after: tuple | None = None,
+           limit: int | None = None) -> Page:
+    """Return the snapshot rows for ``lang`` matching ``filters``.
+
+    Text search goes through the full-text index; without an explicit
+    ``sort`` its matches are ordered by relevance. All other filters are
+    evaluated against the snapshot, row by row or, with the numpy engine,
+    as a vectorised mask over column arrays.
+    """
+    snap = get_snapshot(lang)
+    ranked_ids = None
+    rank = None
+    if filters.get('q'):
+        ranked_ids = search_service.search_item_ids(filters['q'])
+        rank = {item_id: n for n, item_id in enumerate(ranked_ids)}
+    categories = None
+    if filters.get('category') is not None:
+        categories = _subtree(snap, filters['category'])
+    if sort is None:
+        sort = 'relevance' if rank is not None else 'id'
+    if sort == 'relevance':
+        def key(r):
+            return rank[r.id], r.id
+    else:
+        def key(r):
+            return getattr(r, sort), r.id
+
+    if current_app.config.get('CATALOG_FILTER_ENGINE') == 'numpy':
+        columns = snap.get_columns()
+        mask = columns.mask(filters, categories, ranked_ids)
+        if sort == 'relevance':
+            # snapshot positions of the search matches, in rank order
+            ids = np.fromiter(ranked_ids, np.int64, len(ranked_ids))
+            view = np.searchsorted(columns.id, ids)
+            if len(columns.id):
+                view = np.minimum(view, len(columns.id) - 1)
+                view = view[columns.id[view] == ids]
+            else:
+                view = view[:0]
+            keys = [key(snap.rows[p]) for p in view.tolist()]
+        else:
+            sorted_view = _sorted(snap, sort)
+            view = np.frombuffer(sorted_view.positions, dtype=np.int64)
+            keys = sorted_view.keys
+        return _paginate_mask(snap, view, keys, mask, key,
+                              descending=descending, after=after, limit=limit)
+
+    match = _matcher(filters, rank, categories)
+    if sort == 'relevance':
+        rows = sorted((r for r in snap.rows if r.id in rank), key=key)
+        keys = [key(r) for r in rows]
+    else:
+        rows, keys, _ = _sorted(snap, sort)
+    return paginate(rows, keys, match, descending=descending, after=after, limit=limit)
+
+
+def render(lang: str, filters: Dict[str, Any]) -> bytes:
+    """Return the encoded catalog list for ``lang`` matching ``filters``."""
+    if not any(v is not None for v in filters.values()):
+        return get_snapshot(lang).body
+    return _encode_rows(select(lang, filters).rows)
+
+
+def _ancestors(snap: CatalogSnapshot) -> Dict[int, List[int]]:
+    """Map each category id to itself and all of its ancestors."""
+    if snap.ancestors is None:
+        ancestors: Dict[int, List[int]] = {}
+        for ancestor_id, descendant_id in db.session.execute(
+            db.select(CategoryClosure.ancestor_id, CategoryClosure.descendant_id)
+        ):
+            ancestors.setdefault(descendant_id, []).append(ancestor_id)
+        with _state().lock:
+            if snap.ancestors is None:
+                snap.ancestors = ancestors
+    return snap.ancestors
+
+
+def price_buckets() -> List[float]:
+    """Upper bounds of the price histogram buckets, in ascending order."""
+    return sorted(current_app.config.get('CATALOG_PRICE_BUCKETS') or [])
+
+
+def facet_payload(total: int, services: int, available: int,
+                  buckets: List[int], categories: Dict[int, int]) -> Dict[str, Any]:
+    """Shape facet counts; ``categories`` already includes subtree totals."""
+    edges = price_buckets()
+    lower = [0.0] + edges
+    upper = edges + [None]
+    return {
+        'total': total,
+        'service': {'goods': total - services, 'services': services},
+        'available': {'available': available, 'unavailable': total - available},
+        'price': [
+            {'min': lo, 'max': hi, 'count': count}
+            for lo, hi, count in zip(lower, upper, buckets)
+        ],
+        'categories': [
+            {'id': cat_id, 'count': count}
+            for cat_id, count in sorted(categories.items())
+        ],
+    }
+
+
+def _rollup(snap: CatalogSnapshot, direct: Dict[int, int]) -> Dict[int, int]:
+    ancestors = _ancestors(snap)
+    totals: Counter = Counter()
+    for cat_id, count in direct.items():
+        for ancestor_id in ancestors.get(cat_id, ()):
+            totals[ancestor_id] += count
+    return dict(totals)
+
+
+def facets(lang: str, filters: Dict[str, Any]) -> bytes:
+    """Return encoded facet counts for the items matching ``filters``.
+
+    All counts come from a single pass over the snapshot (or one set of
+    vectorised reductions with the numpy engine) and are cached until the
+    catalog changes.
+    """
+    state = _state()
+    snap = get_snapshot(lang)
+    cache_key = tuple(sorted(filters.items()))
+    with state.lock:
+        cached = snap.facets.get(cache_key)
+        if cached is not None:
+            snap.facets.move_to_end(cache_key)
+            return cached
+
+    ranked_ids = None
+    if filters.get('q'):
+        ranked_ids = search_service.search_item_ids(filters['q'])
+    categories = None
+    if filters.get('category') is not None:
+        categories = _subtree(snap, filters['category'])
+    edges = price_buckets()
+
+    if current_app.config.get('CATALOG_FILTER_ENGINE') == 'numpy':
+        columns = snap.get_columns()
+        mask = columns.mask(filters, categories, ranked_ids)
+        cat_ids = columns.category_id[mask]
+        cat_ids = cat_ids[cat_ids != NO_CATEGORY]
+        values, counts = np.unique(cat_ids, return_counts=True)
+        direct = dict(zip(values.tolist(), counts.tolist()))
+        buckets = np.bincount(
+            np.searchsorted(np.asarray(edges, dtype=np.float64), columns.price[mask], side='right'),
+            minlength=len(edges) + 1,
+        ).tolist()
+        payload = facet_payload(
+            int(mask.sum()), int(columns.is_service[mask].sum()),
+            int(columns.available[mask].sum()), buckets, _rollup(snap, direct),
+        )
+    else:
+        rank = set(ranked_ids) if ranked_ids is not None else None
+        match = _matcher(filters, rank, categories)
+        total = services = available = 0
+        buckets = [0] * (len(edges) + 1)
+        direct: Counter = Counter()
+        for r in snap.rows:
+            if not match(r):
+                continue
+            total += 1
+            services += r.is_service
+            available += r.available
+            buckets[bisect_right(edges, r.price)] += 1
+            if r.category_id is not None:
+                direct[r.category_id] += 1
+        payload = facet_payload(total, services, available, buckets, _rollup(snap, direct))
+
+    body = current_app.json.dumps(payload).encode()
+    with state.lock:
+        snap.facets[cache_key] = body
+        if len(snap.facets) > FACETS_CACHE_SIZE:
+            snap.facets.popitem(last=False)
+    return body
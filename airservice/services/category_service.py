@@ -0,0 +1,141 @@
+import logging
+from typing import Any, Dict, List
+
+from flask_babel import gettext
+from sqlalchemy import select, true, update
+
+from ..models import db, Category, CategoryClosure, Item
+from ..sqlite_profile import retry_on_busy
+from . import catalog_service, changes_service
+
+closure = CategoryClosure.__table__
+
+
+def _subtree_ids(category_id: int) -> List[int]:
+    return list(db.session.scalars(
+        select(closure.c.descendant_id).where(closure.c.ancestor_id == category_id)
+    ))
+
+
+def _attach(category_id: int, parent_id: int | None) -> None:
+    """Link the subtree rooted at ``category_id`` below ``parent_id``."""
+    if parent_id is None:
+        return
+    above = closure.alias('above')
+    below = closure.alias('below')
+    db.session.execute(closure.insert().from_select(
+        ['ancestor_id', 'descendant_id', 'depth'],
+        select(above.c.ancestor_id, below.c.descendant_id, above.c.depth + below.c.depth + 1)
+        .select_from(above.join(below, true()))
+        .where(above.c.descendant_id == parent_id, below.c.ancestor_id == category_id),
+    ))
+
+
+def _detach(category_id: int, subtree: List[int]) -> None:
+    """Remove the paths leading into the subtree from outside of it."""
+    ancestors = list(db.session.scalars(
+        select(closure.c.ancestor_id).where(
+            closure.c.descendant_id == category_id,
+            closure.c.ancestor_id != category_id,
+        )
+    ))
+    if ancestors:
+        db.session.execute(closure.delete().where(
+            closure.c.descendant_id.in_(subtree),
+            closure.c.ancestor_id.in_(ancestors),
+        ))
+
+
+def _stamp_items(category_id: int, revision: int) -> None:
+    db.session.execute(
+        update(Item).where(Item.category_id == category_id).values(revision=revision)
+    )
+
+
+def _check_parent(parent_id: int | None) -> None:
+    if parent_id is not None and db.session.get(Category, parent_id) is None:
+        raise ValueError(gettext('Invalid parent category'))
+
+
+@retry_on_busy
+def create_category(data: Dict[str, Any]) -> Category:
+    _check_parent(data.get('parent_id'))
+    cat = Category(
+        name_ru=data['name_ru'],
+        name_en=data['name_en'],
+        parent_id=data.get('parent_id'),
+        image=data.get('image'),
+    )
+    db.session.add(cat)
+    db.session.flush()
+    db.session.execute(closure.insert().values(ancestor_id=cat.id, descendant_id=cat.id, depth=0))
+    _attach(cat.id, cat.parent_id)
+    revision = changes_service.stamp(cat)
+    db.session.commit()
+    catalog_service.catalog_changed(revision)
+    logging.info('category_created %s', cat.id)
+    return cat
+
+
+@retry_on_busy
+def update_category(cat: Category, data: Dict[str, Any]) -> Category:
+    """Update ``cat``; moving it re-links its whole subtree.
+
+    Raises ``ValueError`` if the new parent is unknown or lies inside the
+    category's own subtree.
+    """
+    parent_id = data.get('parent_id', cat.parent_id)
+    moved = parent_id != cat.parent_id
+    if moved:
+        _check_parent(parent_id)
+        subtree = _subtree_ids(cat.id)
+        if parent_id in subtree:
+            raise ValueError(gettext('Invalid parent category'))
+    for key in ('name_ru', 'name_en', 'image'):
+        if key in data:
+            setattr(cat, key, data[key])
+    if moved:
+        _detach(cat.id, subtree)
+        _attach(cat.id, parent_id)
+        cat.parent_id = parent_id
+    revision = changes_service.stamp(cat)
+    if 'name_ru' in data or 'name_en' in data:
+        # items carry the category name
+        _stamp_items(cat.id, revision)
+    db.session.commit()
+    catalog_service.catalog_changed(revision)
+    logging.info('category_updated %s', cat.id)
+    return cat
+
+
+@retry_on_busy
+def delete_category(cat: Category) -> None:
+    """Delete ``cat``; its child categories become roots."""
+    subtree = _subtree_ids(cat.id)
+    _detach(cat.id, subtree)
+    db.session.execute(closure.delete().where(closure.c.ancestor_id == cat.id))
+    revision = changes_service.tombstone(changes_service.CATEGORY, cat.id)
+    Category.query.filter(Category.parent_id == cat.id).update(
+        {'parent_id': None, 'revision': revision}
+    )
+    _stamp_items(cat.id, revision)
+    db.session.delete(cat)
+    db.session.commit()
+    catalog_service.catalog_changed(revision)
+    logging.info('category_deleted %s', cat.id)
+
+
+def rebuild_closure() -> int:
+    """Recompute the closure table from ``parent_id`` links."""
+    parents = dict(db.session.query(Category.id, Category.parent_id).all())
+    rows = []
+    for cat_id in parents:
+        node, depth, seen = cat_id, 0, set()
+        while node is not None and node in parents and node not in seen:
+            seen.add(node)
+            rows.append({'ancestor_id': node, 'descendant_id': cat_id, 'depth': depth})
+            node, depth = parents[node], depth + 1
+    db.session.execute(closure.delete())
+    if rows:
+        db.session.execute(closure.insert(), rows)
+    return len(rows)
@@ -0,0 +1,109 @@
+"""Catalog revisions and the ``/catalog/changes`` delta feed.
+
+Every catalog write transaction takes the next value of the
+``catalog_revision`` counter and stamps it on the rows it touches; deleted
+rows leave a tombstone with the revision of the deletion. A client that
+synced up to revision ``N`` fetches the rows and tombstones with a revision
+greater than ``N``.
+"""
+from typing import Any, Dict, NamedTuple
+
+from sqlalchemy import delete, select, update
+
+from ..models import db, Category, CatalogRevision, CatalogTombstone, Item
+from . import catalog_service, image_service
+
+ITEM = 'item'
+CATEGORY = 'category'
+
+
+class Changes(NamedTuple):
+    revision: int
+    reset: bool
+    items: list
+    categories: list
+    deleted: Dict[str, list]
+
+
+def current_revision() -> int:
+    return catalog_service.read_revision()
+
+
+def next_revision() -> int:
+    """Allocate the revision of the current write transaction.
+
+    The counter row stays locked until commit, so concurrent writers commit
+    in revision order.
+    """
+    value = db.session.scalar(
+        update(CatalogRevision).where(CatalogRevision.id == 1)
+        .values(value=CatalogRevision.value + 1)
+        .returning(CatalogRevision.value)
+    )
+    if value is None:
+        value = 1
+        db.session.add(CatalogRevision(id=1, value=value))
+        db.session.flush()
+    return value
+
+
+def stamp(obj: Item | Category, revision: int | None = None) -> int:
+    """Mark ``obj`` as changed; a re-created id drops its old tombstone."""
+    obj.revision = revision if revision is not None else next_revision()
+    kind = ITEM if isinstance(obj, Item) else CATEGORY
+    if obj.id is None:
+        db.session.flush()
+    db.session.execute(delete(CatalogTombstone).where(
+        CatalogTombstone.kind == kind, CatalogTombstone.entity_id == obj.id,
+    ))
+    return obj.revision
+
+
+def tombstone(kind: str, entity_id: int, revision: int | None = None) -> int:
+    revision = revision if revision is not None else next_revision()
+    db.session.merge(CatalogTombstone(kind=kind, entity_id=entity_id, revision=revision))
+    return revision
+
+
+def project_category(cat, lang: str) -> Dict[str, Any]:
+    return {
+        'id': cat.id,
+        'name': cat.name_en if lang != 'ru' else cat.name_ru,
+        'image': image_service.image_url(cat.image),
+        'images': image_service.image_urls(cat.image),
+        'parent_id': cat.parent_id,
+    }
+
+
+def changes(since: int | None, lang: str) -> Changes:
+    """Return catalog rows changed after revision ``since``.
+
+    Without ``since``, or when it is ahead of the server (e.g. after the
+    database was reset), the whole catalog is returned with ``reset`` set.
+    """
+    # read the revision first: rows committed meanwhile are sent again on
+    # the next sync rather than skipped
+    revision = current_revision()
+    reset = since is None or since > revision
+    after = -1 if reset else since
+
+    items = [
+        catalog_service.project(r, lang)
+        for r in catalog_service.catalog_query().filter(Item.revision > after).order_by(Item.id)
+    ]
+    categories = [
+        project_category(c, lang)
+        for c in db.session.query(
+            Category.id, Category.name_ru, Category.name_en, Category.image, Category.parent_id,
+        ).filter(Category.revision > after).order_by(Category.id)
+    ]
+    deleted = {ITEM: [], CATEGORY: []}
+    if not reset:
+        for kind, entity_id in db.session.execute(
+            select(CatalogTombstone.kind, CatalogTombstone.entity_id)
+            .where(CatalogTombstone.revision > after)
+            .order_by(CatalogTombstone.kind, CatalogTombstone.entity_id)
+        ):
+            deleted[kind].append(entity_id)
+    return Changes(revision, reset, items, categories,
+                   {'items': deleted[ITEM], 'categories': deleted[CATEGORY]})
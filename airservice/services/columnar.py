@@ -0,0 +1,92 @@
+"""NumPy column arrays for evaluating catalog filters as vectorised masks.
+
+Selected with ``CATALOG_FILTER_ENGINE = 'numpy'``. NumPy is an optional
+dependency and only needs to be installed when this engine is enabled.
+"""
+from typing import Any, Dict, Iterable, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+# category_id stand-in for items without a category
+NO_CATEGORY = -1
+
+
+def require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("CATALOG_FILTER_ENGINE='numpy' requires the numpy package")
+
+
+class CatalogColumns:
+    """Column arrays aligned with the rows of a catalog snapshot."""
+
+    __slots__ = ('id', 'price', 'available', 'is_service', 'category_id')
+
+    def __init__(self, id, price, available, is_service, category_id):
+        self.id = id
+        self.price = price
+        self.available = available
+        self.is_service = is_service
+        self.category_id = category_id
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Any]) -> 'CatalogColumns':
+        require_numpy()
+        return cls(
+            np.fromiter((r.id for r in rows), np.int64, len(rows)),
+            np.fromiter((r.price for r in rows), np.float64, len(rows)),
+            np.fromiter((r.available for r in rows), np.bool_, len(rows)),
+            np.fromiter((r.is_service for r in rows), np.bool_, len(rows)),
+            np.fromiter(
+                (NO_CATEGORY if r.category_id is None else r.category_id for r in rows),
+                np.int64, len(rows),
+            ),
+        )
+
+    @staticmethod
+    def _values(row: Any) -> tuple:
+        return (
+            row.id, row.price, row.available, row.is_service,
+            NO_CATEGORY if row.category_id is None else row.category_id,
+        )
+
+    def replaced(self, pos: int, row: Any) -> 'CatalogColumns':
+        arrays = [a.copy() for a in self._arrays()]
+        for a, value in zip(arrays, self._values(row)):
+            a[pos] = value
+        return CatalogColumns(*arrays)
+
+    def inserted(self, pos: int, row: Any) -> 'CatalogColumns':
+        return CatalogColumns(*(
+            np.insert(a, pos, value) for a, value in zip(self._arrays(), self._values(row))
+        ))
+
+    def deleted(self, pos: int) -> 'CatalogColumns':
+        return CatalogColumns(*(np.delete(a, pos) for a in self._arrays()))
+
+    def _arrays(self) -> tuple:
+        return self.id, self.price, self.available, self.is_service, self.category_id
+
+    def mask(self, filters: Dict[str, Any], categories: Iterable[int] | None,
+             ids: Iterable[int] | None) -> 'np.ndarray':
+        """Return a boolean mask of the rows matching ``filters``.
+
+        ``categories`` restricts rows to a category subtree and ``ids`` to the
+        matches of a text search.
+        """
+        m = np.ones(len(self.id), dtype=np.bool_)
+        if filters.get('price_min') is not None:
+            m &= self.price >= filters['price_min']
+        if filters.get('price_max') is not None:
+            m &= self.price <= filters['price_max']
+        if filters.get('available') is not None:
+            m &= self.available == filters['available']
+        if filters.get('service') is not None:
+            m &= self.is_service == filters['service']
+        if categories is not None:
+            m &= np.isin(self.category_id, np.fromiter(categories, np.int64))
+        if ids is not None:
+            m &= np.isin(self.id, np.fromiter(ids, np.int64))
+        return m
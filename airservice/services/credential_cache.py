@@ -0,0 +1,99 @@
+"""Cache of verified admin Basic credentials.
+
+``check_password_hash`` is deliberately slow and the crew dashboard calls
+admin endpoints every few seconds, so successful verifications are
+remembered for ``ADMIN_AUTH_CACHE_TTL`` seconds (at most
+``ADMIN_AUTH_CACHE_SIZE`` entries, least recently used dropped first).
+Entries are keyed by an HMAC of the credentials under a per-process random
+key, so neither the password nor a plain hash of it is kept in memory.
+
+Failures are never cached: unknown credentials always go through the
+password hash. Changing ``ADMIN_PASSWORD_HASH`` empties the cache.
+"""
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from werkzeug.security import check_password_hash
+
+
+class CredentialCache:
+    """Bounded TTL set of credential digests verified against one hash."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.key = secrets.token_bytes(32)
+        self.entries: OrderedDict[bytes, float] = OrderedDict()
+        self.password_hash: str | None = None
+        self.lock = threading.Lock()
+
+    def digest(self, username: str, password: str) -> bytes:
+        message = b'\0'.join((username.encode(), password.encode()))
+        return hmac.new(self.key, message, hashlib.sha256).digest()
+
+    def contains(self, digest: bytes, password_hash: str) -> bool:
+        with self.lock:
+            if password_hash != self.password_hash:
+                self.entries.clear()
+                self.password_hash = password_hash
+                return False
+            expires = self.entries.get(digest)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self.entries[digest]
+                return False
+            self.entries.move_to_end(digest)
+            return True
+
+    def add(self, digest: bytes, password_hash: str) -> None:
+        with self.lock:
+            if password_hash != self.password_hash:
+                self.entries.clear()
+                self.password_hash = password_hash
+            self.entries[digest] = time.monotonic() + self.ttl
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+_lock = threading.Lock()
+
+
+def get_cache() -> CredentialCache:
+    """Return the cache of the current app, creating it on first use."""
+    app = current_app._get_current_object()
+    cache = app.extensions.get('admin_credential_cache')
+    if cache is None:
+        with _lock:
+            cache = app.extensions.get('admin_credential_cache')
+            if cache is None:
+                cache = app.extensions['admin_credential_cache'] = CredentialCache(
+                    app.config.get('ADMIN_AUTH_CACHE_SIZE', 64),
+                    app.config.get('ADMIN_AUTH_CACHE_TTL', 300),
+                )
+    return cache
+
+
+def check_admin(username: str | None, password: str | None) -> bool:
+    """Verify admin Basic credentials, skipping the hash for recent successes."""
+    config = current_app.config
+    username, password = username or '', password or ''
+    name_ok = hmac.compare_digest(username.encode(), config['ADMIN_USERNAME'].encode())
+    password_hash = config['ADMIN_PASSWORD_HASH']
+    if not config.get('ADMIN_AUTH_CACHE_TTL', 300):
+        return name_ok and check_password_hash(password_hash, password)
+
+    cache = get_cache()
+    digest = cache.digest(username, password)
+    if name_ok and cache.contains(digest, password_hash):
+        return True
+    if name_ok and check_password_hash(password_hash, password):
+        cache.add(digest, password_hash)
+        return True
+    return False
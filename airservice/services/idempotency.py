@@ -0,0 +1,139 @@
+"""Idempotency-Key store in front of the orders table.
+
+``claim`` answers a repeated key without touching the database and makes
+concurrent duplicates of an in-flight request wait for its result instead
+of racing it into the unique constraint. Entries expire after
+``IDEMPOTENCY_TTL`` seconds. The in-process store additionally keeps at
+most ``IDEMPOTENCY_MAX_KEYS`` keys, dropping the least recently used;
+``IDEMPOTENCY_BACKEND = 'redis'`` shares the keys between workers through
+``REDIS_URL``.
+
+The database stays authoritative: when the store has forgotten a key, is
+unreachable or a wait times out, the caller falls back to the lookup in
+``order_service``.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from flask import current_app
+
+# how long a duplicate waits for the in-flight request
+WAIT_TIMEOUT = 10.0
+
+
+class MemoryStore:
+    """Bounded in-process LRU of completed keys plus in-flight markers."""
+
+    def __init__(self, max_keys: int, ttl: float):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.entries: OrderedDict[str, Tuple[int, float]] = OrderedDict()
+        self.inflight: Dict[str, threading.Event] = {}
+        self.lock = threading.Lock()
+
+    def claim(self, key: str, timeout: float = WAIT_TIMEOUT) -> Tuple[int | None, bool]:
+        """Return ``(order_id, owned)``.
+
+        A known key gives its order id. Otherwise the caller either owns the
+        key and must ``complete`` or ``release`` it, or (after a timeout)
+        gets ``(None, False)`` and falls back to the database.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    if entry[1] > time.monotonic():
+                        self.entries.move_to_end(key)
+                        return entry[0], False
+                    del self.entries[key]
+                event = self.inflight.get(key)
+                if event is None:
+                    self.inflight[key] = threading.Event()
+                    return None, True
+            if not event.wait(max(deadline - time.monotonic(), 0)):
+                return None, False
+
+    def complete(self, key: str, order_id: int) -> None:
+        with self.lock:
+            self.entries[key] = (order_id, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_keys:
+                self.entries.popitem(last=False)
+            event = self.inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def release(self, key: str) -> None:
+        """Give up ownership after a failed request; a waiter takes over."""
+        with self.lock:
+            event = self.inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+class RedisStore:
+    """Keys shared through Redis; in-flight keys hold a pending marker."""
+
+    PENDING = b'-'
+    PREFIX = 'idempotency:'
+
+    def __init__(self, url: str, ttl: float, poll: float = 0.02):
+        from redis import Redis
+        self.redis = Redis.from_url(url)
+        self.ttl = int(ttl)
+        self.poll = poll
+
+    def claim(self, key: str, timeout: float = WAIT_TIMEOUT) -> Tuple[int | None, bool]:
+        from redis import RedisError
+        name = self.PREFIX + key
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline:
+                # the pending marker expires in case its owner dies
+                if self.redis.set(name, self.PENDING, nx=True, ex=int(WAIT_TIMEOUT) + 1):
+                    return None, True
+                value = self.redis.get(name)
+                if value is not None and value != self.PENDING:
+                    return int(value), False
+                time.sleep(self.poll)
+        except RedisError:
+            logging.warning('idempotency store unavailable', exc_info=True)
+        return None, False
+
+    def complete(self, key: str, order_id: int) -> None:
+        from redis import RedisError
+        try:
+            self.redis.set(self.PREFIX + key, order_id, ex=self.ttl)
+        except RedisError:
+            logging.warning('idempotency store unavailable', exc_info=True)
+
+    def release(self, key: str) -> None:
+        from redis import RedisError
+        try:
+            self.redis.delete(self.PREFIX + key)
+        except RedisError:
+            logging.warning('idempotency store unavailable', exc_info=True)
+
+
+_lock = threading.Lock()
+
+
+def get_store():
+    """Return the store of the current app, creating it on first use."""
+    app = current_app._get_current_object()
+    store = app.extensions.get('idempotency_store')
+    if store is None:
+        with _lock:
+            store = app.extensions.get('idempotency_store')
+            if store is None:
+                ttl = app.config.get('IDEMPOTENCY_TTL', 86400)
+                if app.config.get('IDEMPOTENCY_BACKEND') == 'redis':
+                    store = RedisStore(app.config['REDIS_URL'], ttl)
+                else:
+                    store = MemoryStore(app.config.get('IDEMPOTENCY_MAX_KEYS', 10000), ttl)
+                app.extensions['idempotency_store'] = store
+    return store
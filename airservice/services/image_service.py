@@ -0,0 +1,161 @@
+"""Resized WebP derivatives of catalog images.
+
+Every image under ``static/images`` is available in the sizes listed in
+``VARIANTS``. A derivative URL embeds a digest of the source file and the
+variant settings, so it never changes meaning and can be cached forever;
+replacing a source image yields new URLs. Derivatives are written to
+``IMAGE_CACHE_DIR`` by ``flask build-image-derivatives`` or on the first
+request for a missing one.
+
+Pillow is an optional dependency: without it (or with ``IMAGE_DERIVATIVES``
+off) the original files are linked instead.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from typing import Dict, Iterator, NamedTuple, Tuple
+
+from flask import current_app, url_for
+from werkzeug.security import safe_join
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = None
+
+
+class Variant(NamedTuple):
+    width: int
+    height: int
+    quality: int
+
+
+VARIANTS: Dict[str, Variant] = {
+    'thumb': Variant(160, 160, 75),
+    'card': Variant(480, 480, 80),
+    'detail': Variant(1080, 1080, 85),
+}
+# variant used where a single image URL is expected
+DEFAULT_VARIANT = 'card'
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+# bumping this invalidates every derivative URL
+PIPELINE_VERSION = '1'
+
+# (path, mtime_ns, size) -> sha256 of the source file
+_source_digests: Dict[Tuple[str, int, int], str] = {}
+_digest_lock = threading.Lock()
+
+
+def require_pillow() -> None:
+    if Image is None:
+        raise RuntimeError('Image derivatives require the Pillow package')
+
+
+def enabled() -> bool:
+    return Image is not None and bool(current_app.config.get('IMAGE_DERIVATIVES'))
+
+
+def images_dir() -> str:
+    return os.path.join(current_app.root_path, 'static', 'images')
+
+
+def cache_dir() -> str:
+    return current_app.config.get('IMAGE_CACHE_DIR') or os.path.join(
+        current_app.instance_path, 'image-cache'
+    )
+
+
+def source_path(filename: str) -> str | None:
+    path = safe_join(images_dir(), filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
+
+def _source_digest(path: str) -> str:
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    digest = _source_digests.get(key)
+    if digest is None:
+        with open(path, 'rb') as fh:
+            digest = hashlib.file_digest(fh, 'sha256').hexdigest()
+        with _digest_lock:
+            _source_digests[key] = digest
+    return digest
+
+
+def digest(path: str, variant: str) -> str:
+    """Content hash of the ``variant`` derivative of the source at ``path``."""
+    spec = f'{PIPELINE_VERSION}:{variant}:{VARIANTS[variant]}:{_source_digest(path)}'
+    return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+
+def derivative_path(variant: str, digest_: str) -> str:
+    return os.path.join(cache_dir(), variant, f'{digest_}.webp')
+
+
+def generate(path: str, variant: str) -> str:
+    """Write the derivative of ``path`` unless it exists; return its file path."""
+    target = derivative_path(variant, digest(path, variant))
+    if os.path.exists(target):
+        return target
+    spec = VARIANTS[variant]
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((spec.width, spec.height), Image.LANCZOS)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        # write under a temporary name so concurrent requests never see
+        # a partially written file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                img.save(fh, 'WEBP', quality=spec.quality, method=4)
+            os.replace(tmp, target)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    logging.info('Generated %s derivative of %s', variant, path)
+    return target
+
+
+def image_url(filename: str | None, variant: str = DEFAULT_VARIANT) -> str | None:
+    """URL of the ``variant`` derivative of ``filename``, or of the original."""
+    if not filename:
+        return None
+    if enabled():
+        path = source_path(filename)
+        if path is not None:
+            return url_for('serve_image_variant', variant=variant,
+                           digest=digest(path, variant), filename=filename)
+    return url_for('serve_image', filename=filename)
+
+
+def image_urls(filename: str | None) -> Dict[str, str] | None:
+    """URLs of every derivative of ``filename``, keyed by variant name."""
+    if not filename:
+        return None
+    return {variant: image_url(filename, variant) for variant in VARIANTS}
+
+
+def iter_sources() -> Iterator[str]:
+    root = images_dir()
+    for dirpath, _, files in os.walk(root):
+        for name in sorted(files):
+            if name.lower().endswith(SOURCE_EXTENSIONS):
+                yield os.path.join(dirpath, name)
+
+
+def build_all() -> int:
+    """Generate all missing derivatives; return how many files were written."""
+    require_pillow()
+    written = 0
+    for path in iter_sources():
+        for variant in VARIANTS:
+            if not os.path.exists(derivative_path(variant, digest(path, variant))):
+                generate(path, variant)
+                written += 1
+    return written
@@ -2,6 +2,8 @@ import logging
 from typing import Any, Dict
 
 from ..models import db, Item
+from ..sqlite_profile import retry_on_busy
+from . import catalog_service, changes_service, search_service
 
 
 FIELD_MAP = {
@@ -17,6 +19,7 @@ FIELD_MAP = {
 }
 
 
+@retry_on_busy
 def create_item(data: Dict[str, Any]) -> Item:
     item = Item(
         name_ru=data.get('name_ru'),
@@ -30,21 +33,33 @@ def create_item(data: Dict[str, Any]) -> Item:
         category_id=data.get('category_id'),
     )
     db.session.add(item)
+    search_service.index_item(item)
+    revision = changes_service.stamp(item)
     db.session.commit()
+    catalog_service.item_changed(item.id, revision)
     logging.info('item_created %s', item.id)
     return item
 
 
+@retry_on_busy
 def update_item(item: Item, data: Dict[str, Any]) -> Item:
     for key, attr in FIELD_MAP.items():
         if key in data:
             setattr(item, attr, data[key])
+    search_service.index_item(item)
+    revision = changes_service.stamp(item)
     db.session.commit()
+    catalog_service.item_changed(item.id, revision)
     logging.info('item_updated %s', item.id)
     return item
 
 
+@retry_on_busy
 def delete_item(item: Item) -> None:
+    item_id = item.id
+    search_service.remove_item(item_id)
+    revision = changes_service.tombstone(changes_service.ITEM, item_id)
     db.session.delete(item)
     db.session.commit()
-    logging.info('item_deleted %s', item.id)
+    catalog_service.item_changed(item_id, revision)
+    logging.info('item_deleted %s', item_id)
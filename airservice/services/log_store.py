@@ -0,0 +1,406 @@
+"""Segmented server log behind ``/admin/logs``.
+
+Log records are appended to segment files under ``LOG_DIR``. A segment holds
+one ``LOG_SEGMENT_SECONDS`` time partition and is rotated early once it
+reaches ``LOG_SEGMENT_MAX_BYTES``; every process writes its own segments.
+When a segment is sealed, a ``.idx`` sidecar is written next to it. The
+sidecar holds the byte offsets of its lines sorted by time, plus postings
+lists of line positions per ``user`` and ``endpoint``.
+
+A search skips segments outside the requested window and bisects the
+sorted times of the rest. It then reads only the lines whose postings
+match, merging segments newest first. Segments without an up-to-date
+sidecar (the one being written by another process, or one left by a
+crash) are indexed from where their sidecar stops on first use.
+"""
+import base64
+import heapq
+import json
+import logging
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from time import gmtime, strftime
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+SEGMENT_SUFFIX = '.log'
+INDEX_SUFFIX = '.idx'
+
+# position of a line among all segments: (timestamp, segment name, byte offset)
+Key = Tuple[float, str, int]
+
+_formatter = logging.Formatter()
+if orjson is not None:
+    def _dumps(entry: dict) -> str:
+        return orjson.dumps(entry).decode()
+else:
+    _dumps = json.JSONEncoder(ensure_ascii=False, check_circular=False, separators=(',', ':')).encode
+
+
+def format_line(record: logging.LogRecord, ts: float, user: str, endpoint: str) -> str:
+    """One JSON log line with the fields searched by ``/admin/logs``."""
+    entry = {
+        'timestamp': datetime.fromtimestamp(ts, timezone.utc).isoformat(),
+        'user': user,
+        'endpoint': endpoint,
+        'message': record.getMessage(),
+    }
+    if record.exc_info and not record.exc_text:
+        record.exc_text = _formatter.formatException(record.exc_info)
+    if record.exc_text:
+        entry['exc_info'] = record.exc_text
+    return _dumps(entry)
+
+
+def to_epoch(value: str | datetime) -> float:
+    """Seconds since the epoch; naive timestamps are taken as UTC."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def encode_cursor(key: Key) -> str:
+    raw = json.dumps(list(key), separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Key:
+    """Return the key of ``cursor`` or raise ``ValueError``."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        ts, name, offset = json.loads(raw)
+        if not isinstance(ts, (int, float)) or not isinstance(name, str) or not isinstance(offset, int):
+            raise ValueError('malformed cursor')
+        return float(ts), name, offset
+    except (ValueError, TypeError):
+        raise ValueError('malformed cursor')
+
+
+class _View(NamedTuple):
+    """Consistent snapshot of a segment index: the first ``n`` lines."""
+    times: array
+    offsets: array
+    users: Dict[str, array]
+    endpoints: Dict[str, array]
+    n: int
+
+
+class SegmentIndex:
+    """Lines of one segment sorted by ``(time, offset)`` with postings."""
+
+    def __init__(self):
+        self.size = 0  # bytes of the segment covered by the index
+        self.times = array('d')
+        self.offsets = array('q')
+        self.users: Dict[str, array] = {}
+        self.endpoints: Dict[str, array] = {}
+
+    def add(self, ts: float, offset: int, user: str, endpoint: str, end: int) -> None:
+        if self.times and ts < self.times[-1]:
+            self._rebuild([(ts, offset, user, endpoint)])
+        else:
+            pos = len(self.times)
+            self.times.append(ts)
+            self.offsets.append(offset)
+            self.users.setdefault(user, array('q')).append(pos)
+            self.endpoints.setdefault(endpoint, array('q')).append(pos)
+        self.size = end
+
+    def _rebuild(self, extra) -> None:
+        # out-of-order lines are rare (imports, clock changes); re-sort into
+        # new arrays so views taken by concurrent searches stay valid
+        n = len(self.times)
+        user_of, endpoint_of = [''] * n, [''] * n
+        for postings, target in ((self.users, user_of), (self.endpoints, endpoint_of)):
+            for value, positions in postings.items():
+                for pos in positions:
+                    target[pos] = value
+        rows = sorted(list(zip(self.times, self.offsets, user_of, endpoint_of)) + extra,
+                      key=lambda r: (r[0], r[1]))
+        self.times = array('d', (r[0] for r in rows))
+        self.offsets = array('q', (r[1] for r in rows))
+        self.users, self.endpoints = {}, {}
+        for pos, (_, _, user, endpoint) in enumerate(rows):
+            self.users.setdefault(user, array('q')).append(pos)
+            self.endpoints.setdefault(endpoint, array('q')).append(pos)
+
+    def view(self) -> _View:
+        return _View(self.times, self.offsets, self.users, self.endpoints, len(self.times))
+
+    def dump(self, path: str) -> None:
+        data = {
+            'size': self.size,
+            'times': self.times.tolist(),
+            'offsets': self.offsets.tolist(),
+            'users': {k: v.tolist() for k, v in self.users.items()},
+            'endpoints': {k: v.tolist() for k, v in self.endpoints.items()},
+        }
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'SegmentIndex':
+        with open(path) as f:
+            data = json.load(f)
+        index = cls()
+        index.size = data['size']
+        index.times = array('d', data['times'])
+        index.offsets = array('q', data['offsets'])
+        index.users = {k: array('q', v) for k, v in data['users'].items()}
+        index.endpoints = {k: array('q', v) for k, v in data['endpoints'].items()}
+        return index
+
+
+class _Segment(NamedTuple):
+    name: str
+    partition: int
+    file: object
+    index: SegmentIndex
+
+
+class LogStore:
+    """Writes log lines into segments and searches them."""
+
+    def __init__(self, directory: str, segment_seconds: int = 3600, max_bytes: int = 16 * 1024 * 1024):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.max_bytes = max_bytes
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._active: _Segment | None = None
+        self._last_ts = 0.0
+        self._indexes: Dict[str, SegmentIndex] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _open(self, partition: int) -> _Segment:
+        stamp = strftime('%Y%m%dT%H%M%S', gmtime(partition * self.segment_seconds))
+        seq = 0
+        while True:
+            name = f'{stamp}-{os.getpid()}-{seq:04d}{SEGMENT_SUFFIX}'
+            try:
+                f = open(self._path(name), 'xb')
+            except FileExistsError:
+                seq += 1
+                continue
+            return _Segment(name, partition, f, SegmentIndex())
+
+    def _seal(self) -> None:
+        active, self._active = self._active, None
+        if active is None:
+            return
+        active.file.close()
+        active.index.dump(self._path(active.name[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX))
+        with self._read_lock:
+            self._indexes[active.name] = active.index
+
+    def write(self, line: str, ts: float, user: str = '', endpoint: str = '') -> None:
+        """Append one JSON line stamped ``ts`` (seconds since the epoch)."""
+        with self._write_lock:
+            self._append([(line, ts, user, endpoint)])
+
+    def write_records(self, records: Iterable[logging.LogRecord]) -> None:
+        """Format and append log records with one write per segment touched.
+
+        Lines are stamped no earlier than the previous one, so the segments of
+        a process stay in time order even if records were created out of order.
+        """
+        with self._write_lock:
+            items = []
+            for record in records:
+                ts = self._last_ts = max(record.created, self._last_ts)
+                user, endpoint = getattr(record, 'user', ''), getattr(record, 'endpoint', '')
+                items.append((format_line(record, ts, user, endpoint), ts, user, endpoint))
+            self._append(items)
+
+    def _append(self, items: Iterable[Tuple[str, float, str, str]]) -> None:
+        chunks: List[bytes] = []
+        for line, ts, user, endpoint in items:
+            data = line.encode() + b'\n'
+            partition = int(ts // self.segment_seconds)
+            active = self._active
+            if active is None or active.partition != partition or (
+                    active.index.size and active.index.size + len(data) > self.max_bytes):
+                if chunks:
+                    active.file.write(b''.join(chunks))
+                    chunks = []
+                self._seal()
+                active = self._active = self._open(partition)
+            offset = active.index.size
+            chunks.append(data)
+            active.index.add(ts, offset, user or '', endpoint or '', offset + len(data))
+        if chunks:
+            self._active.file.write(b''.join(chunks))
+            self._active.file.flush()
+
+    def import_file(self, path: str) -> int:
+        """Append the entries of a JSON-lines log file; returns how many."""
+        count = 0
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    ts = to_epoch(entry['timestamp'])
+                except (ValueError, KeyError, TypeError):
+                    continue
+                self.write(line.rstrip('\n'), ts, entry.get('user'), entry.get('endpoint'))
+                count += 1
+        return count
+
+    def close(self) -> None:
+        with self._write_lock:
+            self._seal()
+
+    def _scan(self, name: str, index: SegmentIndex) -> None:
+        """Index the complete lines written after ``index.size``."""
+        with open(self._path(name), 'rb') as f:
+            f.seek(index.size)
+            offset = index.size
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break  # still being written
+                end = offset + len(raw)
+                try:
+                    entry = json.loads(raw)
+                    ts = to_epoch(entry['timestamp'])
+                except (ValueError, KeyError, TypeError):
+                    index.size = end
+                else:
+                    index.add(ts, offset, entry.get('user') or '', entry.get('endpoint') or '', end)
+                offset = end
+
+    def _view(self, name: str) -> _View:
+        with self._write_lock:
+            active = self._active
+            if active is not None and active.name == name:
+                return active.index.view()
+        with self._read_lock:
+            index = self._indexes.get(name)
+            if index is None:
+                sidecar = self._path(name[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX)
+                index = SegmentIndex.load(sidecar) if os.path.exists(sidecar) else SegmentIndex()
+                self._indexes[name] = index
+            if index.size < os.path.getsize(self._path(name)):
+                self._scan(name, index)
+            return index.view()
+
+    def segments(self) -> List[str]:
+        return sorted(n for n in os.listdir(self.directory) if n.endswith(SEGMENT_SUFFIX))
+
+    def search(self, start: datetime | None = None, end: datetime | None = None, user: str | None = None,
+               endpoint: str | None = None, text: str | None = None, before: Key | None = None,
+               limit: int | None = None) -> Tuple[List[dict], Key | None]:
+        """Return matching entries newest first and the key to continue from.
+
+        ``start`` and ``end`` are inclusive; ``before`` is a key returned by a
+        previous call. The key is ``None`` when there are no more entries.
+        """
+        lo = to_epoch(start) if start is not None else None
+        hi = to_epoch(end) if end is not None else None
+        streams = []
+        for name in self.segments():
+            view = self._view(name)
+            if not view.n or (lo is not None and view.times[view.n - 1] < lo) \
+                    or (hi is not None and view.times[0] > hi):
+                continue
+            streams.append(_candidates(name, view, lo, hi, user, endpoint, before))
+
+        entries: List[dict] = []
+        last = next_key = None
+        files = {}
+        try:
+            for key in heapq.merge(*streams, reverse=True):
+                f = files.get(key[1])
+                if f is None:
+                    f = files[key[1]] = open(self._path(key[1]), 'rb')
+                f.seek(key[2])
+                entry = json.loads(f.readline())
+                if text and text not in entry.get('message', ''):
+                    continue
+                if limit is not None and len(entries) == limit:
+                    next_key = last
+                    break
+                entries.append(entry)
+                last = key
+        finally:
+            for f in files.values():
+                f.close()
+        return entries, next_key
+
+
+def _contains(postings: array, pos: int) -> bool:
+    i = bisect_left(postings, pos)
+    return i < len(postings) and postings[i] == pos
+
+
+def _candidates(name: str, view: _View, lo: float | None, hi: float | None, user: str | None,
+                endpoint: str | None, before: Key | None) -> Iterator[Key]:
+    """Keys of the lines of one segment that can match, newest first."""
+    times, offsets, n = view.times, view.offsets, view.n
+    first = bisect_left(times, lo, 0, n) if lo is not None else 0
+    stop = bisect_right(times, hi, 0, n) if hi is not None else n
+    if before is not None:
+        ts, cursor_name, cursor_offset = before
+        if name < cursor_name:
+            stop = min(stop, bisect_right(times, ts, 0, n))
+        elif name > cursor_name:
+            stop = min(stop, bisect_left(times, ts, 0, n))
+        else:
+            cut = bisect_left(times, ts, 0, n)
+            while cut < n and times[cut] == ts and offsets[cut] < cursor_offset:
+                cut += 1
+            stop = min(stop, cut)
+
+    lists = []
+    if user is not None:
+        lists.append(view.users.get(user, array('q')))
+    if endpoint is not None:
+        lists.append(view.endpoints.get(endpoint, array('q')))
+    if not lists:
+        positions = range(stop - 1, first - 1, -1)
+    else:
+        lists.sort(key=len)
+        driver, others = lists[0], lists[1:]
+        positions = (
+            driver[i] for i in range(bisect_left(driver, stop) - 1, bisect_left(driver, first) - 1, -1)
+            if all(_contains(o, driver[i]) for o in others)
+        )
+    for pos in positions:
+        yield times[pos], name, offsets[pos]
+
+
+class SegmentedLogHandler(logging.Handler):
+    """Logging handler writing records into a ``LogStore`` on the calling thread."""
+
+    def __init__(self, store: LogStore):
+        super().__init__()
+        self.store = store
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.store.write_records([record])
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        self.store.close()
+        super().close()
+
+
+def get_store() -> LogStore:
+    return current_app.extensions['log_store']
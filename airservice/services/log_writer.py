@@ -0,0 +1,127 @@
+"""Queued log writing.
+
+With ``LOG_ASYNC`` enabled (the default), the root logger hands records to a
+``LogQueueHandler``. On the request thread the handler only resolves the
+message, the request user and the endpoint, then puts the record on a
+bounded queue. A single writer thread wakes up at most every
+``LOG_FLUSH_INTERVAL_MS``, drains up to ``LOG_BATCH_SIZE`` records, formats
+them, and appends the whole batch to the ``LogStore`` with one write.
+
+When the queue (``LOG_QUEUE_SIZE`` records) is full, ``LOG_QUEUE_OVERFLOW``
+decides what happens. ``drop`` discards the new record, and the writer
+later logs how many were lost. ``block`` makes the logging call wait for
+room.
+"""
+import logging
+import queue
+import threading
+import time
+import traceback
+from logging.handlers import QueueHandler
+from typing import List, Tuple
+
+from .log_store import LogStore
+
+OVERFLOW_POLICIES = ('drop', 'block')
+_STOP = object()
+
+
+class LogWriter:
+    """Writer thread appending queued records to a ``LogStore`` in batches."""
+
+    def __init__(self, store: LogStore, records: queue.Queue, batch_size: int = 512, interval: float = 0.05):
+        self.store = store
+        self.queue = records
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0  # counted by the handler, reported by the writer
+        self.dropped_lock = threading.Lock()
+        self._reported = 0
+        self.thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Write what is queued and stop the thread."""
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def _collect(self) -> Tuple[List[logging.LogRecord], bool]:
+        first = self.queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        if self.queue.qsize() < self.batch_size:
+            # sleeping instead of waiting on the queue means records logged
+            # meanwhile do not wake the writer one by one
+            time.sleep(self.interval)
+        while len(batch) < self.batch_size:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is _STOP:
+                return batch, True
+            batch.append(record)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            taken = len(batch) + stopping
+            dropped = self.dropped - self._reported
+            if dropped:
+                self._reported += dropped
+                batch.append(logging.makeLogRecord({
+                    'msg': 'log_records_dropped %d', 'args': (dropped,), 'levelno': logging.WARNING,
+                    'levelname': 'WARNING', 'user': 'system', 'endpoint': '',
+                }))
+            try:
+                self.store.write_records(batch)
+            except Exception:
+                # the log itself is failing; report on stderr like Handler.handleError
+                traceback.print_exc()
+            finally:
+                for _ in range(taken):
+                    self.queue.task_done()
+
+
+class LogQueueHandler(QueueHandler):
+    """Root handler putting records on the writer queue."""
+
+    def __init__(self, store: LogStore, size: int = 10000, overflow: str = 'drop', batch_size: int = 512,
+                 interval: float = 0.05):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'LOG_QUEUE_OVERFLOW must be one of {", ".join(OVERFLOW_POLICIES)}')
+        super().__init__(queue.Queue(maxsize=size))
+        self.overflow = overflow
+        self.writer = LogWriter(store, self.queue, batch_size, interval)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # arguments may change once the call returns, so resolve the message
+        # now; the writer formats everything else
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.overflow == 'block':
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.writer.dropped_lock:
+                self.writer.dropped += 1
+
+    def flush(self) -> None:
+        """Wait until every queued record has been written."""
+        self.queue.join()
+
+    def close(self) -> None:
+        if self.writer.thread.is_alive():
+            self.writer.stop()
+            self.writer.store.close()
+        super().close()
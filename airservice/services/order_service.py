@@ -1,57 +1,371 @@
+import base64
+import json
 import logging
-from typing import List, Tuple
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, NamedTuple, Tuple
 from flask_babel import gettext
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
 
 from ..models import db, Item, Order, OrderItem
 from ..events import push_event
+from ..sqlite_profile import retry_on_busy
+from . import sales_service
 
 
-def create_order(seat: str, items: List[dict], *, payment_method: str | None = None, idempotency_key: str | None = None) -> Tuple[Order, bool]:
+class NewOrder(NamedTuple):
+    seat: str
+    items: List[dict]
+    payment_method: str | None = None
+    idempotency_key: str | None = None
+
+
+def item_prices(item_ids) -> Dict[int, Any]:
+    """Load price, kind and category of the given items with one query."""
+    return {
+        r.id: r for r in db.session.execute(
+            select(Item.id, Item.price, Item.is_service, Item.category_id).where(Item.id.in_(set(item_ids)))
+        )
+    }
+
+
+def price_lines(items: List[dict], prices: Dict[int, Any] | None = None) -> List[dict]:
+    """Return order lines with the current unit price of each item.
+
+    ``prices`` from ``item_prices`` can be shared between orders; otherwise
+    one query is made. Raises ``ValueError`` listing unknown item ids.
+    """
+    requested = [it.get("item_id") for it in items]
+    known = prices if prices is not None else item_prices(requested)
+    missing_ids = [item_id for item_id in requested if item_id not in known]
+    if missing_ids:
+        raise ValueError(
+            gettext('Invalid item IDs: %(ids)s') % {'ids': missing_ids}
+        )
+    return [
+        {
+            "item_id": it["item_id"],
+            "quantity": it.get("quantity", 1),
+            "unit_price": known[it["item_id"]].price,
+            "unit_price_minor": sales_service.minor_units(known[it["item_id"]].price),
+            "is_service": known[it["item_id"]].is_service,
+            "category_id": known[it["item_id"]].category_id,
+        }
+        for it in items
+    ]
+
+
+def _totals(lines: List[dict]) -> dict:
+    return {
+        "total": sum(line["unit_price"] * line["quantity"] for line in lines),
+        "item_count": sum(line["quantity"] for line in lines),
+    }
+
+
+def _line_rows(order_id: int, lines: List[dict]) -> List[dict]:
+    return [dict(line, order_id=order_id) for line in lines]
+
+
+def _order_created(order_id: int, seat: str) -> None:
+    logging.info("order_created %s seat=%s", order_id, seat)
+    push_event({"type": "order_created", "order_id": order_id})
+
+
+@retry_on_busy
+def create_order(seat: str, items: List[dict], *, payment_method: str | None = None, idempotency_key: str | None = None, notify: bool = True) -> Tuple[Order, bool]:
     """Create a new order with given items.
 
-    Returns a tuple of (order, created) where created=False means an order with
-    the provided idempotency key already existed.
+    Item ids are validated with one query and the order is inserted together
+    with its lines in a single transaction. Returns a tuple of (order, created)
+    where created=False means an order with the provided idempotency key
+    already existed.
     """
     if idempotency_key:
         existing = Order.query.filter_by(idempotency_key=idempotency_key).first()
         if existing:
             return existing, False
 
-    missing_ids = []
-    validated_items: list[tuple[Item, int]] = []
-    for it in items:
-        item_id = it.get("item_id")
-        item = db.session.get(Item, item_id)
-        if not item:
-            missing_ids.append(item_id)
-        else:
-            validated_items.append((item, it.get("quantity", 1)))
-    if missing_ids:
-        raise ValueError(
-            gettext('Invalid item IDs: %(ids)s') % {'ids': missing_ids}
-        )
-
-    order = Order(seat=seat, idempotency_key=idempotency_key, payment_method=payment_method)
+    lines = price_lines(items)
+    order = Order(seat=seat, idempotency_key=idempotency_key, payment_method=payment_method,
+                  **_totals(lines))
     db.session.add(order)
-    db.session.commit()
-
-    for item, qty in validated_items:
-        oi = OrderItem(order_id=order.id, item_id=item.id, quantity=qty)
-        db.session.add(oi)
-    db.session.commit()
-    logging.info("order_created %s seat=%s", order.id, order.seat)
-    push_event({"type": "order_created", "order_id": order.id})
+    try:
+        db.session.flush()
+        if lines:
+            db.session.execute(insert(OrderItem), _line_rows(order.id, lines))
+            sales_service.add_orders([(order.created_at, lines)])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # a concurrent request with the same key won the race
+        existing = idempotency_key and Order.query.filter_by(idempotency_key=idempotency_key).first()
+        if not existing:
+            raise
+        return existing, False
+    if notify:
+        _order_created(order.id, order.seat)
     return order, True
 
 
+@retry_on_busy
+def create_orders(orders: List[NewOrder], *, coalesce_events: bool = False) -> List[Tuple[int, bool] | ValueError]:
+    """Insert orders priced by ``price_lines`` in one transaction.
+
+    Returns ``(order_id, created)`` per order. Keys already stored, or
+    repeated within the batch, resolve to the existing order. If the batch
+    conflicts with a concurrent writer, orders are retried one by one; an
+    order that can no longer be stored then (e.g. an item was deleted in
+    between) gets the ``ValueError`` in its place instead of failing the rest.
+    With ``coalesce_events`` a single ``orders_created`` event lists all new
+    orders instead of one ``order_created`` event per order.
+    """
+    keys = {o.idempotency_key for o in orders if o.idempotency_key}
+    known = dict(db.session.execute(
+        select(Order.idempotency_key, Order.id).where(Order.idempotency_key.in_(keys))
+    ).all()) if keys else {}
+
+    new: dict[str | None, Order] = {}
+    placed = []
+    for o in orders:
+        if o.idempotency_key in known or o.idempotency_key in new:
+            placed.append((o, None))
+            continue
+        row = Order(seat=o.seat, idempotency_key=o.idempotency_key,
+                    payment_method=o.payment_method, **_totals(o.items))
+        db.session.add(row)
+        placed.append((o, row))
+        if o.idempotency_key:
+            new[o.idempotency_key] = row
+    try:
+        db.session.flush()
+        lines = [line for o, row in placed if row is not None for line in _line_rows(row.id, o.items)]
+        if lines:
+            db.session.execute(insert(OrderItem), lines)
+            sales_service.add_orders((row.created_at, o.items) for o, row in placed if row is not None)
+        # read ids before commit expires the rows
+        ids = [row.id if row is not None else None for _, row in placed]
+        known.update((key, row.id) for key, row in new.items())
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        results = []
+        for o in orders:
+            try:
+                order, was_created = create_order(
+                    o.seat, o.items, payment_method=o.payment_method,
+                    idempotency_key=o.idempotency_key, notify=not coalesce_events,
+                )
+            except ValueError as err:
+                results.append(err)
+                continue
+            results.append((order.id, was_created))
+    else:
+        results = []
+        for (o, row), order_id in zip(placed, ids):
+            if row is None:
+                results.append((known[o.idempotency_key], False))
+            else:
+                if not coalesce_events:
+                    _order_created(order_id, o.seat)
+                results.append((order_id, True))
+    if coalesce_events:
+        created = [r[0] for r in results if not isinstance(r, ValueError) and r[1]]
+        if created:
+            logging.info("orders_created %s", ','.join(map(str, created)))
+            push_event({"type": "orders_created", "order_ids": created})
+    return results
+
+
 def get_order(order_id: int) -> Order | None:
     return db.session.get(Order, order_id)
 
 
+class OrderLine(NamedTuple):
+    item_id: int
+    name_ru: str | None
+    name_en: str | None
+    price: float
+    quantity: int
+
+
+class OrderView(NamedTuple):
+    id: int
+    seat: str
+    status: str
+    created_at: datetime
+    payment_method: str | None
+    total: float
+    item_count: int
+    lines: List[OrderLine]
+
+
+def order_views(*criteria, order_by=(Order.id,), limit: int | None = None) -> List[OrderView]:
+    """Load orders matching ``criteria`` together with their lines.
+
+    With ``limit`` only the first orders are loaded; they are picked by a
+    subquery so the limit does not cut off lines.
+
+    Orders, lines and item names come from a single joined query and are
+    returned as plain tuples rather than session-tracked ORM objects. Prices
+    and totals are the ones stored with the order.
+    """
+    rows = db.session.query(
+        Order.id, Order.seat, Order.status, Order.created_at, Order.payment_method,
+        Order.total, Order.item_count,
+        OrderItem.item_id, Item.name_ru, Item.name_en, OrderItem.unit_price,
+        OrderItem.quantity,
+    ).outerjoin(OrderItem, OrderItem.order_id == Order.id) \
+        .outerjoin(Item, Item.id == OrderItem.item_id)
+    if limit is not None:
+        page = select(Order.id).where(*criteria).order_by(*order_by).limit(limit)
+        rows = rows.filter(Order.id.in_(page))
+    else:
+        rows = rows.filter(*criteria)
+    rows = rows.order_by(*order_by, OrderItem.id)
+    views: dict[int, OrderView] = {}
+    for r in rows:
+        view = views.get(r.id)
+        if view is None:
+            view = views[r.id] = OrderView(
+                r.id, r.seat, r.status, r.created_at, r.payment_method,
+                r.total or 0.0, r.item_count or 0, [],
+            )
+        if r.item_id is not None:
+            view.lines.append(OrderLine(r.item_id, r.name_ru, r.name_en, r.unit_price, r.quantity))
+    return list(views.values())
+
+
+# orders per chunk when streaming an export
+EXPORT_CHUNK = 500
+
+
+def iter_order_views(*criteria, chunk: int | None = None) -> Iterator[OrderView]:
+    """Yield orders matching ``criteria`` by id, with their lines, in chunks.
+
+    Orders are read with ``yield_per`` (a server-side cursor where the
+    driver has one) and the lines of each chunk of ``chunk`` orders are
+    loaded with one ``IN`` query, so memory use does not grow with the
+    number of orders.
+    """
+    chunk = chunk or EXPORT_CHUNK
+    orders = db.session.execute(
+        select(
+            Order.id, Order.seat, Order.status, Order.created_at, Order.payment_method,
+            Order.total, Order.item_count,
+        ).where(*criteria).order_by(Order.id).execution_options(yield_per=chunk)
+    )
+    for part in orders.partitions():
+        lines: dict[int, List[OrderLine]] = {r.id: [] for r in part}
+        for r in db.session.execute(
+            select(
+                OrderItem.order_id, OrderItem.item_id, Item.name_ru, Item.name_en,
+                OrderItem.unit_price, OrderItem.quantity,
+            ).outerjoin(Item, Item.id == OrderItem.item_id)
+            .where(OrderItem.order_id.in_(list(lines)))
+            .order_by(OrderItem.order_id, OrderItem.id)
+        ):
+            lines[r.order_id].append(OrderLine(r.item_id, r.name_ru, r.name_en, r.unit_price, r.quantity))
+        for r in part:
+            yield OrderView(
+                r.id, r.seat, r.status, r.created_at, r.payment_method,
+                r.total or 0.0, r.item_count or 0, lines[r.id],
+            )
+
+
+def history_page(seat: str, status: str | None = None, *,
+                 after: Tuple[datetime, int] | None = None, limit: int | None = None) -> Tuple[List[OrderView], Tuple[datetime, int] | None]:
+    """Return a seat's orders by ``(created_at, id)`` and the key of the next page.
+
+    ``after`` is the key returned with the previous page.
+    """
+    criteria = [Order.seat == seat]
+    if status:
+        if db.session.get_bind().dialect.name == 'sqlite':
+            # compared as an expression so SQLite, which has no statistics to
+            # tell them apart, walks the seat index rather than the status one
+            criteria.append(Order.status.concat('') == status)
+        else:
+            criteria.append(Order.status == status)
+    if after is not None:
+        created_at, last_id = after
+        # the redundant >= lets the index seek to the page start
+        criteria.append(Order.created_at >= created_at)
+        criteria.append((Order.created_at > created_at) | (Order.id > last_id))
+    order_by = (Order.created_at, Order.id)
+    if limit is None:
+        return order_views(*criteria, order_by=order_by), None
+    views = order_views(*criteria, order_by=order_by, limit=limit + 1)
+    if len(views) <= limit:
+        return views, None
+    views = views[:limit]
+    return views, (views[-1].created_at, views[-1].id)
+
+
+def encode_cursor(key: Tuple[datetime, int]) -> str:
+    raw = json.dumps([key[0].isoformat(), key[1]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Return the ``(created_at, id)`` key of ``cursor`` or raise ``ValueError``."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, last_id = json.loads(raw)
+        if not isinstance(last_id, int):
+            raise ValueError('malformed cursor')
+        return datetime.fromisoformat(created_at), last_id
+    except (ValueError, TypeError):
+        raise ValueError('malformed cursor')
+
+
+def get_order_view(order_id: int) -> OrderView | None:
+    views = order_views(Order.id == order_id)
+    return views[0] if views else None
+
+
+def backfill_totals() -> int:
+    """Fill prices and totals of orders stored without them.
+
+    For bulk loads that bypass ``create_order``; lines take the current item
+    price and category, and the sales rollup is rebuilt. Returns the number
+    of orders updated.
+    """
+    item = Item.__table__
+    line = OrderItem.__table__
+    db.session.execute(
+        update(line).where(line.c.unit_price.is_(None)).values(
+            unit_price=select(item.c.price).where(item.c.id == line.c.item_id).scalar_subquery(),
+            is_service=select(item.c.is_service).where(item.c.id == line.c.item_id).scalar_subquery(),
+            category_id=select(item.c.category_id).where(item.c.id == line.c.item_id).scalar_subquery(),
+        )
+    )
+    order = Order.__table__
+    result = db.session.execute(
+        update(order).where(order.c.total.is_(None)).values(
+            total=select(db.func.coalesce(db.func.sum(line.c.quantity * line.c.unit_price), 0))
+            .where(line.c.order_id == order.c.id).scalar_subquery(),
+            item_count=select(db.func.coalesce(db.func.sum(line.c.quantity), 0))
+            .where(line.c.order_id == order.c.id).scalar_subquery(),
+        )
+    )
+    sales_service.rebuild()
+    return result.rowcount
+
+
+@retry_on_busy
 def update_order_status(order_id: int, status: str) -> Order | None:
-    order = db.session.get(Order, order_id)
+    # the rollup is adjusted from the old status, so concurrent changes of
+    # the same order must wait for this one to commit
+    order = db.session.get(Order, order_id, with_for_update=True)
     if not order:
         return None
+    cancelled = sales_service.CANCELLED
+    if (order.status == cancelled) != (status == cancelled):
+        lines = db.session.execute(
+            select(OrderItem.unit_price_minor, OrderItem.quantity, OrderItem.is_service, OrderItem.category_id)
+            .where(OrderItem.order_id == order.id, OrderItem.unit_price_minor.is_not(None))
+        ).mappings()
+        sales_service.add_orders([(order.created_at, lines)], sign=-1 if status == cancelled else 1)
     order.status = status
     db.session.commit()
     logging.info("order_status_change %s status=%s", order.id, status)
@@ -0,0 +1,107 @@
+"""Group commit for order intake.
+
+With ``ORDER_GROUP_COMMIT`` enabled, ``POST /orders`` validates the order in
+the request thread and hands it to a single writer thread. The writer
+collects the orders that arrive within ``ORDER_GROUP_COMMIT_WINDOW_MS`` (up
+to ``ORDER_GROUP_COMMIT_MAX_BATCH``) and stores them in one transaction, so
+a burst of orders costs one commit instead of one per request and requests
+no longer compete for the SQLite write lock.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Tuple
+
+from flask import Flask, current_app
+
+from ..models import db
+from . import order_service
+
+# how long a request waits for the writer before giving up
+SUBMIT_TIMEOUT = 30.0
+_STOP = object()
+
+
+class OrderWriter:
+    """Writer thread committing queued orders in batches."""
+
+    def __init__(self, app: Flask):
+        self.app = app
+        self.window = app.config.get('ORDER_GROUP_COMMIT_WINDOW_MS', 2) / 1000
+        self.max_batch = app.config.get('ORDER_GROUP_COMMIT_MAX_BATCH', 100)
+        self.queue: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='order-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, order: order_service.NewOrder) -> Tuple[int, bool]:
+        """Queue ``order`` and wait for ``(order_id, created)``."""
+        future: Future = Future()
+        self.queue.put((order, future))
+        return future.result(timeout=SUBMIT_TIMEOUT)
+
+    def stop(self) -> None:
+        """Commit what is queued and stop the thread."""
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def _collect(self) -> Tuple[List[tuple], bool]:
+        first = self.queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                entry = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _run(self) -> None:
+        with self.app.app_context():
+            stopping = False
+            while not stopping:
+                batch, stopping = self._collect()
+                if batch:
+                    self._commit(batch)
+
+    def _commit(self, batch: List[tuple]) -> None:
+        try:
+            results = order_service.create_orders([order for order, _ in batch])
+        except Exception as err:
+            logging.exception('order group commit failed')
+            db.session.rollback()
+            for _, future in batch:
+                future.set_exception(err)
+        else:
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, ValueError):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            db.session.close()
+
+
+_lock = threading.Lock()
+
+
+def get_writer() -> OrderWriter:
+    """Return the writer of the current app, starting it on first use."""
+    app = current_app._get_current_object()
+    writer = app.extensions.get('order_writer')
+    if writer is None:
+        with _lock:
+            writer = app.extensions.get('order_writer')
+            if writer is None:
+                writer = app.extensions['order_writer'] = OrderWriter(app)
+    return writer
+
+
+def submit(order: order_service.NewOrder) -> Tuple[int, bool]:
+    return get_writer().submit(order)
@@ -0,0 +1,135 @@
+"""Monthly sales rollup behind ``/admin/reports/sales``.
+
+``order_service`` adds the lines of each new order to ``sales_rollup`` in
+the transaction that stores the order, and subtracts them when the order
+is cancelled (adding them back if it is reopened). The report then reads a
+few rows by primary key instead of aggregating every order ever stored.
+``rebuild`` recomputes the table from the orders, e.g. after bulk loads.
+
+Totals are kept in minor units (hundredths). They are summed from
+``order_item.unit_price_minor``, which is rounded once when the line is
+stored, so the incremental table always equals a fresh aggregation.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+from sqlalchemy import Integer, Numeric, cast, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from ..models import db, CategoryClosure, Order, OrderItem, SalesRollup
+
+# category_id stored for lines of items without a category
+UNCATEGORIZED = 0
+CANCELLED = 'cancelled'
+
+Key = Tuple[int, bool, int]
+
+
+def period(created_at: datetime) -> int:
+    return created_at.year * 100 + created_at.month
+
+
+def minor_units(price: float) -> int:
+    """``price`` in hundredths, rounded half away from zero."""
+    return int(math.copysign(math.floor(abs(price) * 100 + 0.5), price))
+
+
+def _minor_units_sql(price):
+    return cast(func.round(cast(price * 100, Numeric)), Integer)
+
+
+def _upsert(groups: Dict[Key, List]) -> None:
+    rows = [
+        {'period': p, 'is_service': s, 'category_id': c, 'total_minor': total, 'quantity': quantity}
+        for (p, s, c), (total, quantity) in groups.items()
+    ]
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    stmt = (postgresql if dialect == 'postgresql' else sqlite).insert(SalesRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['period', 'is_service', 'category_id'],
+        set_={
+            'total_minor': SalesRollup.total_minor + stmt.excluded.total_minor,
+            'quantity': SalesRollup.quantity + stmt.excluded.quantity,
+        },
+    )
+    db.session.execute(stmt, rows)
+
+
+def add_orders(orders: Iterable[Tuple[datetime, Iterable[Mapping]]], sign: int = 1) -> None:
+    """Add the lines of ``(created_at, lines)`` pairs; ``sign=-1`` subtracts them.
+
+    Lines are mappings with ``unit_price_minor``, ``quantity``,
+    ``is_service`` and ``category_id``. Runs in the caller's transaction.
+    Rows left without any line are deleted, as ``rebuild`` would not create
+    them.
+    """
+    groups: Dict[Key, List] = defaultdict(lambda: [0, 0])
+    for created_at, lines in orders:
+        month = period(created_at)
+        for line in lines:
+            group = groups[month, bool(line['is_service']), line['category_id'] or UNCATEGORIZED]
+            group[0] += sign * line['unit_price_minor'] * line['quantity']
+            group[1] += sign * line['quantity']
+    _upsert(groups)
+    if sign < 0 and groups:
+        db.session.execute(delete(SalesRollup).where(
+            SalesRollup.period.in_({p for p, _, _ in groups}), SalesRollup.quantity == 0,
+        ))
+
+
+def aggregate():
+    """Ad-hoc aggregation of stored orders in the shape of the rollup."""
+    month = cast(
+        func.extract('year', Order.created_at) * 100 + func.extract('month', Order.created_at), Integer,
+    )
+    category = func.coalesce(OrderItem.category_id, UNCATEGORIZED)
+    return select(
+        month.label('period'),
+        OrderItem.is_service,
+        category.label('category_id'),
+        func.sum(OrderItem.unit_price_minor * OrderItem.quantity).label('total_minor'),
+        func.sum(OrderItem.quantity).label('quantity'),
+    ).join(OrderItem, OrderItem.order_id == Order.id) \
+        .where(Order.status != CANCELLED, OrderItem.unit_price_minor.is_not(None)) \
+        .group_by(month, OrderItem.is_service, category)
+
+
+def rebuild() -> int:
+    """Recompute the rollup from the orders; returns the number of rows.
+
+    Lines loaded in bulk with only ``unit_price`` get their minor-unit price
+    first.
+    """
+    db.session.execute(
+        update(OrderItem).where(OrderItem.unit_price_minor.is_(None), OrderItem.unit_price.is_not(None))
+        .values(unit_price_minor=_minor_units_sql(OrderItem.unit_price))
+    )
+    db.session.execute(delete(SalesRollup))
+    db.session.execute(insert(SalesRollup).from_select(
+        ['period', 'is_service', 'category_id', 'total_minor', 'quantity'], aggregate(),
+    ))
+    return db.session.scalar(select(func.count()).select_from(SalesRollup))
+
+
+def report(year: int | None = None, category_id: int | None = None) -> Dict[str, Dict[str, float]]:
+    """Return ``{'YYYY-MM': {'goods': total, 'services': total}}`` by month.
+
+    ``category_id`` limits the report to that category and its descendants.
+    """
+    qs = select(
+        SalesRollup.period, SalesRollup.is_service, func.sum(SalesRollup.total_minor).label('total'),
+    ).group_by(SalesRollup.period, SalesRollup.is_service).order_by(SalesRollup.period)
+    if year:
+        qs = qs.where(SalesRollup.period.between(year * 100 + 1, year * 100 + 12))
+    if category_id is not None:
+        subtree = select(CategoryClosure.descendant_id).where(CategoryClosure.ancestor_id == category_id)
+        qs = qs.where(SalesRollup.category_id.in_(subtree))
+    result: Dict[str, Dict[str, float]] = {}
+    for r in db.session.execute(qs):
+        entry = result.setdefault(f'{r.period // 100:04d}-{r.period % 100:02d}', {'goods': 0, 'services': 0})
+        entry['services' if r.is_service else 'goods'] += (r.total or 0) / 100
+    return result
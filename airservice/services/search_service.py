@@ -0,0 +1,126 @@
+"""Full-text search over item names and descriptions.
+
+SQLite keeps an FTS5 table ``item_fts`` whose rowid is the item id. FTS5 has
+no Russian stemmer, so Cyrillic words are stemmed here with the Snowball
+stemmer from ``snowballstemmer`` before indexing and querying, while the
+``porter`` tokenizer stems English. PostgreSQL uses the generated
+``item.search_vector`` column with a GIN index, which the database keeps
+current by itself.
+"""
+import re
+import threading
+from typing import List
+
+import snowballstemmer
+from sqlalchemy import text
+
+from ..models import db, Item
+
+_WORD_RE = re.compile(r'\w+')
+_CYRILLIC_RE = re.compile(r'[а-я]')
+# Snowball stemmers keep per-call state, so each thread gets its own
+_local = threading.local()
+
+
+def stem_ru(word: str) -> str:
+    """Stem a lower-case Russian word with the Snowball algorithm."""
+    stemmer = getattr(_local, 'stemmer', None)
+    if stemmer is None:
+        stemmer = _local.stemmer = snowballstemmer.stemmer('russian')
+    return stemmer.stemWord(word.replace('ё', 'е'))
+
+
+def tokens(value: str | None) -> List[str]:
+    """Split ``value`` into lower-case words, stemming the Russian ones."""
+    if not value:
+        return []
+    return [
+        stem_ru(w) if _CYRILLIC_RE.search(w) else w
+        for w in _WORD_RE.findall(value.lower().replace('ё', 'е'))
+    ]
+
+
+def _dialect() -> str:
+    return db.session.get_bind().dialect.name
+
+
+def _fts_row(item) -> dict:
+    return {
+        'id': item.id,
+        'name_ru': ' '.join(tokens(item.name_ru)),
+        'name_en': ' '.join(tokens(item.name_en)),
+        'description_ru': ' '.join(tokens(item.description_ru)),
+        'description_en': ' '.join(tokens(item.description_en)),
+    }
+
+
+_FTS_DELETE = text('DELETE FROM item_fts WHERE rowid = :id')
+_FTS_INSERT = text(
+    'INSERT INTO item_fts (rowid, name_ru, name_en, description_ru, description_en) '
+    'VALUES (:id, :name_ru, :name_en, :description_ru, :description_en)'
+)
+
+
+def index_item(item: Item) -> None:
+    """Refresh the index entry for ``item`` in the current transaction."""
+    if _dialect() != 'sqlite':
+        return
+    db.session.flush()
+    db.session.execute(_FTS_DELETE, {'id': item.id})
+    db.session.execute(_FTS_INSERT, _fts_row(item))
+
+
+def remove_item(item_id: int) -> None:
+    if _dialect() != 'sqlite':
+        return
+    db.session.execute(_FTS_DELETE, {'id': item_id})
+
+
+def rebuild_index() -> int:
+    """Re-index every item, e.g. after bulk loads that bypass item_service."""
+    if _dialect() != 'sqlite':
+        return 0
+    rows = [
+        _fts_row(r) for r in db.session.query(
+            Item.id, Item.name_ru, Item.name_en, Item.description_ru, Item.description_en,
+        )
+    ]
+    db.session.execute(text('DELETE FROM item_fts'))
+    if rows:
+        db.session.execute(_FTS_INSERT, rows)
+    return len(rows)
+
+
+def search_item_ids(query: str) -> List[int]:
+    """Return ids of items matching every word of ``query``, best first.
+
+    Words match as prefixes so partially typed queries still find items.
+    """
+    words = tokens(query)
+    if not words:
+        return []
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        match = ' '.join(f'"{w}"*' for w in words)
+        rows = db.session.execute(text(
+            'SELECT rowid FROM item_fts WHERE item_fts MATCH :match '
+            'ORDER BY bm25(item_fts, 4.0, 4.0, 1.0, 1.0), rowid'
+        ), {'match': match})
+        return [r[0] for r in rows]
+    if dialect == 'postgresql':
+        tsquery = ' & '.join(f'{w}:*' for w in words)
+        rows = db.session.execute(text(
+            "SELECT item.id FROM item, "
+            "(SELECT to_tsquery('russian', :q) || to_tsquery('english', :q) AS query) AS q "
+            "WHERE item.search_vector @@ q.query "
+            "ORDER BY ts_rank(item.search_vector, q.query) DESC, item.id"
+        ), {'q': tsquery})
+        return [r[0] for r in rows]
+    like = f"%{query}%"
+    rows = db.session.query(Item.id).filter(
+        Item.name_ru.ilike(like) |
+        Item.name_en.ilike(like) |
+        Item.description_ru.ilike(like) |
+        Item.description_en.ilike(like)
+    ).order_by(Item.id)
+    return [r.id for r in rows]
@@ -0,0 +1,54 @@
+"""Signed bearer tokens issued by ``/auth/login``.
+
+Verifying a password hash is deliberately slow, so doing it on every
+request dominates the cost of placing an order. ``/auth/login`` checks the
+password once and returns a token binding the user's seat and admin flag;
+later requests send it as ``Authorization: Bearer <token>`` and are verified
+with an HMAC over ``SECRET_KEY``. Tokens expire after ``AUTH_TOKEN_TTL``
+seconds.
+"""
+import hashlib
+from typing import NamedTuple
+
+from flask import current_app, g, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+SALT = 'auth-token'
+
+
+class TokenClaims(NamedTuple):
+    user_id: int
+    seat: str | None
+    is_admin: bool
+
+
+def _serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(
+        current_app.config['SECRET_KEY'], salt=SALT,
+        signer_kwargs={'digest_method': hashlib.sha256},
+    )
+
+
+def issue(user) -> str:
+    return _serializer().dumps({'uid': user.id, 'seat': user.seat, 'adm': bool(user.is_admin)})
+
+
+def verify(token: str) -> TokenClaims | None:
+    """Return the claims of a valid, unexpired token, otherwise ``None``."""
+    try:
+        data = _serializer().loads(token, max_age=current_app.config.get('AUTH_TOKEN_TTL', 3600))
+    except BadSignature:
+        return None
+    return TokenClaims(data['uid'], data['seat'], data['adm'])
+
+
+def bearer_claims() -> TokenClaims | None:
+    """Claims of the request's bearer token; ``None`` if there is none or it is invalid.
+
+    The result is remembered for the rest of the request.
+    """
+    if 'bearer_claims' not in g:
+        auth = request.authorization
+        valid = auth is not None and auth.type == 'bearer' and auth.token
+        g.bearer_claims = verify(auth.token) if valid else None
+    return g.bearer_claims
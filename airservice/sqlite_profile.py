@@ -0,0 +1,104 @@
+"""Engine settings for running on a SQLite file under a threaded server.
+
+With ``SQLITE_PROFILE = 'production'`` (the default) every new connection
+switches the database to WAL, so readers no longer block the writer, and
+sets ``synchronous=NORMAL``, a busy timeout, memory-mapped I/O, a larger
+page cache and in-memory temp tables. Connections come from a queue pool
+sized with ``SQLITE_POOL_SIZE``. ``SQLITE_PROFILE = 'default'`` leaves the
+driver defaults alone. Other databases are not affected.
+
+SQLite can still refuse a write with "database is locked", e.g. when a
+transaction that started as a reader has to become the writer. Service
+functions that commit are wrapped with ``retry_on_busy``, which rolls back
+and runs the whole unit of work again.
+"""
+import functools
+import logging
+import random
+import time
+
+from flask import Flask, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+from .models import db
+
+
+def _is_sqlite_file(url: str) -> bool:
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def pragmas(config) -> list[str]:
+    return [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+        f"PRAGMA mmap_size={int(config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+        # negative values are KiB rather than pages
+        f"PRAGMA cache_size=-{int(config.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def configure_engine_options(app: Flask) -> None:
+    """Set pool options; call before ``db.init_app``."""
+    if app.config.get('SQLITE_PROFILE') != 'production':
+        return
+    if not _is_sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options.setdefault('pool_size', app.config.get('SQLITE_POOL_SIZE', 16))
+    options.setdefault('max_overflow', app.config.get('SQLITE_POOL_SIZE', 16))
+    connect_args = options.setdefault('connect_args', {})
+    # one connection per thread at a time; the pool hands them between threads
+    connect_args.setdefault('check_same_thread', False)
+
+
+def install_pragmas(app: Flask) -> None:
+    """Run the profile pragmas on each new connection; call after ``db.init_app``."""
+    if app.config.get('SQLITE_PROFILE') != 'production':
+        return
+    if not _is_sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+    statements = pragmas(app.config)
+
+    def on_connect(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    with app.app_context():
+        event.listen(db.engine, 'connect', on_connect)
+
+
+def is_busy(err: OperationalError) -> bool:
+    message = str(err.orig).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_on_busy(fn):
+    """Run ``fn`` again after a rollback when SQLite reports the database busy.
+
+    ``fn`` must be a complete unit of work ending in a commit. Gives up after
+    ``SQLITE_BUSY_RETRIES`` retries with a short randomized backoff.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        retries = current_app.config.get('SQLITE_BUSY_RETRIES', 3)
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except OperationalError as err:
+                if attempt >= retries or not is_busy(err):
+                    raise
+                db.session.rollback()
+                attempt += 1
+                logging.warning('database busy in %s, retry %d', fn.__name__, attempt)
+                time.sleep(random.uniform(0.01, 0.05) * 2 ** attempt)
+    return wrapper
@@ -0,0 +1,118 @@
+"""Shared helpers for the benchmark scripts.
+
+Run benchmarks from the repository root, e.g.::
+
+    python -m benchmarks.catalog_snapshot
+"""
+import os
+import random
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from airservice.app import create_app
+from airservice.config import TestConfig
+from airservice.models import db, Category, Item
+from airservice.services import search_service, category_service
+
+
+def make_app(database_url='sqlite:///:memory:', **overrides):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('ADMIN_PASSWORD_HASH', generate_password_hash('admin'))
+    app = create_app(TestConfig)
+    app.config.update(overrides)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def seed_catalog(app, n_items, n_categories=20, seed=1, index=True):
+    """Insert ``n_items`` random items spread over ``n_categories``.
+
+    ``index=False`` skips the full-text index for benchmarks without ``q``.
+    """
+    rnd = random.Random(seed)
+    with app.app_context():
+        cats = [
+            Category(name_ru=f'Категория {c}', name_en=f'Category {c}',
+                     image='categories/food.jpg')
+            for c in range(n_categories)
+        ]
+        db.session.add_all(cats)
+        db.session.flush()
+        db.session.bulk_insert_mappings(Item, [
+            {
+                'name_ru': f'Товар {n}',
+                'name_en': f'Product {n}',
+                'description_ru': f'Описание товара {n}',
+                'description_en': f'Description of product {n}',
+                'image': 'products/borsch.jpg',
+                'price': round(rnd.uniform(10, 5000), 2),
+                'available': rnd.random() > 0.1,
+                'is_service': rnd.random() > 0.9,
+                'category_id': cats[rnd.randrange(n_categories)].id,
+            }
+            for n in range(n_items)
+        ])
+        if index:
+            search_service.rebuild_index()
+        category_service.rebuild_closure()
+        db.session.commit()
+        return [c.id for c in cats]
+
+
+def rate(fn, seconds=2.0):
+    """Call ``fn`` repeatedly for ``seconds`` and return calls per second."""
+    fn()
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        fn()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def run_concurrent(fn, clients, seconds=2.0):
+    """Call ``fn`` from ``clients`` threads for ``seconds``.
+
+    ``fn`` receives the worker index and returns whether the call succeeded.
+    Returns ``(calls/sec, errors, latencies in ms)``.
+    """
+    latencies, errors = [], []
+    lock = threading.Lock()
+    start_gate = threading.Barrier(clients + 1)
+    deadline = 0.0
+
+    def worker(n):
+        local, failed = [], 0
+        start_gate.wait()
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            ok = fn(n)
+            local.append((time.perf_counter() - t0) * 1000)
+            failed += not ok
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    deadline = start + seconds
+    start_gate.wait()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    failed = sum(errors)
+    return (len(latencies) - failed) / elapsed, failed, latencies
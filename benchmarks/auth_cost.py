@@ -0,0 +1,70 @@
+"""CPU cost of authenticating POST /orders with Basic credentials vs a bearer token.
+
+Reports process CPU time per request for the whole request and for the
+credential check alone. Basic auth runs the password key-derivation
+function on every request; the token from ``/auth/login`` is checked with
+one HMAC.
+"""
+import argparse
+import base64
+import os
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from airservice.models import db, Item, User
+from airservice.services import token_service
+
+from ._common import make_app, seed_catalog
+
+
+def cpu_ms(fn, n):
+    """Process CPU milliseconds per call of ``fn`` over ``n`` calls."""
+    fn()
+    start = time.process_time()
+    for _ in range(n):
+        fn()
+    return (time.process_time() - start) * 1000 / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ['API_RATE_LIMIT'] = '10000000 per hour'
+    app = make_app()
+    seed_catalog(app, 100, index=False)
+    with app.app_context():
+        user = User(email='crew@example.com', password_hash=generate_password_hash('password'), seat='12A')
+        db.session.add(user)
+        db.session.commit()
+        item_id = db.session.scalar(db.select(Item.id))
+        password_hash = user.password_hash
+
+    client = app.test_client()
+    token = client.post('/auth/login', json={
+        'email': 'crew@example.com', 'password': 'password',
+    }).get_json()['token']
+    creds = base64.b64encode(b'crew@example.com:password').decode()
+    headers = {
+        'basic': {'Authorization': f'Basic {creds}'},
+        'bearer': {'Authorization': f'Bearer {token}'},
+    }
+    with app.app_context():
+        checks = {
+            'basic': lambda: check_password_hash(password_hash, 'password'),
+            'bearer': lambda: token_service.verify(token),
+        }
+        check_ms = {mode: cpu_ms(fn, args.requests) for mode, fn in checks.items()}
+
+    print(f"{'auth':<8}{'check CPU ms':>14}{'request CPU ms':>16}")
+    for mode in ('basic', 'bearer'):
+        def post():
+            rv = client.post('/orders', json={'items': [{'item_id': item_id}]}, headers=headers[mode])
+            assert rv.status_code == 201
+        print(f'{mode:<8}{check_ms[mode]:>14.3f}{cpu_ms(post, args.requests):>16.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Compare catalog filtering through SQL, the Python snapshot and NumPy masks.
+
+Measures requests/sec of GET /catalog at several catalog sizes for paged
+filter-chip queries and for a selective unpaged query that has to scan the
+whole catalog. The numpy engine is skipped when NumPy is missing.
+"""
+import argparse
+
+from ._common import make_app, rate, seed_catalog
+
+ENGINES = {
+    'sql': {'CATALOG_SNAPSHOT': False},
+    'python': {'CATALOG_SNAPSHOT': True, 'CATALOG_FILTER_ENGINE': 'python'},
+    'numpy': {'CATALOG_SNAPSHOT': True, 'CATALOG_FILTER_ENGINE': 'numpy'},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    try:
+        import numpy  # noqa: F401
+        engines = list(ENGINES)
+    except ImportError:
+        engines = ['sql', 'python']
+
+    print(f"{'items':>8}{'query':>11}" + ''.join(f'{e + " req/s":>14}' for e in engines))
+    for size in args.sizes:
+        app = make_app()
+        cat_ids = seed_catalog(app, size, index=False)
+        client = app.test_client()
+        urls = {
+            'page': '/catalog?lang=en&available=1&price_min=100&price_max=900&sort=price&limit=50',
+            'category': f'/catalog?lang=en&category={cat_ids[0]}&service=0&limit=50',
+            'selective': '/catalog?lang=en&price_min=4950&available=1&service=0',
+        }
+        for name, url in urls.items():
+            results = []
+            for engine in engines:
+                app.config.update(ENGINES[engine])
+                results.append(rate(lambda: client.get(url), args.seconds))
+            print(f'{size:>8}{name:>11}' + ''.join(f'{r:>14.1f}' for r in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Requests/sec of GET /catalog with and without the catalog snapshot."""
+import argparse
+
+from ._common import make_app, rate, seed_catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    app = make_app()
+    cat_ids = seed_catalog(app, args.items)
+    client = app.test_client()
+    urls = {
+        'all': '/catalog?lang=en',
+        'filtered': f'/catalog?lang=en&category={cat_ids[0]}&price_max=2500&available=1',
+        'search': '/catalog?lang=ru&q=product 1',
+    }
+    print(f'{args.items} items')
+    print(f"{'query':<10}{'sql req/s':>12}{'snapshot req/s':>16}{'speedup':>10}")
+    for name, url in urls.items():
+        app.config['CATALOG_SNAPSHOT'] = False
+        before = rate(lambda: client.get(url), args.seconds)
+        app.config['CATALOG_SNAPSHOT'] = True
+        after = rate(lambda: client.get(url), args.seconds)
+        print(f'{name:<10}{before:>12.1f}{after:>16.1f}{after / before:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
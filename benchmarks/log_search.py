@@ -0,0 +1,90 @@
+"""Latency of /admin/logs searches: single log file vs indexed segments.
+
+Writes ``--lines`` log entries spread over ``--hours`` hours both to one
+JSON-lines file (the layout before segments) and to a ``LogStore``, then runs
+a few typical searches: a full scan of the file as the old endpoint did,
+against the segment search with and without sidecars loaded.
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from airservice.services.log_store import LogStore, to_epoch
+
+USERS = ['guest', 'token', 'admin'] + [f'crew{i}' for i in range(20)]
+ENDPOINTS = ['/orders', '/catalog', '/catalog/facets', '/admin/orders', '/admin/items', '/auth/login']
+
+
+def legacy_search(path, user=None, endpoint=None, dt_from=None, dt_to=None, limit=100):
+    entries = []
+    with open(path) as f:
+        for ln in f:
+            entry = json.loads(ln)
+            if user and entry.get('user') != user:
+                continue
+            if endpoint and entry.get('endpoint') != endpoint:
+                continue
+            ts = datetime.fromisoformat(entry['timestamp'])
+            if dt_from and ts < dt_from:
+                continue
+            if dt_to and ts > dt_to:
+                continue
+            entries.append(entry)
+    return entries[::-1][:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=500_000)
+    parser.add_argument('--hours', type=int, default=24)
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    workdir = tempfile.mkdtemp()
+    single = f'{workdir}/airservice.log'
+    store = LogStore(f'{workdir}/logs')
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    step = args.hours * 3600 / args.lines
+    t0 = time.perf_counter()
+    with open(single, 'w') as f:
+        for n in range(args.lines):
+            ts = start + timedelta(seconds=n * step)
+            entry = {'timestamp': ts.isoformat(), 'user': rnd.choice(USERS),
+                     'endpoint': rnd.choice(ENDPOINTS), 'message': f'request {n} handled'}
+            line = json.dumps(entry)
+            f.write(line + '\n')
+            store.write(line, to_epoch(ts), entry['user'], entry['endpoint'])
+    store.close()
+    print(f'wrote {args.lines} lines twice in {time.perf_counter() - t0:.1f}s')
+
+    last_hour = (start + timedelta(hours=args.hours - 1), start + timedelta(hours=args.hours))
+    cases = [
+        ('newest 100', {}),
+        ('user crew7', {'user': 'crew7'}),
+        ('user+endpoint', {'user': 'crew7', 'endpoint': '/orders'}),
+        ('last hour', {'dt_from': last_hour[0], 'dt_to': last_hour[1]}),
+    ]
+    print(f"{'search':<16}{'file s':>9}{'cold ms':>10}{'warm ms':>10}")
+    for label, kw in cases:
+        t0 = time.perf_counter()
+        expected = legacy_search(single, **kw)
+        file_s = time.perf_counter() - t0
+        timings = []
+        reader = LogStore(f'{workdir}/logs')  # cold: sidecars not loaded yet
+        for _ in range(2):
+            t0 = time.perf_counter()
+            got, _ = reader.search(kw.get('dt_from'), kw.get('dt_to'), user=kw.get('user'),
+                                   endpoint=kw.get('endpoint'), limit=100)
+            timings.append((time.perf_counter() - t0) * 1000)
+        assert got == expected, label
+        print(f'{label:<16}{file_s:>9.2f}{timings[0]:>10.1f}{timings[1]:>10.1f}')
+
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Request latency with server logging off, synchronous and queued.
+
+Each request to a small endpoint writes ``--records`` log lines, about what a
+busy admin request logs. The modes compared are:
+
+* ``off``: logging disabled.
+* ``legacy``: the previous ``FileHandler`` writing ``pythonjsonlogger``
+  style lines, with that formatter copied here.
+* ``sync``: segments written on the request thread (``LOG_ASYNC=0``).
+* ``queued``: the background writer (``LOG_ASYNC=1``).
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+from flask import g, has_request_context
+
+from ._common import make_app, percentile, run_concurrent
+
+MODES = ('off', 'legacy', 'sync', 'queued')
+
+
+class JsonFormatter(logging.Formatter):
+    """What ``pythonjsonlogger.JsonFormatter`` wrote for the old format string."""
+    fields = ('timestamp', 'user', 'endpoint')
+
+    def format(self, record):
+        entry = {name: getattr(record, name) for name in self.fields}
+        entry['message'] = record.getMessage()
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def install_legacy(path):
+    """The single-file handler ``create_app`` used before log segments."""
+    class RequestFilter(logging.Filter):
+        def filter(self, record):
+            if has_request_context():
+                record.user = getattr(g, 'log_user', 'system')
+                record.endpoint = getattr(g, 'log_endpoint', '')
+            else:
+                record.user = 'system'
+                record.endpoint = ''
+            record.timestamp = datetime.now(timezone.utc).isoformat()
+            return True
+
+    handler = logging.FileHandler(path)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(RequestFilter())
+    root = logging.getLogger()
+    for old in root.handlers:
+        old.close()
+    root.handlers = [handler]
+
+
+def build_app(mode, workdir, records):
+    os.environ['LOG_DIR'] = os.path.join(workdir, mode)
+    os.environ['LOG_ASYNC'] = '0' if mode == 'sync' else '1'
+    app = make_app()
+    if mode == 'legacy':
+        install_legacy(os.path.join(workdir, 'airservice.log'))
+
+    @app.route('/bench/log')
+    def bench_log():
+        for n in range(records):
+            logging.info('bench_event %d of %s', n, 'request')
+        return ''
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--records', type=int, default=5, help='log lines per request')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    # keep the per-IP rate limit out of the measurement
+    os.environ['API_RATE_LIMIT'] = '10000000 per hour'
+    workdir = tempfile.mkdtemp()
+    print(f'{args.records} log lines per request')
+    print(f"{'clients':>8}{'mode':>8}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    for n_clients in args.clients:
+        for mode in MODES:
+            app = build_app(mode, workdir, args.records)
+            clients = [app.test_client() for _ in range(n_clients)]
+            logging.disable(logging.CRITICAL if mode == 'off' else logging.NOTSET)
+            per_sec, _, latencies = run_concurrent(
+                lambda n: clients[n].get('/bench/log').status_code == 200, n_clients, args.seconds,
+            )
+            logging.disable(logging.NOTSET)
+            for handler in logging.getLogger().handlers:
+                handler.flush()
+            print(f'{n_clients:>8}{mode:>8}{per_sec:>10.1f}'
+                  f'{percentile(latencies, 50):>9.3f}{percentile(latencies, 99):>9.3f}')
+
+    logging.shutdown()
+    shutil.rmtree(workdir)
+    for name in ('LOG_DIR', 'LOG_ASYNC'):
+        os.environ.pop(name, None)
+
+
+if __name__ == '__main__':
+    main()
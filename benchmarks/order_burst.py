@@ -0,0 +1,85 @@
+"""Latency of a burst of simultaneous POST /orders, with and without group commit.
+
+Every client sends one order at the same moment, as when a whole cabin
+orders after the meal announcement. Runs against a temporary SQLite file
+unless ``--database-url`` points at a scratch database.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from airservice.models import db, Item
+
+from ._common import make_app, percentile, seed_catalog
+
+
+def burst(app, item_ids, clients):
+    """Fire one order per client at once; return latencies (ms) and errors."""
+    gate = threading.Barrier(clients)
+    latencies, errors = [], []
+
+    def post(n):
+        client = app.test_client()
+        lines = [{'item_id': i} for i in random.sample(item_ids, 3)]
+        gate.wait()
+        t0 = time.perf_counter()
+        try:
+            ok = client.post('/orders', json={'seat': f'{n % 50 + 1}C', 'items': lines}).status_code == 201
+        except Exception:
+            # TESTING propagates errors such as "database is locked"
+            ok = False
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if not ok:
+            errors.append(n)
+
+    threads = [threading.Thread(target=post, args=(n,)) for n in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-url')
+    parser.add_argument('--clients', type=int, default=300)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--window-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    os.environ['API_RATE_LIMIT'] = '10000000 per hour'
+    url = args.database_url
+    if url is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        url = f'sqlite:///{path}'
+    app = make_app(url, ORDER_GROUP_COMMIT_WINDOW_MS=args.window_ms)
+    seed_catalog(app, 200, index=False)
+    with app.app_context():
+        item_ids = list(db.session.scalars(db.select(Item.id)))
+
+    print(f'{args.clients} simultaneous orders x {args.rounds} rounds')
+    print(f"{'mode':<14}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}")
+    for mode, group in (('per-request', False), ('group commit', True)):
+        app.config['ORDER_GROUP_COMMIT'] = group
+        latencies, errors = [], 0
+        for _ in range(args.rounds):
+            lat, err = burst(app, item_ids, args.clients)
+            latencies += lat
+            errors += err
+        print(f'{mode:<14}{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}'
+              f'{percentile(latencies, 99):>9.1f}{max(latencies):>9.1f}{errors:>8}')
+
+    writer = app.extensions.get('order_writer')
+    if writer is not None:
+        writer.stop()
+    if args.database_url is None:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
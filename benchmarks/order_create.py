@@ -0,0 +1,79 @@
+"""Orders/sec of POST /orders at several numbers of concurrent clients.
+
+Compares the single-transaction order pipeline with the previous one (one
+``get`` per line item and separate commits for the order and its lines).
+SQLite runs against a temporary database file; pass a scratch PostgreSQL
+database with ``--database-url`` to measure it instead.
+"""
+import argparse
+import os
+import random
+import tempfile
+from unittest.mock import patch
+
+from airservice.models import db, Item, Order, OrderItem
+from airservice.services import order_service
+
+from ._common import make_app, percentile, run_concurrent, seed_catalog
+
+
+def legacy_create_order(seat, items, *, payment_method=None, idempotency_key=None):
+    validated = []
+    for it in items:
+        item = db.session.get(Item, it['item_id'])
+        if not item:
+            raise ValueError(it['item_id'])
+        validated.append((item, it.get('quantity', 1)))
+    order = Order(seat=seat, idempotency_key=idempotency_key, payment_method=payment_method)
+    db.session.add(order)
+    db.session.commit()
+    for item, qty in validated:
+        db.session.add(OrderItem(order_id=order.id, item_id=item.id, quantity=qty))
+    db.session.commit()
+    return order, True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-url')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--lines', type=int, default=5, help='line items per order')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    # keep the per-IP rate limit out of the measurement
+    os.environ['API_RATE_LIMIT'] = '10000000 per hour'
+    url = args.database_url
+    if url is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        url = f'sqlite:///{path}'
+    app = make_app(url)
+    seed_catalog(app, 500, index=False)
+    with app.app_context():
+        item_ids = list(db.session.scalars(db.select(Item.id)))
+        dialect = db.engine.dialect.name
+
+    def post_order(n):
+        rnd = random.Random()
+        lines = [{'item_id': i, 'quantity': rnd.randint(1, 3)}
+                 for i in rnd.sample(item_ids, args.lines)]
+        rv = clients[n].post('/orders', json={'seat': f'{n % 40 + 1}A', 'items': lines})
+        return rv.status_code == 201
+
+    print(f'{dialect}, {args.lines} lines per order')
+    print(f"{'clients':>8}{'pipeline':>10}{'orders/s':>11}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+    for n_clients in args.clients:
+        clients = [app.test_client() for _ in range(n_clients)]
+        for name, impl in (('legacy', legacy_create_order), ('batched', order_service.create_order)):
+            with patch.object(order_service, 'create_order', impl):
+                per_sec, errors, latencies = run_concurrent(post_order, n_clients, args.seconds)
+            print(f'{n_clients:>8}{name:>10}{per_sec:>11.1f}'
+                  f'{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}{errors:>8}')
+
+    if args.database_url is None:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
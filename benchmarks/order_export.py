@@ -0,0 +1,82 @@
+"""Peak memory and time of GET /admin/orders as a JSON list and as an NDJSON stream.
+
+Fills a temporary SQLite file with ``--orders`` orders of three lines each
+and reads the whole listing both ways; the streamed body is consumed
+chunk by chunk as a client would.
+"""
+import argparse
+import base64
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from airservice.models import db, Item, Order, OrderItem
+
+from ._common import make_app, seed_catalog
+
+
+def seed_orders(app, n_orders, seed=1):
+    rnd = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    with app.app_context():
+        items = list(db.session.execute(db.select(Item.id, Item.price, Item.is_service)))
+        for first in range(0, n_orders, 5000):
+            count = min(5000, n_orders - first)
+            db.session.execute(db.insert(Order), [
+                {'seat': f'{rnd.randint(1, 40)}{rnd.choice("ABCDEF")}', 'status': 'done',
+                 'created_at': start + timedelta(minutes=first + n), 'total': 0.0, 'item_count': 3}
+                for n in range(count)
+            ])
+        order_ids = list(db.session.scalars(db.select(Order.id)))
+        for first in range(0, len(order_ids), 5000):
+            lines = []
+            for order_id in order_ids[first:first + 5000]:
+                for item in rnd.sample(items, 3):
+                    lines.append({'order_id': order_id, 'item_id': item.id, 'quantity': 1,
+                                  'unit_price': item.price, 'is_service': item.is_service})
+            db.session.execute(db.insert(OrderItem), lines)
+        db.session.commit()
+
+
+def measure(client, url, headers):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    rv = client.get(url, headers=headers, buffered=False)
+    size = sum(len(chunk) for chunk in rv.response)
+    rv.close()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, nargs='+', default=[5000, 20000])
+    args = parser.parse_args()
+
+    os.environ['API_RATE_LIMIT'] = '10000000 per hour'
+    headers = {'Authorization': 'Basic ' + base64.b64encode(b'admin:admin').decode()}
+    print(f"{'orders':>8}{'mode':>8}{'MB out':>9}{'seconds':>9}{'peak MB':>9}")
+    for n_orders in args.orders:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        app = make_app(f'sqlite:///{path}')
+        seed_catalog(app, 200, index=False)
+        seed_orders(app, n_orders)
+        client = app.test_client()
+        for mode, url in (('list', '/admin/orders'), ('ndjson', '/admin/orders?format=ndjson')):
+            size, elapsed, peak = measure(client, url, headers)
+            print(f'{n_orders:>8}{mode:>8}{size / 2 ** 20:>9.1f}{elapsed:>9.2f}{peak / 2 ** 20:>9.1f}')
+        with app.app_context():
+            db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
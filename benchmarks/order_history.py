@@ -0,0 +1,90 @@
+"""Requests/sec of GET /orders?seat= with and without the order history indexes.
+
+Seeds 100k orders over 300 seats (about 330 orders per seat) and measures
+the full history, the first page and a page deep into the history, first
+without and then with the (seat, created_at) and order_item.order_id
+indexes.
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+from airservice.models import db, Item, Order, OrderItem
+
+from ._common import make_app, rate, seed_catalog
+
+INDEXES = (
+    'CREATE INDEX IF NOT EXISTS ix_order_seat_created_at ON "order" (seat, created_at)',
+    'CREATE INDEX IF NOT EXISTS ix_order_item_order_id ON order_item (order_id)',
+)
+DROP_INDEXES = (
+    'DROP INDEX IF EXISTS ix_order_seat_created_at',
+    'DROP INDEX IF EXISTS ix_order_item_order_id',
+)
+
+
+def seed_orders(app, n_orders, n_seats, item_ids, seed=1):
+    rnd = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    seats = [f'{n // 6 + 1}{"ABCDEF"[n % 6]}' for n in range(n_seats)]
+    with app.app_context():
+        for first in range(0, n_orders, 10000):
+            orders, lines = [], []
+            for n in range(first, min(first + 10000, n_orders)):
+                count = rnd.randint(1, 3)
+                picked = rnd.sample(item_ids, count)
+                orders.append({
+                    'id': n + 1, 'seat': rnd.choice(seats),
+                    'created_at': start + timedelta(minutes=n),
+                    'status': rnd.choice(['new', 'forming', 'done', 'done']),
+                    'payment_method': 'card', 'total': 0.0, 'item_count': count,
+                })
+                lines += [{'order_id': n + 1, 'item_id': i, 'quantity': 1, 'unit_price': 0.0}
+                          for i in picked]
+            db.session.execute(db.insert(Order), orders)
+            db.session.execute(db.insert(OrderItem), lines)
+        db.session.commit()
+    return seats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--seats', type=int, default=300)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    os.environ['API_RATE_LIMIT'] = '10000000 per hour'
+    app = make_app()
+    seed_catalog(app, 100, index=False)
+    with app.app_context():
+        item_ids = list(db.session.scalars(db.select(Item.id)))
+    seats = seed_orders(app, args.orders, args.seats, item_ids)
+    client = app.test_client()
+    seat = seats[0]
+    deep = client.get(f'/orders?seat={seat}&limit=250').get_json()['next_cursor']
+    urls = {
+        'full history': f'/orders?seat={seat}',
+        'first page': f'/orders?seat={seat}&limit=20',
+        'status page': f'/orders?seat={seat}&status=new&limit=20',
+        'deep page': f'/orders?seat={seat}&limit=20&cursor={deep}',
+    }
+
+    print(f'{args.orders} orders over {args.seats} seats')
+    print(f"{'query':<14}{'no index req/s':>16}{'index req/s':>13}{'speedup':>9}")
+    results = {}
+    for indexed in (False, True):
+        with app.app_context():
+            for statement in (INDEXES if indexed else DROP_INDEXES):
+                db.session.execute(db.text(statement))
+            db.session.commit()
+        for name, url in urls.items():
+            results[name, indexed] = rate(lambda: client.get(url), args.seconds)
+    for name in urls:
+        before, after = results[name, False], results[name, True]
+        print(f'{name:<14}{before:>16.1f}{after:>13.1f}{after / before:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Time of /admin/reports/sales/cube group-bys over a large order history.
+
+Seeds ``--lines`` order lines (4 per order) into a temporary SQLite file and
+reports the columnar fetch once and then, for several dimension sets, the
+NumPy group-by against a plain Python dict aggregation over the same rows.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from airservice.models import db, Item, Order, OrderItem
+from airservice.services import analytics_service
+
+from ._common import make_app, seed_catalog
+
+LINES_PER_ORDER = 4
+DIM_SETS = [
+    ('category',),
+    ('zone', 'hour'),
+    ('item', 'payment_method'),
+    ('category', 'zone', 'hour', 'payment_method'),
+]
+
+
+def seed_orders(app, n_lines, seed=1):
+    rnd = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    n_orders = n_lines // LINES_PER_ORDER
+    with app.app_context():
+        items = list(db.session.execute(db.select(Item.id, Item.price, Item.is_service, Item.category_id)))
+        for first in range(0, n_orders, 20000):
+            db.session.execute(db.insert(Order), [
+                {'seat': f'{rnd.randint(1, 40)}{rnd.choice("ABCDEF")}', 'status': 'done',
+                 'created_at': start + timedelta(minutes=7 * (first + n)),
+                 'payment_method': rnd.choice(('card', 'cash', 'miles')),
+                 'total': 0.0, 'item_count': LINES_PER_ORDER}
+                for n in range(min(20000, n_orders - first))
+            ])
+        order_ids = list(db.session.scalars(db.select(Order.id)))
+        for first in range(0, len(order_ids), 20000):
+            db.session.execute(db.insert(OrderItem), [
+                {'order_id': order_id, 'item_id': item.id, 'quantity': rnd.randint(1, 3),
+                 'unit_price': item.price, 'is_service': item.is_service, 'category_id': item.category_id}
+                for order_id in order_ids[first:first + 20000]
+                for item in rnd.sample(items, LINES_PER_ORDER)
+            ])
+        db.session.commit()
+
+
+def python_cube(rows, dims, zones):
+    """Revenue per group with a dict, the way a hand-written report would."""
+    totals = defaultdict(float)
+    zone_of = {}
+    for r in rows:
+        values = {
+            'item': r.item_id, 'category': r.category_id, 'hour': r.hour,
+            'payment_method': r.payment_method,
+        }
+        if 'zone' in dims:
+            if r.seat not in zone_of:
+                zone_of[r.seat] = analytics_service.seat_zone(r.seat, zones)
+            values['zone'] = zone_of[r.seat]
+        totals[tuple(values[d] for d in dims)] += r.unit_price * r.quantity
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = make_app(f'sqlite:///{path}')
+    seed_catalog(app, 500, index=False)
+    t0 = time.perf_counter()
+    seed_orders(app, args.lines)
+    print(f'seeded {args.lines} lines in {time.perf_counter() - t0:.1f}s')
+
+    zones = analytics_service.parse_zones(analytics_service.DEFAULT_ZONES)
+    with app.app_context():
+        t0 = time.perf_counter()
+        lines = analytics_service.fetch_lines()
+        print(f'columnar fetch: {time.perf_counter() - t0:.2f}s')
+        hour = db.cast(db.func.extract('hour', Order.created_at), db.Integer).label('hour')
+        rows = db.session.execute(db.select(
+            OrderItem.item_id, OrderItem.category_id, OrderItem.unit_price, OrderItem.quantity,
+            Order.seat, Order.payment_method, hour,
+        ).join(Order, Order.id == OrderItem.order_id)).all()
+
+    print(f"{'dims':<44}{'groups':>8}{'numpy s':>9}{'python s':>10}")
+    for dims in DIM_SETS:
+        t0 = time.perf_counter()
+        keys, _ = analytics_service.cube(lines, dims, ['revenue', 'orders'], zones)
+        numpy_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        python_cube(rows, dims, zones)
+        python_s = time.perf_counter() - t0
+        print(f"{','.join(dims):<44}{len(keys):>8}{numpy_s:>9.3f}{python_s:>10.3f}")
+
+    with app.app_context():
+        db.engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Concurrent reads and writes on a SQLite file with and without the production profile.
+
+Each client alternates between order history reads (``GET /orders?seat=``)
+and order writes (``POST /orders``) in the ratio given by ``--write-share``.
+Both profiles run against a fresh temporary database file.
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from airservice.models import db, Item
+
+from ._common import make_app, percentile, run_concurrent, seed_catalog
+
+JOURNAL_MODES = {'default': 'delete', 'production': 'wal'}
+
+
+def measure(profile, args):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    # the profile decides the engine options, so it must be set before create_app
+    os.environ['SQLITE_PROFILE'] = profile
+    try:
+        app = make_app(f'sqlite:///{path}')
+    finally:
+        os.environ.pop('SQLITE_PROFILE', None)
+    seed_catalog(app, 200, index=False)
+    with app.app_context():
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+        assert journal_mode == JOURNAL_MODES[profile], (profile, journal_mode)
+        item_ids = list(db.session.scalars(db.select(Item.id)))
+    clients = [app.test_client() for _ in range(args.clients)]
+    reads, writes = [0] * args.clients, [0] * args.clients
+
+    def call(n):
+        rnd = random.Random()
+        seat = f'{rnd.randint(1, 30)}A'
+        try:
+            if rnd.random() < args.write_share:
+                lines = [{'item_id': i} for i in rnd.sample(item_ids, 3)]
+                ok = clients[n].post('/orders', json={'seat': seat, 'items': lines}).status_code == 201
+                writes[n] += ok
+            else:
+                ok = clients[n].get(f'/orders?seat={seat}&limit=20').status_code == 200
+                reads[n] += ok
+        except Exception:
+            # TESTING propagates errors such as "database is locked"
+            ok = False
+        return ok
+
+    _, errors, latencies = run_concurrent(call, args.clients, args.seconds)
+    with app.app_context():
+        db.engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+    return sum(reads) / args.seconds, sum(writes) / args.seconds, errors, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--write-share', type=float, default=0.3)
+    args = parser.parse_args()
+
+    os.environ['API_RATE_LIMIT'] = '10000000 per hour'
+    print(f'{args.clients} clients, {args.write_share:.0%} writes')
+    print(f"{'profile':<12}{'reads/s':>9}{'writes/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for profile in ('default', 'production'):
+        reads, writes, errors, latencies = measure(profile, args)
+        print(f'{profile:<12}{reads:>9.1f}{writes:>10.1f}{percentile(latencies, 50):>9.1f}'
+              f'{percentile(latencies, 95):>9.1f}{percentile(latencies, 99):>9.1f}{errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Add full-text search index for items
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 10:00:00.000000
+"""
+
+import re
+
+from alembic import op
+import snowballstemmer
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+# frozen copies of the schema and tokenizer of this revision; later changes
+# to the application must not change what this migration does
+ITEM_FTS_SQLITE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS item_fts USING fts5("
+    "name_ru, name_en, description_ru, description_en, "
+    "tokenize = 'porter unicode61')"
+)
+ITEM_SEARCH_VECTOR_POSTGRES = (
+    "ALTER TABLE item ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', coalesce(name_ru, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(name_en, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(description_ru, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description_en, '')), 'B')"
+    ") STORED"
+)
+ITEM_SEARCH_INDEX_POSTGRES = (
+    "CREATE INDEX IF NOT EXISTS ix_item_search_vector ON item USING GIN (search_vector)"
+)
+
+_WORD_RE = re.compile(r'\w+')
+_CYRILLIC_RE = re.compile(r'[а-я]')
+
+
+def tokens(value):
+    """Lower-case words of ``value``, Russian ones stemmed, as stored in item_fts."""
+    if not value:
+        return []
+    stemmer = snowballstemmer.stemmer('russian')
+    return [
+        stemmer.stemWord(w) if _CYRILLIC_RE.search(w) else w
+        for w in _WORD_RE.findall(value.lower().replace('ё', 'е'))
+    ]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # generated column, so PostgreSQL backfills and maintains it itself
+        op.execute(ITEM_SEARCH_VECTOR_POSTGRES)
+        op.execute(ITEM_SEARCH_INDEX_POSTGRES)
+    elif dialect == 'sqlite':
+        op.execute(ITEM_FTS_SQLITE)
+        conn = op.get_bind()
+        rows = conn.execute(sa.text(
+            'SELECT id, name_ru, name_en, description_ru, description_en FROM item'
+        )).fetchall()
+        if rows:
+            conn.execute(
+                sa.text(
+                    'INSERT INTO item_fts (rowid, name_ru, name_en, description_ru, description_en) '
+                    'VALUES (:id, :name_ru, :name_en, :description_ru, :description_en)'
+                ),
+                [
+                    {
+                        'id': r.id,
+                        'name_ru': ' '.join(tokens(r.name_ru)),
+                        'name_en': ' '.join(tokens(r.name_en)),
+                        'description_ru': ' '.join(tokens(r.description_ru)),
+                        'description_en': ' '.join(tokens(r.description_en)),
+                    }
+                    for r in rows
+                ],
+            )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_item_search_vector')
+        op.drop_column('item', 'search_vector')
+    elif dialect == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS item_fts')
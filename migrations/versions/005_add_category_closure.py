@@ -0,0 +1,46 @@
+"""Add category closure table
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 11:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    closure = op.create_table(
+        'category_closure',
+        sa.Column('ancestor_id', sa.Integer(), nullable=False),
+        sa.Column('descendant_id', sa.Integer(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['ancestor_id'], ['category.id'], ),
+        sa.ForeignKeyConstraint(['descendant_id'], ['category.id'], ),
+        sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index('ix_category_closure_descendant_id', 'category_closure', ['descendant_id'])
+
+    # backfill from the existing parent links
+    conn = op.get_bind()
+    parents = dict(conn.execute(sa.text('SELECT id, parent_id FROM category')).fetchall())
+    rows = []
+    for cat_id in parents:
+        node, depth, seen = cat_id, 0, set()
+        while node is not None and node in parents and node not in seen:
+            seen.add(node)
+            rows.append({'ancestor_id': node, 'descendant_id': cat_id, 'depth': depth})
+            node, depth = parents[node], depth + 1
+    if rows:
+        op.bulk_insert(closure, rows)
+
+
+def downgrade():
+    op.drop_index('ix_category_closure_descendant_id', table_name='category_closure')
+    op.drop_table('category_closure')
@@ -0,0 +1,49 @@
+"""Add catalog revisions and tombstones
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 12:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('item', sa.Column('revision', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('category', sa.Column('revision', sa.Integer(), nullable=False, server_default='0'))
+    op.create_index('ix_item_revision', 'item', ['revision'])
+    op.create_index('ix_category_revision', 'category', ['revision'])
+
+    counter = op.create_table(
+        'catalog_revision',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(counter, [{'id': 1, 'value': 0}])
+
+    op.create_table(
+        'catalog_tombstone',
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('revision', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('kind', 'entity_id')
+    )
+    op.create_index('ix_catalog_tombstone_revision', 'catalog_tombstone', ['revision'])
+
+
+def downgrade():
+    op.drop_index('ix_catalog_tombstone_revision', table_name='catalog_tombstone')
+    op.drop_table('catalog_tombstone')
+    op.drop_table('catalog_revision')
+    op.drop_index('ix_category_revision', table_name='category')
+    op.drop_index('ix_item_revision', table_name='item')
+    op.drop_column('category', 'revision')
+    op.drop_column('item', 'revision')
@@ -0,0 +1,55 @@
+"""Store line prices and order totals
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 13:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+# orders backfilled per statement
+BATCH = 1000
+
+
+def upgrade():
+    op.add_column('order_item', sa.Column('unit_price', sa.Float(), nullable=True))
+    op.add_column('order_item', sa.Column('is_service', sa.Boolean(), nullable=True))
+    op.add_column('order', sa.Column('total', sa.Float(), nullable=True))
+    op.add_column('order', sa.Column('item_count', sa.Integer(), nullable=True))
+
+    # existing lines take the current item price, the best value available
+    conn = op.get_bind()
+    low, high = conn.execute(sa.text('SELECT min(id), max(id) FROM "order"')).one()
+    if low is None:
+        return
+    with op.get_context().autocommit_block():
+        for start in range(low, high + 1, BATCH):
+            bounds = {'start': start, 'end': start + BATCH}
+            conn.execute(sa.text(
+                'UPDATE order_item SET '
+                'unit_price = (SELECT price FROM item WHERE item.id = order_item.item_id), '
+                'is_service = (SELECT is_service FROM item WHERE item.id = order_item.item_id) '
+                'WHERE order_id >= :start AND order_id < :end'
+            ), bounds)
+            conn.execute(sa.text(
+                'UPDATE "order" SET '
+                'total = (SELECT coalesce(sum(quantity * unit_price), 0) FROM order_item '
+                'WHERE order_item.order_id = "order".id), '
+                'item_count = (SELECT coalesce(sum(quantity), 0) FROM order_item '
+                'WHERE order_item.order_id = "order".id) '
+                'WHERE id >= :start AND id < :end'
+            ), bounds)
+
+
+def downgrade():
+    op.drop_column('order', 'item_count')
+    op.drop_column('order', 'total')
+    op.drop_column('order_item', 'is_service')
+    op.drop_column('order_item', 'unit_price')
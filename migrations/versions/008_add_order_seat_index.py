@@ -0,0 +1,24 @@
+"""Index order history by seat and creation time, and lines by order
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 14:00:00.000000
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_order_seat_created_at', 'order', ['seat', 'created_at'])
+    op.create_index('ix_order_item_order_id', 'order_item', ['order_id'])
+
+
+def downgrade():
+    op.drop_index('ix_order_item_order_id', table_name='order_item')
+    op.drop_index('ix_order_seat_created_at', table_name='order')
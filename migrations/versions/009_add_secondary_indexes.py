@@ -0,0 +1,33 @@
+"""Index the columns order, catalog and outbox listings filter and join on
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 16:00:00.000000
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_order_status_created_at', 'order', ['status', 'created_at']),
+    ('ix_order_created_at', 'order', ['created_at']),
+    ('ix_order_item_item_id', 'order_item', ['item_id']),
+    ('ix_item_category_id', 'item', ['category_id']),
+    ('ix_category_parent_id', 'category', ['parent_id']),
+    ('ix_outgoing_message_sent', 'outgoing_message', ['sent']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
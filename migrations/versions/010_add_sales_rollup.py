@@ -0,0 +1,58 @@
+"""Add the monthly sales rollup and the category of order lines
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 17:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('order_item', sa.Column('category_id', sa.Integer(), nullable=True))
+    # existing lines take the current item category, the best value available
+    op.execute(
+        'UPDATE order_item SET category_id = '
+        '(SELECT category_id FROM item WHERE item.id = order_item.item_id)'
+    )
+
+    rollup = op.create_table(
+        'sales_rollup',
+        sa.Column('period', sa.Integer(), nullable=False),
+        sa.Column('is_service', sa.Boolean(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Float(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('period', 'is_service', 'category_id')
+    )
+
+    order = sa.table('order', sa.column('id'), sa.column('status'), sa.column('created_at', sa.DateTime()))
+    line = sa.table(
+        'order_item', sa.column('order_id'), sa.column('is_service'), sa.column('category_id'),
+        sa.column('unit_price'), sa.column('quantity'),
+    )
+    month = sa.cast(
+        sa.extract('year', order.c.created_at) * 100 + sa.extract('month', order.c.created_at), sa.Integer,
+    )
+    category = sa.func.coalesce(line.c.category_id, 0)
+    op.execute(rollup.insert().from_select(
+        ['period', 'is_service', 'category_id', 'total', 'quantity'],
+        sa.select(
+            month, line.c.is_service, category,
+            sa.func.sum(line.c.unit_price * line.c.quantity), sa.func.sum(line.c.quantity),
+        ).select_from(order.join(line, line.c.order_id == order.c.id))
+        .where(order.c.status != 'cancelled', line.c.unit_price.is_not(None))
+        .group_by(month, line.c.is_service, category)
+    ))
+
+
+def downgrade():
+    op.drop_table('sales_rollup')
+    op.drop_column('order_item', 'category_id')
@@ -0,0 +1,62 @@
+"""Keep sales rollup totals in minor units
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-18 18:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def _fill(rollup, total_name, total):
+    """Aggregate the orders into ``rollup``; ``total`` maps a line price to its stored value."""
+    order = sa.table('order', sa.column('id'), sa.column('status'), sa.column('created_at', sa.DateTime()))
+    line = sa.table(
+        'order_item', sa.column('order_id'), sa.column('is_service'), sa.column('category_id'),
+        sa.column('unit_price'), sa.column('quantity'),
+    )
+    month = sa.cast(
+        sa.extract('year', order.c.created_at) * 100 + sa.extract('month', order.c.created_at), sa.Integer,
+    )
+    category = sa.func.coalesce(line.c.category_id, 0)
+    op.execute(rollup.insert().from_select(
+        ['period', 'is_service', 'category_id', total_name, 'quantity'],
+        sa.select(
+            month, line.c.is_service, category,
+            sa.func.sum(total(line.c.unit_price) * line.c.quantity), sa.func.sum(line.c.quantity),
+        ).select_from(order.join(line, line.c.order_id == order.c.id))
+        .where(order.c.status != 'cancelled', line.c.unit_price.is_not(None))
+        .group_by(month, line.c.is_service, category)
+    ))
+
+
+def _create(total_column):
+    return op.create_table(
+        'sales_rollup',
+        sa.Column('period', sa.Integer(), nullable=False),
+        sa.Column('is_service', sa.Boolean(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        total_column,
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('period', 'is_service', 'category_id')
+    )
+
+
+def upgrade():
+    # the table is derived from the orders, so it is rebuilt rather than converted
+    op.drop_table('sales_rollup')
+    rollup = _create(sa.Column('total_minor', sa.BigInteger(), nullable=False))
+    _fill(rollup, 'total_minor', lambda price: sa.cast(sa.func.round(sa.cast(price * 100, sa.Numeric)), sa.Integer))
+
+
+def downgrade():
+    op.drop_table('sales_rollup')
+    rollup = _create(sa.Column('total', sa.Float(), nullable=False))
+    _fill(rollup, 'total', lambda price: price)
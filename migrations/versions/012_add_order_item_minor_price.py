@@ -0,0 +1,52 @@
+"""Store order line prices in minor units
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-18 19:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('order_item', sa.Column('unit_price_minor', sa.BigInteger(), nullable=True))
+    line = sa.table(
+        'order_item', sa.column('order_id'), sa.column('is_service'), sa.column('category_id'),
+        sa.column('unit_price'), sa.column('unit_price_minor'), sa.column('quantity'),
+    )
+    # rounded once here; from now on the rollup only sums stored integers
+    op.execute(line.update().where(line.c.unit_price.is_not(None)).values(
+        unit_price_minor=sa.cast(sa.func.round(sa.cast(line.c.unit_price * 100, sa.Numeric)), sa.Integer),
+    ))
+
+    # 011 rounded the prices by itself; rebuild from the stored values
+    rollup = sa.table(
+        'sales_rollup', sa.column('period'), sa.column('is_service'), sa.column('category_id'),
+        sa.column('total_minor'), sa.column('quantity'),
+    )
+    order = sa.table('order', sa.column('id'), sa.column('status'), sa.column('created_at', sa.DateTime()))
+    month = sa.cast(
+        sa.extract('year', order.c.created_at) * 100 + sa.extract('month', order.c.created_at), sa.Integer,
+    )
+    category = sa.func.coalesce(line.c.category_id, 0)
+    op.execute(rollup.delete())
+    op.execute(rollup.insert().from_select(
+        ['period', 'is_service', 'category_id', 'total_minor', 'quantity'],
+        sa.select(
+            month, line.c.is_service, category,
+            sa.func.sum(line.c.unit_price_minor * line.c.quantity), sa.func.sum(line.c.quantity),
+        ).select_from(order.join(line, line.c.order_id == order.c.id))
+        .where(order.c.status != 'cancelled', line.c.unit_price_minor.is_not(None))
+        .group_by(month, line.c.is_service, category)
+    ))
+
+
+def downgrade():
+    op.drop_column('order_item', 'unit_price_minor')
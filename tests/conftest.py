@@ -3,9 +3,9 @@ import sys
 import base64
 from datetime import datetime
 import json
-import logging
 import pytest
 import subprocess
+from contextlib import contextmanager
 from pathlib import Path
 
 
@@ -21,6 +21,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from airservice.app import create_app
 from airservice.config import TestConfig
 from airservice.models import db, Category, Item, Order, OrderItem
+from airservice.services import search_service, category_service, order_service, log_store
 
 
 def auth_header():
@@ -28,9 +29,36 @@ def auth_header():
     return {'Authorization': f'Basic {creds}'}
 
 
+@contextmanager
+def count_queries(app, with_params=False):
+    """Collect SQL statements executed on the app's engine.
+
+    With ``with_params`` each entry is a ``(statement, parameters)`` pair.
+    """
+    from sqlalchemy import event
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def before_execute(conn, cursor, statement, parameters, *args):
+        statements.append((statement, parameters) if with_params else statement)
+
+    event.listen(engine, 'before_cursor_execute', before_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_execute)
+
+
 @pytest.fixture
-def app():
-    os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+def database_url():
+    return 'sqlite:///:memory:'
+
+
+@pytest.fixture
+def app(tmp_path, database_url):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['LOG_DIR'] = str(tmp_path / 'logs')
     os.environ['ADMIN_USERNAME'] = 'admin'
     from werkzeug.security import generate_password_hash
     os.environ['ADMIN_PASSWORD_HASH'] = generate_password_hash('admin')
@@ -38,9 +66,14 @@ def app():
     with app.app_context():
         db.create_all()
     yield app
+    if not database_url.startswith('sqlite'):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
     os.environ.pop('DATABASE_URL', None)
     os.environ.pop('ADMIN_USERNAME', None)
     os.environ.pop('ADMIN_PASSWORD_HASH', None)
+    os.environ.pop('LOG_DIR', None)
 
 
 @pytest.fixture
@@ -113,6 +146,9 @@ def sample_data(app):
             for ru, en, price, cat, image, *rest in items_data
         ]
         db.session.add_all(items)
+        db.session.flush()
+        search_service.rebuild_index()
+        category_service.rebuild_closure()
         db.session.commit()
         # return primitive IDs to avoid detached instances
         return {
@@ -148,13 +184,14 @@ def populate_orders(app, sample_data):
                     s_id = service_list[num % len(service_list)]
                     db.session.add(OrderItem(order_id=order.id, item_id=g_id, quantity=1))
                     db.session.add(OrderItem(order_id=order.id, item_id=s_id, quantity=1))
+        order_service.backfill_totals()
         db.session.commit()
         # return one of each to use in other tests
         return {'goods_id': goods_list[0], 'service_id': service_list[0]}
 
 
 @pytest.fixture
-def sample_logs():
+def sample_logs(app):
     entries = [
         {
             'timestamp': '2024-01-01T12:00:00',
@@ -175,9 +212,7 @@ def sample_logs():
             'message': 'item_deleted'
         },
     ]
-    with open('airservice.log', 'w') as f:
-        for e in entries:
-            f.write(json.dumps(e) + '\n')
-    yield entries
-    logging.shutdown()
-    os.remove('airservice.log')
+    store = app.extensions['log_store']
+    for e in entries:
+        store.write(json.dumps(e), log_store.to_epoch(e['timestamp']), e['user'], e['endpoint'])
+    return entries
@@ -1,4 +1,11 @@
-from conftest import auth_header
+import base64
+import json
+from unittest.mock import patch
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from airservice.services.credential_cache import CredentialCache
+from conftest import auth_header, count_queries
 
 
 def test_admin_item_crud(client, app, sample_data):
@@ -73,6 +80,24 @@ def test_admin_order_filters_invalid_dates(client, populate_orders):
     assert len(rv.get_json()) == 180
 
 
+def test_order_listing_ndjson_stream(app, client, populate_orders):
+    listed = client.get('/admin/orders?lang=en', headers=auth_header()).get_json()
+    with patch('airservice.services.order_service.EXPORT_CHUNK', 50), \
+            count_queries(app) as statements:
+        rv = client.get('/admin/orders?format=ndjson&lang=en', headers=auth_header())
+        assert rv.is_streamed
+        streamed = [json.loads(line) for line in rv.get_data(as_text=True).splitlines()]
+    assert rv.mimetype == 'application/x-ndjson'
+    assert streamed == listed
+    # one cursor over the orders plus one line query per chunk of 50
+    assert len(statements) == 1 + 4
+
+    rv = client.get('/admin/orders?format=ndjson&seat=11A&from=2022-01-01', headers=auth_header())
+    streamed = [json.loads(line) for line in rv.get_data(as_text=True).splitlines()]
+    assert len(streamed) == 2
+    assert {o['seat'] for o in streamed} == {'11A'}
+
+
 def test_sales_report_multiple_years(client, populate_orders):
     rv = client.get('/admin/reports/sales?year=2022', headers=auth_header())
     data = rv.get_json()
@@ -101,3 +126,37 @@ def test_admin_requires_auth(client):
     assert rv.status_code == 401
     rv = client.get('/admin/orders')
     assert rv.status_code == 401
+
+
+def test_admin_auth_caches_successful_logins_only(app, client):
+    wrong = {'Authorization': 'Basic ' + base64.b64encode(b'admin:nope').decode()}
+
+    with patch('airservice.services.credential_cache.check_password_hash',
+               wraps=check_password_hash) as slow_check:
+        for _ in range(3):
+            assert client.get('/admin/items', headers=auth_header()).status_code == 200
+        assert slow_check.call_count == 1
+        for _ in range(2):
+            assert client.get('/admin/items', headers=wrong).status_code == 401
+        assert slow_check.call_count == 3
+
+        # a new password hash drops what was verified against the old one
+        app.config['ADMIN_PASSWORD_HASH'] = generate_password_hash('changed')
+        assert client.get('/admin/items', headers=auth_header()).status_code == 401
+        assert slow_check.call_count == 4
+
+        app.config.update(ADMIN_PASSWORD_HASH=generate_password_hash('admin'), ADMIN_AUTH_CACHE_TTL=0)
+        for _ in range(2):
+            assert client.get('/admin/items', headers=auth_header()).status_code == 200
+        assert slow_check.call_count == 6
+
+
+def test_credential_cache_expires_and_is_bounded():
+    cache = CredentialCache(max_entries=2, ttl=10)
+    digests = [cache.digest('admin', p) for p in ('a', 'b', 'c')]
+    for d in digests:
+        cache.add(d, 'h')
+    assert not cache.contains(digests[0], 'h')
+    assert cache.contains(digests[2], 'h')
+    with patch('airservice.services.credential_cache.time.monotonic', return_value=10 ** 9):
+        assert not cache.contains(digests[2], 'h')
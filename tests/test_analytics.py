@@ -0,0 +1,94 @@
+from collections import defaultdict
+from unittest.mock import patch
+
+import pytest
+
+from airservice.models import db, Order, OrderItem
+from airservice.services import analytics_service
+from conftest import auth_header
+
+pytest.importorskip('numpy')
+
+
+def reference(dims, zones):
+    """Revenue and distinct orders per group computed row by row."""
+    revenue, orders = defaultdict(float), defaultdict(set)
+    rows = db.session.query(Order, OrderItem).join(OrderItem, OrderItem.order_id == Order.id) \
+        .filter(Order.status != 'cancelled')
+    for order, line in rows:
+        values = {
+            'zone': analytics_service.seat_zone(order.seat, zones),
+            'payment_method': order.payment_method,
+            'kind': 'services' if line.is_service else 'goods',
+            'category': line.category_id,
+            'hour': order.created_at.hour,
+        }
+        key = tuple(values[d] for d in dims)
+        revenue[key] += line.unit_price * line.quantity
+        orders[key].add(order.id)
+    return {k: (revenue[k], len(orders[k])) for k in revenue}
+
+
+def test_sales_cube_matches_row_by_row_aggregation(app, client, populate_orders, sample_data):
+    water = sample_data['items']['Минеральная вода']
+    for seat, method in (('2A', 'cash'), ('14C', 'card'), ('30F', None)):
+        client.post('/orders', json={'seat': seat, 'items': [{'item_id': water, 'quantity': 2}],
+                                     'payment_method': method})
+    cancelled = client.post('/orders', json={'seat': '3B', 'items': [{'item_id': water}]}).get_json()
+    client.patch(f'/admin/orders/{cancelled["order_id"]}', json={'status': 'cancelled'}, headers=auth_header())
+
+    dims = ['zone', 'payment_method', 'kind']
+    rv = client.get('/admin/reports/sales/cube?dims=zone,payment_method,kind&metrics=revenue,orders',
+                    headers=auth_header())
+    assert rv.status_code == 200
+    data = rv.get_json()
+    with app.app_context():
+        expected = reference(dims, analytics_service.parse_zones(app.config['ANALYTICS_SEAT_ZONES']))
+    got = {tuple(r[d] for d in dims): (r['revenue'], r['orders']) for r in data['rows']}
+    assert got == expected
+    assert [r['revenue'] for r in data['rows']] == sorted((v[0] for v in expected.values()), reverse=True)
+    assert data['totals']['revenue'] == sum(v[0] for v in expected.values())
+
+
+def test_sales_cube_top_and_pivot(app, client, populate_orders, sample_data):
+    rv = client.get('/admin/reports/sales/cube?dims=category&metrics=quantity,avg_price&top=2&lang=en',
+                    headers=auth_header())
+    rows = rv.get_json()['rows']
+    assert len(rows) == 2
+    assert rows[0]['quantity'] >= rows[1]['quantity']
+    assert rows[0]['category_name'] == 'Services'
+    assert rows[0]['avg_price'] == 10.0
+
+    rv = client.get('/admin/reports/sales/cube?dims=category,kind&pivot=kind&from=2022-01-01&to=2023-01-01',
+                    headers=auth_header())
+    data = rv.get_json()
+    assert data['columns'] == [{'kind': 'goods'}, {'kind': 'services'}]
+    with app.app_context():
+        expected = reference(['category', 'kind'], [])
+    services = sample_data['categories']['Services']
+    by_category = {r['category']: r['values'] for r in data['rows']}
+    # one year of the three populated ones
+    assert by_category[services] == [0, expected[services, 'services'][0] / 3]
+    assert sum(sum(v) for v in by_category.values()) == data['totals']['revenue']
+
+
+def test_sales_cube_rejects_bad_parameters(client, populate_orders):
+    for query in ('dims=', 'dims=seat', 'dims=zone&metrics=profit', 'dims=zone,zone',
+                  'dims=zone&pivot=hour', 'dims=zone&from=yesterday'):
+        rv = client.get(f'/admin/reports/sales/cube?{query}', headers=auth_header())
+        assert rv.status_code == 400, query
+    assert client.get('/admin/reports/sales/cube?dims=zone').status_code == 401
+
+    with patch.object(analytics_service, 'np', None):
+        rv = client.get('/admin/reports/sales/cube?dims=zone', headers=auth_header())
+    assert rv.status_code == 501
+
+
+def test_fetch_lines_is_the_same_across_partitions(app, populate_orders):
+    with app.app_context():
+        whole = analytics_service.fetch_lines()
+        with patch.object(analytics_service, 'FETCH_PARTITION', 7):
+            parts = analytics_service.fetch_lines()
+    assert len(whole.order_id) == 360
+    for a, b in zip(whole, parts):
+        assert a.dtype == b.dtype and a.tolist() == b.tolist()
@@ -1,6 +1,12 @@
 import base64
+import logging
+from unittest.mock import patch
+
+import pytest
 from werkzeug.security import generate_password_hash
 
+from airservice.app import create_app
+from airservice.config import BaseConfig, DevConfig
 from airservice.models import db, User
 
 
@@ -97,3 +103,70 @@ def test_login_wrong_credentials_ru(client, app):
         rv.get_json()["error"]
         == "Неверные учётные данные. Проверьте почту и пароль и повторите попытку."
     )
+
+
+def test_bearer_token_authorizes_orders(client, app, sample_data):
+    with app.app_context():
+        db.session.add(User(
+            email="crew@example.com",
+            password_hash=generate_password_hash("password"),
+            seat="14C",
+        ))
+        db.session.commit()
+
+    rv = client.post(
+        "/auth/login",
+        json={"email": "crew@example.com", "password": "password"},
+    )
+    data = rv.get_json()
+    assert data["token_type"] == "Bearer"
+    assert data["expires_in"] == app.config["AUTH_TOKEN_TTL"]
+    bearer = {"Authorization": f"Bearer {data['token']}"}
+
+    item_id = sample_data["items"]["Паста Карбонара"]
+    with patch("airservice.api.orders.check_password_hash") as slow_check:
+        rv = client.post("/orders", json={"items": [{"item_id": item_id}]}, headers=bearer)
+    assert rv.status_code == 201
+    slow_check.assert_not_called()
+    assert client.get(f"/orders/{rv.get_json()['order_id']}").get_json()["seat"] == "14C"
+    # the request is logged for the seat of the token
+    logging.getLogger().handlers[0].flush()
+    logged = client.get("/admin/logs?user=seat:14C", headers=auth_header("admin", "admin")).get_json()
+    assert any(e["message"].startswith("order_created") for e in logged)
+
+    # a non-admin token does not open the admin endpoints
+    assert client.get("/admin/orders", headers=bearer).status_code == 401
+
+    tampered = {"Authorization": f"Bearer {data['token'][:-2]}xx"}
+    rv = client.post("/orders", json={"items": [{"item_id": item_id}]}, headers=tampered)
+    assert rv.status_code == 401
+
+
+def test_bearer_token_expires_and_grants_admin(client, app):
+    with app.app_context():
+        db.session.add(User(
+            email="purser@example.com",
+            password_hash=generate_password_hash("password"),
+            seat="1F",
+            is_admin=True,
+        ))
+        db.session.commit()
+    token = client.post(
+        "/auth/login",
+        json={"email": "purser@example.com", "password": "password"},
+    ).get_json()["token"]
+    bearer = {"Authorization": f"Bearer {token}"}
+    assert client.get("/admin/orders", headers=bearer).status_code == 200
+
+    app.config["AUTH_TOKEN_TTL"] = -1
+    assert client.get("/admin/orders", headers=bearer).status_code == 401
+
+
+def test_secret_key_is_required_outside_debug(app, monkeypatch):
+    monkeypatch.delenv("SECRET_KEY", raising=False)
+    with pytest.raises(RuntimeError, match="SECRET_KEY"):
+        create_app(BaseConfig)
+    with pytest.warns(RuntimeWarning, match="SECRET_KEY"):
+        assert create_app(DevConfig).config["SECRET_KEY"]
+    monkeypatch.setenv("SECRET_KEY", "shared")
+    assert create_app(BaseConfig).config["SECRET_KEY"] == "shared"
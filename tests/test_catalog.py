@@ -1,4 +1,12 @@
-from conftest import auth_header
+import threading
+
+import pytest
+from unittest.mock import patch
+
+from airservice.app import create_app
+from airservice.config import TestConfig
+from airservice.models import db
+from conftest import auth_header, count_queries
 
 
 
@@ -136,3 +144,376 @@ def test_catalog_categories_hierarchy(client, sample_data):
     assert 'Alcohol' in child_names
     assert 'image' in drinks
     assert 'image' in drinks['children'][0]
+
+
+def test_catalog_snapshot_matches_sql_path(app, client, sample_data):
+    food_cat = sample_data['categories']['Food']
+    queries = [
+        '/catalog',
+        '/catalog?lang=en',
+        f'/catalog?category={food_cat}&price_max=700',
+        '/catalog?price_min=100&price_max=800&service=0',
+        '/catalog?available=1&q=wifi',
+        '/catalog?q=Beef&lang=en',
+    ]
+    cached = [client.get(q).get_json() for q in queries]
+    app.config['CATALOG_SNAPSHOT'] = False
+    direct = [client.get(q).get_json() for q in queries]
+    assert cached == direct
+
+
+def test_catalog_snapshot_skips_db_and_invalidates(app, client, sample_data):
+    client.get('/catalog')
+    with count_queries(app) as statements:
+        rv = client.get('/catalog?service=1&price_max=100')
+    assert [i['name'] for i in rv.get_json()] == ['WiFi']
+    # only the catalog revision is read
+    assert len(statements) == 1 and 'catalog_revision' in statements[0]
+
+    app.config['CATALOG_REVISION_TTL'] = 60
+    client.get('/catalog')
+    with count_queries(app) as statements:
+        client.get('/catalog?service=1&price_max=100')
+    assert statements == []
+
+    wifi_id = sample_data['items']['WiFi']
+    client.put(f'/admin/items/{wifi_id}', json={'price': 150.0}, headers=auth_header())
+    rv = client.get('/catalog?service=1&price_max=100')
+    assert rv.get_json() == []
+
+
+def test_catalog_etag_not_modified(app, client, sample_data):
+    rv = client.get('/catalog?service=1')
+    etag = rv.headers['ETag']
+    assert rv.status_code == 200
+    assert 'public' in rv.headers['Cache-Control']
+    assert 'Accept-Language' in rv.headers['Vary']
+
+    with patch('airservice.api.catalog.catalog_service.render') as render:
+        rv = client.get('/catalog?service=1', headers={'If-None-Match': etag})
+        assert rv.status_code == 304
+        assert rv.data == b''
+        render.assert_not_called()
+
+    # other filters and languages are separate representations
+    assert client.get('/catalog?service=0').headers['ETag'] != etag
+    assert client.get('/catalog?service=1&lang=en').headers['ETag'] != etag
+
+    wifi_id = sample_data['items']['WiFi']
+    client.put(f'/admin/items/{wifi_id}', json={'price': 20.0}, headers=auth_header())
+    rv = client.get('/catalog?service=1', headers={'If-None-Match': etag})
+    assert rv.status_code == 200
+    assert rv.get_json()[0]['price'] == 20.0
+
+
+def test_categories_etag_follows_resolved_language(client, sample_data):
+    tag = client.get('/catalog/categories?lang=en').headers['ETag']
+    rv = client.get('/catalog/categories?lang=EN')
+    assert rv.headers['ETag'] == tag
+    assert rv.get_json()[0]['name'] == 'Food'
+    assert client.get('/catalog/categories?lang=ru').headers['ETag'] == client.get('/catalog/categories').headers['ETag'] != tag
+
+def test_catalog_errors_are_not_tagged(client, sample_data):
+    rv = client.get('/catalog?sort=bogus')
+    assert rv.status_code == 400
+    assert 'ETag' not in rv.headers
+    assert 'public' not in rv.headers.get('Cache-Control', '')
+
+
+def test_catalog_changes_etag_follows_revision(workers):
+    first, second = workers
+    etag = second.get('/catalog/changes?since=0').headers['ETag']
+    first.post('/admin/categories', json={'name_ru': 'Новое', 'name_en': 'New'}, headers=auth_header())
+    rv = second.get('/catalog/changes?since=0', headers={'If-None-Match': etag})
+    assert rv.status_code == 200
+    assert [c['name'] for c in rv.get_json()['categories']] == ['Новое']
+
+
+def test_categories_etag_changes_on_category_write(client, sample_data):
+    rv = client.get('/catalog/categories')
+    etag = rv.headers['ETag']
+    rv = client.get('/catalog/categories', headers={'If-None-Match': etag})
+    assert rv.status_code == 304
+
+    client.post('/admin/categories', json={'name_ru': 'Новое', 'name_en': 'New'}, headers=auth_header())
+    rv = client.get('/catalog/categories', headers={'If-None-Match': etag})
+    assert rv.status_code == 200
+    assert rv.headers['ETag'] != etag
+
+
+@pytest.fixture
+def workers(app, tmp_path, monkeypatch):
+    """Two apps sharing one database file, like two server processes."""
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path}/shared.db')
+    apps = [create_app(TestConfig) for _ in range(2)]
+    with apps[0].app_context():
+        db.create_all()
+    return [a.test_client() for a in apps]
+
+
+def test_catalog_snapshot_follows_writes_of_other_workers(workers):
+    first, second = workers
+    rv = first.post('/admin/items', json={'name_ru': 'Чай', 'name_en': 'Tea', 'price': 50.0},
+                    headers=auth_header())
+    item_id = rv.get_json()['id']
+    etag = second.get('/catalog').headers['ETag']
+    assert [i['price'] for i in second.get('/catalog').get_json()] == [50.0]
+    assert first.get('/catalog').headers['ETag'] == etag
+
+    first.put(f'/admin/items/{item_id}', json={'price': 60.0}, headers=auth_header())
+    rv = second.get('/catalog', headers={'If-None-Match': etag})
+    assert rv.status_code == 200
+    assert [i['price'] for i in rv.get_json()] == [60.0]
+
+
+def test_catalog_full_text_search(client, sample_data):
+    rv = client.get('/catalog?q=подушку')
+    assert [i['name'] for i in rv.get_json()] == ['Дорожная подушка']
+
+    rv = client.get('/catalog?q=борща')
+    assert [i['name'] for i in rv.get_json()] == ['Борщ']
+
+    rv = client.get('/catalog?q=pillows&lang=en')
+    assert [i['name'] for i in rv.get_json()] == ['Travel pillow']
+
+    # every word has to match, the last one may be incomplete
+    rv = client.get('/catalog?q=red wi&lang=en')
+    assert [i['name'] for i in rv.get_json()] == ['Red wine']
+
+
+def test_catalog_search_ranks_names_first(client, sample_data):
+    cat = sample_data['categories']['Food']
+    client.post(
+        '/admin/items',
+        json={
+            'name_ru': 'Соус', 'name_en': 'Sauce', 'price': 50.0, 'category_id': cat,
+            'description_en': 'Goes well with beef steak',
+        },
+        headers=auth_header(),
+    )
+    for snapshot in (True, False):
+        client.application.config['CATALOG_SNAPSHOT'] = snapshot
+        rv = client.get('/catalog?q=beef&lang=en')
+        assert [i['name'] for i in rv.get_json()] == ['Beef steak', 'Sauce']
+
+
+def _walk_pages(client, url):
+    items, cursor, pages = [], None, 0
+    while True:
+        rv = client.get(url + (f'&cursor={cursor}' if cursor else ''))
+        assert rv.status_code == 200
+        page = rv.get_json()
+        items += page['items']
+        pages += 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            return items, pages
+
+
+@pytest.mark.parametrize('snapshot', [True, False])
+@pytest.mark.parametrize('sort, key', [
+    ('id', lambda i: i['id']),
+    ('price', lambda i: (i['price'], i['id'])),
+    ('-price', lambda i: (-i['price'], -i['id'])),
+    ('name', lambda i: (i['name'], i['id'])),
+])
+def test_catalog_keyset_pagination(app, client, sample_data, snapshot, sort, key):
+    app.config['CATALOG_SNAPSHOT'] = snapshot
+    expected = sorted(client.get('/catalog?lang=en').get_json(), key=key)
+    assert client.get(f'/catalog?lang=en&sort={sort}').get_json() == expected
+
+    items, pages = _walk_pages(client, f'/catalog?lang=en&sort={sort}&limit=7')
+    assert items == expected
+    assert pages == 5
+
+    items, _ = _walk_pages(client, f'/catalog?lang=en&sort={sort}&limit=4&service=0&price_max=700')
+    assert items == [i for i in expected if not i['service'] and i['price'] <= 700]
+
+
+@pytest.mark.parametrize('snapshot', [True, False])
+def test_catalog_paginated_search_keeps_relevance(app, client, sample_data, snapshot):
+    app.config['CATALOG_SNAPSHOT'] = snapshot
+    expected = client.get('/catalog?q=набор').get_json()
+    assert len(expected) == 2
+    items, pages = _walk_pages(client, '/catalog?q=набор&limit=1')
+    assert items == expected and pages == 2
+
+
+def test_catalog_pagination_rejects_bad_params(client, sample_data):
+    assert client.get('/catalog?sort=colour').status_code == 400
+    assert client.get('/catalog?sort=relevance').status_code == 400
+    assert client.get('/catalog?cursor=garbage').status_code == 400
+    cursor = client.get('/catalog?sort=price&limit=2').get_json()['next_cursor']
+    assert client.get(f'/catalog?sort=price&cursor={cursor}').status_code == 200
+    rv = client.get(f'/catalog?sort=name&cursor={cursor}', headers={'Accept-Language': 'en'})
+    assert rv.status_code == 400
+    assert rv.get_json()['error'] == 'Invalid or outdated page cursor'
+    from airservice.services.catalog_service import encode_cursor
+    for key in ((True, 1), (1.5, False)):
+        rv = client.get(f'/catalog?sort=price&cursor={encode_cursor("price", False, key)}')
+        assert rv.status_code == 400
+
+
+def test_sorted_views_are_shared_between_threads(app, sample_data):
+    from airservice.services import catalog_service
+    with app.test_request_context():
+        snap = catalog_service.get_snapshot('ru')
+    views = []
+
+    def worker():
+        with app.app_context():
+            views.append(catalog_service._sorted(snap, 'price'))
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(views) == 8 and all(v is snap.views['price'] for v in views)
+
+
+def test_numpy_engine_matches_python(app, client, sample_data):
+    pytest.importorskip('numpy')
+    drinks = sample_data['categories']['Drinks']
+    queries = [
+        '/catalog',
+        f'/catalog?category={drinks}',
+        f'/catalog?category={drinks}&available=1&price_min=300',
+        '/catalog?service=0&price_max=700&sort=-price',
+        '/catalog?sort=name&lang=en&limit=5',
+        '/catalog?q=набор',
+        '/catalog?q=набор&sort=-relevance&limit=1',
+        '/catalog?q=nothing-matches',
+    ]
+    expected = [client.get(q).get_json() for q in queries]
+    app.config['CATALOG_FILTER_ENGINE'] = 'numpy'
+    assert [client.get(q).get_json() for q in queries] == expected
+    items, pages = _walk_pages(client, '/catalog?sort=price&limit=6&available=1')
+    app.config['CATALOG_FILTER_ENGINE'] = 'python'
+    assert (items, pages) == _walk_pages(client, '/catalog?sort=price&limit=6&available=1')
+
+
+@pytest.mark.parametrize('engine', ['python', 'numpy'])
+def test_item_writes_patch_snapshot_incrementally(app, client, sample_data, engine):
+    if engine == 'numpy':
+        pytest.importorskip('numpy')
+    app.config['CATALOG_FILTER_ENGINE'] = engine
+    food = sample_data['categories']['Food']
+    client.get('/catalog?available=1')
+
+    client.post('/admin/items', json={'name_ru': 'Суп', 'name_en': 'Soup', 'price': 99.0,
+                                      'category_id': food}, headers=auth_header())
+    wine_id = sample_data['items']['Вино красное сухое']
+    client.put(f'/admin/items/{wine_id}', json={'available': False}, headers=auth_header())
+    client.delete(f'/admin/items/{sample_data["items"]["Борщ"]}', headers=auth_header())
+
+    with count_queries(app) as statements:
+        rv = client.get(f'/catalog?available=1&category={food}&price_max=500')
+        names = {i['name'] for i in rv.get_json()}
+        rv = client.get('/catalog?available=0')
+        unavailable = [i['id'] for i in rv.get_json()]
+    assert names == {'Суп', 'Вегетарианский салат'}
+    assert unavailable == [wine_id]
+    # besides the revision reads, only the subtree lookup for the category
+    # filter hits the database
+    assert len([s for s in statements if 'catalog_revision' not in s]) == 1
+
+
+FACET_QUERIES = [
+    '/catalog/facets',
+    '/catalog/facets?available=1',
+    '/catalog/facets?category={drinks}',
+    '/catalog/facets?category={drinks}&price_min=300&service=0',
+    '/catalog/facets?q=набор',
+    '/catalog/facets?q=nothing-matches',
+]
+
+
+def test_catalog_facets_counts(client, sample_data):
+    drinks = sample_data['categories']['Drinks']
+    alcohol = sample_data['categories']['Alcohol']
+    data = client.get(f'/catalog/facets?category={drinks}').get_json()
+    assert data['total'] == 8
+    counts = {c['id']: c['count'] for c in data['categories']}
+    # the parent category includes the items of its subcategory
+    assert counts == {drinks: 8, alcohol: 3}
+    assert data['service'] == {'goods': 8, 'services': 0}
+    assert data['available'] == {'available': 8, 'unavailable': 0}
+    assert data['price'] == [
+        {'min': 0.0, 'max': 250.0, 'count': 2},
+        {'min': 250.0, 'max': 500.0, 'count': 4},
+        {'min': 500.0, 'max': 1000.0, 'count': 2},
+        {'min': 1000.0, 'max': 2000.0, 'count': 0},
+        {'min': 2000.0, 'max': None, 'count': 0},
+    ]
+
+
+def test_catalog_facets_engines_and_sql_agree(app, client, sample_data):
+    queries = [q.format(drinks=sample_data['categories']['Drinks']) for q in FACET_QUERIES]
+    expected = [client.get(q).get_json() for q in queries]
+    app.config['CATALOG_SNAPSHOT'] = False
+    assert [client.get(q).get_json() for q in queries] == expected
+    pytest.importorskip('numpy')
+    app.config['CATALOG_SNAPSHOT'] = True
+    app.config['CATALOG_FILTER_ENGINE'] = 'numpy'
+    assert [client.get(q).get_json() for q in queries] == expected
+
+
+def test_catalog_facets_cached_per_revision(app, client, sample_data):
+    food = sample_data['categories']['Food']
+    before = client.get(f'/catalog/facets?category={food}').get_json()
+    with count_queries(app) as statements:
+        assert client.get(f'/catalog/facets?category={food}').get_json() == before
+    assert len(statements) == 1 and 'catalog_revision' in statements[0]
+
+    client.post('/admin/items', json={'name_ru': 'Суп', 'name_en': 'Soup', 'price': 99.0,
+                                      'category_id': food}, headers=auth_header())
+    after = client.get(f'/catalog/facets?category={food}').get_json()
+    assert after['total'] == before['total'] + 1
+    assert after['price'][0]['count'] == before['price'][0]['count'] + 1
+
+
+def test_catalog_changes_feed(client, sample_data):
+    full = client.get('/catalog/changes').get_json()
+    assert full['reset'] is True
+    assert len(full['items']) == len(client.get('/catalog').get_json())
+    assert len(full['categories']) == len(sample_data['categories'])
+    since = full['revision']
+
+    rv = client.get(f'/catalog/changes?since={since}').get_json()
+    assert (rv['reset'], rv['items'], rv['categories']) == (False, [], [])
+    assert rv['deleted'] == {'items': [], 'categories': []}
+
+    wine_id = sample_data['items']['Вино красное сухое']
+    client.put(f'/admin/items/{wine_id}', json={'available': False}, headers=auth_header())
+    borscht_id = sample_data['items']['Борщ']
+    client.delete(f'/admin/items/{borscht_id}', headers=auth_header())
+    rv = client.get(f'/catalog/changes?since={since}').get_json()
+    assert rv['revision'] == since + 2
+    assert [(i['id'], i['available']) for i in rv['items']] == [(wine_id, False)]
+    assert rv['deleted'] == {'items': [borscht_id], 'categories': []}
+
+    since = rv['revision']
+    alcohol = sample_data['categories']['Alcohol']
+    client.put(f'/admin/categories/{alcohol}', json={'name_en': 'Spirits'}, headers=auth_header())
+    rv = client.get(f'/catalog/changes?since={since}&lang=en').get_json()
+    assert [c['name'] for c in rv['categories']] == ['Spirits']
+    # items carry the category name, so they are resent as well
+    assert {i['category'] for i in rv['items']} == {'Spirits'}
+    assert len(rv['items']) == 3
+
+
+def test_catalog_changes_category_delete_and_reset(client, sample_data):
+    since = client.get('/catalog/changes').get_json()['revision']
+    drinks = sample_data['categories']['Drinks']
+    alcohol = sample_data['categories']['Alcohol']
+    client.delete(f'/admin/categories/{drinks}', headers=auth_header())
+    rv = client.get(f'/catalog/changes?since={since}').get_json()
+    assert rv['deleted']['categories'] == [drinks]
+    assert [(c['id'], c['parent_id']) for c in rv['categories']] == [(alcohol, None)]
+    assert len(rv['items']) == 5
+    assert all(i['category_id'] is None for i in rv['items'])
+
+    # a client ahead of the server starts over
+    rv = client.get(f'/catalog/changes?since={rv["revision"] + 10}').get_json()
+    assert rv['reset'] is True
+    assert rv['deleted'] == {'items': [], 'categories': []}
@@ -0,0 +1,69 @@
+import pytest
+
+from conftest import auth_header
+from airservice.models import db, CategoryClosure
+from airservice.services import category_service
+
+
+def _closure(app):
+    with app.app_context():
+        return sorted(
+            (c.ancestor_id, c.descendant_id, c.depth) for c in CategoryClosure.query.all()
+        )
+
+
+@pytest.fixture
+def deep_tree(client):
+    """A chain of six nested categories with two items on every level."""
+    chain = []
+    parent = None
+    for level in range(6):
+        payload = {'name_ru': f'Уровень {level}', 'name_en': f'Level {level}'}
+        if parent:
+            payload['parent_id'] = parent
+        parent = client.post('/admin/categories', json=payload, headers=auth_header()).get_json()['id']
+        chain.append(parent)
+        for n in range(2):
+            client.post('/admin/items', json={
+                'name_ru': f'Товар {level}.{n}', 'name_en': f'Item {level}.{n}',
+                'price': 10.0 * (level + 1), 'category_id': parent,
+            }, headers=auth_header())
+    return chain
+
+
+@pytest.mark.parametrize('snapshot', [True, False])
+def test_catalog_category_filter_covers_subtree(app, client, deep_tree, snapshot):
+    app.config['CATALOG_SNAPSHOT'] = snapshot
+    for level, cat_id in enumerate(deep_tree):
+        data = client.get(f'/catalog?category={cat_id}').get_json()
+        assert len(data) == 2 * (6 - level)
+    cat_id = deep_tree[2]
+    data = client.get(f'/catalog?category={cat_id}&price_max=40').get_json()
+    assert {i['name'] for i in data} == {'Товар 2.0', 'Товар 2.1', 'Товар 3.0', 'Товар 3.1'}
+
+
+def test_closure_follows_moves_and_deletes(app, client, deep_tree):
+    # move level 3 (with levels 4-5) directly under the root
+    rv = client.put(f'/admin/categories/{deep_tree[3]}', json={'parent_id': deep_tree[0]}, headers=auth_header())
+    assert rv.status_code == 200
+    assert len(client.get(f'/catalog?category={deep_tree[1]}').get_json()) == 4
+    assert len(client.get(f'/catalog?category={deep_tree[0]}').get_json()) == 12
+
+    # a category cannot move below its own descendant
+    rv = client.put(f'/admin/categories/{deep_tree[0]}', json={'parent_id': deep_tree[5]}, headers=auth_header())
+    assert rv.status_code == 400
+    rv = client.post('/admin/categories', json={'name_ru': 'x', 'name_en': 'x', 'parent_id': 9999}, headers=auth_header())
+    assert rv.status_code == 400
+
+    # detach to the root, then delete the old root: its children become roots
+    client.put(f'/admin/categories/{deep_tree[5]}', json={'parent_id': None}, headers=auth_header())
+    assert len(client.get(f'/catalog?category={deep_tree[3]}').get_json()) == 4
+    assert client.delete(f'/admin/categories/{deep_tree[0]}', headers=auth_header()).status_code == 204
+    assert len(client.get(f'/catalog?category={deep_tree[1]}').get_json()) == 4
+    assert len(client.get(f'/catalog?category={deep_tree[3]}').get_json()) == 4
+
+    maintained = _closure(app)
+    with app.app_context():
+        category_service.rebuild_closure()
+        db.session.commit()
+    assert _closure(app) == maintained
@@ -6,8 +6,9 @@ from airservice.models import db
 
 
 @pytest.fixture
-def cors_client(monkeypatch):
+def cors_client(monkeypatch, tmp_path):
     monkeypatch.setenv("DATABASE_URL", "sqlite:///:memory:")
+    monkeypatch.setenv("LOG_DIR", str(tmp_path / "logs"))
     monkeypatch.setenv("ADMIN_USERNAME", "admin")
     from werkzeug.security import generate_password_hash
     monkeypatch.setenv("ADMIN_PASSWORD_HASH", generate_password_hash("admin"))
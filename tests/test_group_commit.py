@@ -0,0 +1,63 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from airservice.models import db, Order, OrderItem
+from airservice.services import order_service
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    # the writer thread needs a database shared between connections
+    return f'sqlite:///{tmp_path / "orders.db"}'
+
+
+@pytest.fixture
+def app(app):
+    app.config.update(ORDER_GROUP_COMMIT=True, ORDER_GROUP_COMMIT_WINDOW_MS=20)
+    yield app
+    writer = app.extensions.get('order_writer')
+    if writer is not None:
+        writer.stop()
+
+
+def test_group_commit_creates_orders(client, sample_data):
+    pasta = sample_data['items']['Паста Карбонара']
+    rv = client.post('/orders', json={'seat': '3C', 'items': [{'item_id': pasta, 'quantity': 2}]})
+    assert rv.status_code == 201
+    data = client.get(f'/orders/{rv.get_json()["order_id"]}').get_json()
+    assert (data['seat'], data['total']) == ('3C', 1360.0)
+
+    rv = client.post('/orders', json={'seat': '3C', 'items': [{'item_id': 10 ** 6}]})
+    assert rv.status_code == 400
+
+
+def test_group_commit_batches_concurrent_orders(app, sample_data):
+    pasta = sample_data['items']['Паста Карбонара']
+    water = sample_data['items']['Минеральная вода']
+    results = []
+    gate = threading.Barrier(20)
+
+    def post(n):
+        client = app.test_client()
+        gate.wait()
+        rv = client.post('/orders', json={
+            'seat': f'{n}A', 'items': [{'item_id': pasta}, {'item_id': water, 'quantity': 3}],
+        }, headers={'Idempotency-Key': f'k{n % 10}'})
+        results.append((rv.status_code, rv.get_json()['order_id']))
+
+    with patch.object(order_service, 'create_orders', wraps=order_service.create_orders) as batches:
+        threads = [threading.Thread(target=post, args=(n,)) for n in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    # every key created exactly one order; repeats got the same id back
+    assert sorted(code for code, _ in results) == [200] * 10 + [201] * 10
+    assert len({order_id for _, order_id in results}) == 10
+    assert batches.call_count < 20
+    with app.app_context():
+        assert Order.query.count() == 10
+        assert OrderItem.query.count() == 20
@@ -0,0 +1,86 @@
+import os
+import shutil
+
+import pytest
+
+from conftest import auth_header
+
+pytest.importorskip('PIL')
+
+
+@pytest.fixture
+def image_cache(app, tmp_path):
+    app.config['IMAGE_CACHE_DIR'] = str(tmp_path / 'cache')
+    return tmp_path / 'cache'
+
+
+def test_catalog_links_image_derivatives(client, sample_data, image_cache):
+    beef = client.get('/catalog?q=Beef&lang=en').get_json()[0]
+    assert set(beef['images']) == {'thumb', 'card', 'detail'}
+    assert beef['image'] == beef['images']['card']
+    assert beef['images']['thumb'].startswith('/img/thumb/')
+    assert beef['images']['thumb'].endswith('/products/marbled_beef.jpg')
+
+    drinks = next(c for c in client.get('/catalog/categories').get_json() if c['name'] == 'Напитки')
+    assert drinks['image'].startswith('/img/card/')
+    items = client.get('/admin/items', headers=auth_header()).get_json()
+    assert all(i['images']['detail'].startswith('/img/detail/') for i in items if i['image'])
+
+
+def test_derivative_generated_lazily_and_cached(client, sample_data, image_cache):
+    from PIL import Image
+    url = client.get('/catalog?q=Beef&lang=en').get_json()[0]['images']['thumb']
+    assert not image_cache.exists()
+
+    rv = client.get(url)
+    assert rv.status_code == 200
+    assert rv.mimetype == 'image/webp'
+    assert 'immutable' in rv.headers['Cache-Control']
+    assert 'max-age=31536000' in rv.headers['Cache-Control']
+    [generated] = list((image_cache / 'thumb').iterdir())
+    with Image.open(generated) as img:
+        assert img.format == 'WEBP'
+        assert max(img.size) <= 160
+
+    mtime = generated.stat().st_mtime_ns
+    assert client.get(url).data == rv.data
+    assert generated.stat().st_mtime_ns == mtime
+
+
+def test_derivative_url_errors(client, sample_data, image_cache):
+    url = client.get('/catalog?q=Beef&lang=en').get_json()[0]['images']['card']
+    assert client.get(url.replace('/card/', '/huge/')).status_code == 404
+    assert client.get(url.replace('marbled_beef', 'missing')).status_code == 404
+    stale = url.replace(url.split('/')[3], '0' * 16)
+    rv = client.get(stale)
+    assert rv.status_code == 302
+    assert rv.headers['Location'].endswith(url)
+
+
+def test_build_image_derivatives_cli(app, image_cache):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['build-image-derivatives'])
+    # identical source files share their derivatives
+    written = len(list(image_cache.glob('*/*.webp')))
+    assert written > 0
+    assert f'Generated {written} image derivatives' in result.output
+    result = runner.invoke(args=['build-image-derivatives'])
+    assert 'Generated 0 image derivatives' in result.output
+
+
+def test_replaced_source_gets_new_url(app, client, tmp_path, image_cache):
+    from airservice.services import image_service
+    images = tmp_path / 'static' / 'images'
+    shutil.copytree(os.path.join(app.root_path, 'static', 'images', 'products'), images / 'products')
+    app.root_path = str(tmp_path)
+    with app.test_request_context():
+        before = image_service.image_url('products/borsch.jpg')
+        shutil.copy(images / 'products' / 'beer_white.jpg', images / 'products' / 'borsch.jpg')
+        after = image_service.image_url('products/borsch.jpg')
+    assert before != after
+
+
+def test_originals_linked_when_disabled(app, client, sample_data):
+    app.config['IMAGE_DERIVATIVES'] = False
+    beef = client.get('/catalog?q=Beef&lang=en').get_json()[0]
+    assert beef['image'] == '/images/products/marbled_beef.jpg'
@@ -1,3 +1,11 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from airservice.services import log_store, log_writer
 from conftest import auth_header
 
 
@@ -11,3 +19,128 @@ def test_admin_logs_filters(client, sample_logs):
 
     rv = client.get('/admin/logs?from=2024-01-02T00:00:00&to=2024-01-03T00:00:00', headers=auth_header())
     assert len(rv.get_json()) == 1
+
+
+def _entries(n):
+    users = ['admin', 'guest', 'token']
+    endpoints = ['/orders', '/admin/items', '/catalog']
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [{
+        'timestamp': (start + timedelta(minutes=7 * i)).isoformat(),
+        'user': users[i % 3],
+        'endpoint': endpoints[i % 5 % 3],
+        'message': f'event {i}',
+    } for i in range(n)]
+
+
+def _write(store, entries):
+    for e in entries:
+        store.write(json.dumps(e), log_store.to_epoch(e['timestamp']), e['user'], e['endpoint'])
+
+
+def test_log_store_pages_newest_first_across_segments(tmp_path):
+    store = log_store.LogStore(str(tmp_path), segment_seconds=3600, max_bytes=600)
+    entries = _entries(300)
+    _write(store, entries[:200])
+    store.close()  # sealed segments get sidecars, the rest is indexed from the file
+    _write(store, entries[200:])
+    assert len(store.segments()) > 35
+    assert len(list(tmp_path.glob('*.idx'))) == len(store.segments()) - 1
+
+    dt_from = datetime(2024, 1, 1, 5)
+    dt_to = datetime(2024, 1, 1, 20, tzinfo=timezone.utc)
+    expected = [
+        e for e in reversed(entries)
+        if e['user'] == 'admin' and e['endpoint'] == '/orders'
+        and dt_from.replace(tzinfo=timezone.utc) <= datetime.fromisoformat(e['timestamp']) <= dt_to
+    ]
+    reader = log_store.LogStore(str(tmp_path))
+    for s in (store, reader):
+        got, before = [], None
+        while True:
+            page, before = s.search(dt_from, dt_to, user='admin', endpoint='/orders', before=before, limit=4)
+            got += page
+            if before is None:
+                break
+        assert got == expected and len(expected) > 4
+
+    assert reader.search(text='event 137')[0] == [entries[137]]
+    assert reader.search(user='nobody') == ([], None)
+
+
+def test_log_store_sorts_lines_written_out_of_order(tmp_path):
+    store = log_store.LogStore(str(tmp_path))
+    entries = _entries(6)
+    _write(store, [entries[i] for i in (0, 3, 1, 5, 2, 4)])
+    assert store.search()[0] == list(reversed(entries))
+    assert store.search(user='guest')[0] == [entries[4], entries[1]]
+
+
+def test_admin_logs_paging_and_handler(app, client):
+    client.post('/admin/items', json={}, headers=auth_header())
+    with app.test_request_context('/admin/items', headers=auth_header()):
+        app.preprocess_request()
+        logging.getLogger('test').info('first')
+        logging.getLogger('test').info('second')
+    logging.getLogger().handlers[0].flush()
+
+    rv = client.get('/admin/logs?user=admin&endpoint=/admin/items&limit=1', headers=auth_header())
+    page = rv.get_json()
+    assert [e['message'] for e in page['items']] == ['second']
+    rv = client.get(f'/admin/logs?user=admin&limit=1&cursor={page["next_cursor"]}', headers=auth_header())
+    assert [e['message'] for e in rv.get_json()['items']] == ['first']
+
+    assert client.get('/admin/logs?cursor=bogus', headers=auth_header()).status_code == 400
+
+
+@contextmanager
+def _pipeline(tmp_path, **kw):
+    store = log_store.LogStore(str(tmp_path))
+    handler = log_writer.LogQueueHandler(store, **kw)
+    logger = logging.getLogger('test.pipeline')
+    logger.propagate = False
+    logger.addHandler(handler)
+    # hold the writer inside its first batch until released
+    entered, release = threading.Event(), threading.Event()
+    write_records = store.write_records
+
+    def slow_write(records):
+        entered.set()
+        release.wait()
+        write_records(records)
+    store.write_records = slow_write
+    try:
+        yield store, handler, logger, entered, release
+    finally:
+        release.set()
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def test_log_queue_drops_on_overflow_and_reports(tmp_path):
+    with _pipeline(tmp_path, size=2, overflow='drop') as (store, handler, logger, entered, release):
+        args = ['before']
+        logger.info('first %s', args)
+        args[0] = 'after'  # the message is resolved when logged
+        assert entered.wait(5)
+        for n in range(10):
+            logger.info('burst %d', n)
+        release.set()
+        handler.flush()
+        messages = [e['message'] for e in store.search()[0]]
+    assert messages == ['log_records_dropped 8', 'burst 1', 'burst 0', "first ['before']"]
+
+
+def test_log_queue_blocks_on_overflow(tmp_path):
+    with _pipeline(tmp_path, size=1, overflow='block') as (store, handler, logger, entered, release):
+        logger.info('first')
+        assert entered.wait(5)
+        sender = threading.Thread(target=lambda: [logger.info('queued %d', n) for n in range(3)])
+        sender.start()
+        time.sleep(0.05)
+        assert sender.is_alive()  # waiting for room in the queue
+        release.set()
+        sender.join(5)
+        handler.flush()
+        messages = [e['message'] for e in store.search()[0]]
+    assert messages == ['queued 2', 'queued 1', 'queued 0', 'first']
@@ -91,3 +91,129 @@ def test_list_orders_filters(client, sample_data):
 
     rv = client.get('/orders')
     assert rv.status_code == 400
+
+
+def test_repeated_idempotency_key_skips_database(app, client, sample_data):
+    from conftest import count_queries
+    item_id = sample_data['items']['Паста Карбонара']
+    payload = {'seat': '4D', 'items': [{'item_id': item_id}]}
+    order_id = client.post('/orders', json=payload, headers={'Idempotency-Key': 'retry'}).get_json()['order_id']
+    with count_queries(app) as statements:
+        rv = client.post('/orders', json=payload, headers={'Idempotency-Key': 'retry'})
+    assert (rv.status_code, rv.get_json()['order_id']) == (200, order_id)
+    assert statements == []
+
+    # a failed request frees the key for the next attempt
+    bad = {'seat': '4D', 'items': [{'item_id': 10 ** 6}]}
+    assert client.post('/orders', json=bad, headers={'Idempotency-Key': 'k2'}).status_code == 400
+    assert client.post('/orders', json=payload, headers={'Idempotency-Key': 'k2'}).status_code == 201
+
+
+def test_order_keeps_prices_from_creation(client, sample_data):
+    pasta = sample_data['items']['Паста Карбонара']
+    water = sample_data['items']['Минеральная вода']
+    rv = client.post('/orders', json={
+        'seat': '9F', 'items': [{'item_id': pasta, 'quantity': 2}, {'item_id': water}],
+    })
+    order_id = rv.get_json()['order_id']
+    client.put(f'/admin/items/{pasta}', json={'price': 999.0}, headers=auth_header())
+
+    data = client.get(f'/orders/{order_id}').get_json()
+    assert (data['total'], data['item_count']) == (1510.0, 3)
+    assert [i['price'] for i in data['items']] == [680.0, 150.0]
+    [listed] = client.get('/admin/orders?seat=9F', headers=auth_header()).get_json()
+    assert listed['total'] == 1510.0
+    year = data['created_at'][:4]
+    month = data['created_at'][:7]
+    sales = client.get(f'/admin/reports/sales?year={year}', headers=auth_header()).get_json()
+    assert sales[month]['goods'] == 1510.0
+
+
+def test_order_history_keyset_pagination(client, sample_data):
+    pasta = sample_data['items']['Паста Карбонара']
+    ids = []
+    for n in range(7):
+        rv = client.post('/orders', json={'seat': '30A', 'items': [{'item_id': pasta, 'quantity': n + 1}]})
+        ids.append(rv.get_json()['order_id'])
+    client.post('/orders', json={'seat': '30B', 'items': [{'item_id': pasta}]})
+    client.patch(f'/admin/orders/{ids[2]}', json={'status': 'done'}, headers=auth_header())
+
+    seen, url = [], '/orders?seat=30A&limit=3'
+    while url:
+        page = client.get(url).get_json()
+        assert len(page['items']) <= 3
+        seen += [o['id'] for o in page['items']]
+        url = page['next_cursor'] and f'/orders?seat=30A&limit=3&cursor={page["next_cursor"]}'
+    assert seen == ids
+    assert [o['id'] for o in client.get('/orders?seat=30A').get_json()] == ids
+
+    page = client.get('/orders?seat=30A&status=new&limit=10').get_json()
+    assert [o['id'] for o in page['items']] == ids[:2] + ids[3:]
+    assert page['next_cursor'] is None
+    assert page['items'][0]['item_count'] == 1
+
+    rv = client.get('/orders?seat=30A&cursor=bogus')
+    assert rv.status_code == 400
+
+
+def test_order_batch_reports_per_entry_results(app, client, sample_data):
+    from unittest.mock import patch
+    pasta = sample_data['items']['Паста Карбонара']
+    water = sample_data['items']['Минеральная вода']
+    client.post('/orders', json={'seat': '1A', 'items': [{'item_id': water}]},
+                headers={'Idempotency-Key': 'seen'})
+    batch = {'orders': [
+        {'seat': '12A', 'items': [{'item_id': pasta, 'quantity': 2}], 'idempotency_key': 'a'},
+        {'seat': '12B', 'items': [{'item_id': 10 ** 6}]},
+        {'items': [{'item_id': pasta}]},
+        {'seat': '12C', 'items': [{'item_id': water}], 'idempotency_key': 'seen'},
+        {'seat': '12D', 'items': [{'item_id': water}, {'item_id': pasta}], 'payment_method': 'cash'},
+    ]}
+    assert client.post('/orders/batch', json=batch).status_code == 401
+    with patch('airservice.services.order_service.push_event') as pe:
+        rv = client.post('/orders/batch', json=batch, headers=auth_header())
+    assert rv.status_code == 200
+    results = rv.get_json()['results']
+    assert [r.get('status') for r in results] == ['created', None, None, 'existing', 'created']
+    assert '1000000' in results[1]['error']
+    assert 'seat' in results[2]['details']
+    pe.assert_called_once_with({
+        'type': 'orders_created', 'order_ids': [results[0]['order_id'], results[4]['order_id']],
+    })
+    order = client.get(f'/orders/{results[4]["order_id"]}').get_json()
+    assert (order['seat'], order['total']) == ('12D', 830.0)
+
+    # resubmitting the batch creates nothing new
+    rv = client.post('/orders/batch', json=batch, headers=auth_header())
+    assert rv.get_json()['results'][0] == {'order_id': results[0]['order_id'], 'status': 'existing'}
+
+    assert client.post('/orders/batch', json={'orders': []}, headers=auth_header()).status_code == 400
+
+
+def test_order_batch_fallback_reports_per_entry_errors(app, sample_data):
+    from unittest.mock import patch
+    from sqlalchemy.exc import IntegrityError
+    from airservice.models import Item, Order, db
+    from airservice.services import order_service
+    pasta = sample_data['items']['Паста Карбонара']
+    water = sample_data['items']['Минеральная вода']
+    with app.test_request_context():
+        orders = [
+            order_service.NewOrder('5A', order_service.price_lines([{'item_id': pasta}])),
+            order_service.NewOrder('5B', order_service.price_lines([{'item_id': water}])),
+        ]
+        # the water is gone by the time the entries are retried one by one
+        db.session.delete(db.session.get(Item, water))
+        db.session.commit()
+        flush = db.session.flush
+        conflicts = [IntegrityError('INSERT', {}, Exception('concurrent writer'))]
+
+        def flaky_flush(*args, **kwargs):
+            if conflicts:
+                raise conflicts.pop()
+            return flush(*args, **kwargs)
+        with patch.object(db.session, 'flush', flaky_flush):
+            results = order_service.create_orders(orders)
+        assert results[0][1] is True
+        assert isinstance(results[1], ValueError) and str(water) in str(results[1])
+        assert db.session.get(Order, results[0][0]).seat == '5A'
@@ -0,0 +1,109 @@
+import pytest
+
+from conftest import auth_header, count_queries
+
+
+@pytest.fixture
+def orders(client, sample_data):
+    pasta = sample_data['items']['Паста Карбонара']
+    water = sample_data['items']['Минеральная вода']
+    ids = []
+    for _ in range(5):
+        rv = client.post('/orders', json={
+            'seat': '7C',
+            'items': [{'item_id': pasta, 'quantity': 2}, {'item_id': water}],
+        })
+        ids.append(rv.get_json()['order_id'])
+    return ids
+
+
+@pytest.mark.parametrize('url', [
+    '/catalog',
+    '/catalog?lang=en&service=0&price_max=900',
+])
+def test_catalog_sql_path_single_query(app, client, sample_data, url):
+    app.config['CATALOG_SNAPSHOT'] = False
+    with count_queries(app) as statements:
+        rv = client.get(url)
+    assert rv.status_code == 200
+    # the catalog revision for the ETag, then the items
+    assert len(statements) == 2
+
+
+def test_catalog_snapshot_build_single_query(app, client, sample_data):
+    with count_queries(app) as statements:
+        client.get('/catalog')
+        client.get('/catalog?available=1')
+    # one revision read per request and a single build
+    assert len(statements) == 3
+
+
+def test_get_order_single_query(app, client, orders):
+    with count_queries(app) as statements:
+        rv = client.get(f'/orders/{orders[0]}')
+    assert rv.get_json()['total'] == 1510.0
+    assert len(statements) == 1
+
+
+def test_list_orders_single_query(app, client, orders):
+    with count_queries(app) as statements:
+        rv = client.get('/orders?seat=7C')
+    data = rv.get_json()
+    assert [o['id'] for o in data] == orders
+    assert all(len(o['items']) == 2 for o in data)
+    assert len(statements) == 1
+
+
+def test_admin_list_orders_single_query(app, client, orders):
+    with count_queries(app) as statements:
+        rv = client.get('/admin/orders?seat=7C', headers=auth_header())
+    assert len(rv.get_json()) == 5
+    assert len(statements) == 1
+
+
+def test_create_order_round_trips(app, client, sample_data):
+    items = [{'item_id': item_id, 'quantity': 2} for item_id in list(sample_data['items'].values())[:10]]
+    with count_queries(app) as statements:
+        rv = client.post('/orders', json={'seat': '7C', 'items': items})
+    assert rv.status_code == 201
+    # item lookup, order insert, bulk line insert, sales rollup upsert,
+    # reload after commit
+    assert len(statements) == 5
+
+
+def test_order_history_page_single_query(app, client, orders):
+    cursor = client.get('/orders?seat=7C&limit=2').get_json()['next_cursor']
+    with count_queries(app) as statements:
+        page = client.get(f'/orders?seat=7C&limit=2&cursor={cursor}').get_json()
+    assert [o['id'] for o in page['items']] == orders[2:4]
+    assert all(len(o['items']) == 2 for o in page['items'])
+    assert len(statements) == 1
+
+
+def test_order_history_uses_seat_index(app, orders):
+    from sqlalchemy import text
+    from airservice.models import db
+    with app.app_context():
+        plan = ' '.join(str(r[-1]) for r in db.session.execute(text(
+            'EXPLAIN QUERY PLAN SELECT id FROM "order" WHERE seat = :seat AND (status || \'\') = :status '
+            'AND created_at >= :created_at AND (created_at > :created_at OR id > :id) '
+            'ORDER BY created_at, id LIMIT 20'
+        ), {'seat': '7C', 'status': 'new', 'created_at': '2026-01-01', 'id': 1}))
+    assert 'ix_order_seat_created_at (seat=? AND created_at>?)' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_order_batch_round_trips(app, client, sample_data):
+    item_ids = list(sample_data['items'].values())
+    batch = {'orders': [
+        {'seat': f'{n}A', 'items': [{'item_id': item_ids[n]}, {'item_id': item_ids[n + 1]}],
+         'idempotency_key': f'row-{n}'}
+        for n in range(20)
+    ]}
+    with count_queries(app) as statements:
+        rv = client.post('/orders/batch', json=batch, headers=auth_header())
+    assert [r['status'] for r in rv.get_json()['results']] == ['created'] * 20
+    # one price lookup and one key lookup for the whole batch, one line insert
+    selects = [s for s in statements if s.startswith('SELECT')]
+    assert len(selects) == 2
+    assert sum(s.startswith('INSERT INTO order_item') for s in statements) == 1
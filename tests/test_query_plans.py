@@ -0,0 +1,79 @@
+"""Query plans of the hot listings must stay on indexes.
+
+Each request below is replayed with its statements captured; every SELECT
+and UPDATE is run through ``EXPLAIN QUERY PLAN`` on SQLite, and through
+``EXPLAIN`` on PostgreSQL when ``POSTGRES_TEST_URL`` points at a scratch
+database. A table read with a full scan fails the test.
+"""
+import os
+import re
+
+import pytest
+
+from airservice.models import db
+from conftest import auth_header, count_queries
+
+HOT_REQUESTS = [
+    ('GET', '/orders?seat=7C&limit=2'),
+    ('GET', '/orders?seat=7C&status=new&limit=2'),
+    ('GET', '/orders/{order}'),
+    ('GET', '/admin/orders?status=new'),
+    ('GET', '/admin/orders?seat=7C'),
+    ('GET', '/admin/orders?from=2022-01-01&to=2022-12-31'),
+    ('GET', '/admin/reports/sales?year=2022'),
+    ('GET', '/catalog?category={food}'),
+    ('GET', '/retry_pending'),
+    ('DELETE', '/admin/categories/{drinks}'),
+]
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def database_url(request):
+    if request.param == 'sqlite':
+        return 'sqlite:///:memory:'
+    url = os.getenv('POSTGRES_TEST_URL')
+    if not url:
+        pytest.skip('POSTGRES_TEST_URL is not set')
+    return url
+
+
+def explain(conn, statement, params):
+    if conn.dialect.name == 'sqlite':
+        return [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, params)]
+    return [row[0] for row in conn.exec_driver_sql('EXPLAIN ' + statement, params)]
+
+
+def full_scans(plan, dialect):
+    if dialect == 'sqlite':
+        # "SCAN t" reads every row; "SEARCH t USING ..." is an index lookup
+        return [line for line in plan if re.match(r'SCAN \w+$', line)]
+    return [line for line in plan if 'Seq Scan on' in line]
+
+
+@pytest.mark.parametrize('method,url', HOT_REQUESTS)
+def test_hot_queries_use_indexes(app, client, sample_data, method, url):
+    pasta = sample_data['items']['Паста Карбонара']
+    order = None
+    for _ in range(3):
+        rv = client.post('/orders', json={'seat': '7C', 'items': [{'item_id': pasta}]})
+        order = rv.get_json()['order_id']
+    url = url.format(order=order, **{k.lower(): v for k, v in sample_data['categories'].items()})
+
+    # the catalog listing is served from SQL, not the in-process snapshot
+    app.config['CATALOG_SNAPSHOT'] = False
+    with count_queries(app, with_params=True) as executed:
+        client.open(url, method=method, headers=auth_header())
+    statements = [(statement, params) for statement, params in executed
+                  if statement.lstrip().upper().startswith(('SELECT', 'UPDATE'))]
+    assert statements
+
+    with app.app_context():
+        conn = db.session.connection()
+        dialect = conn.dialect.name
+        if dialect == 'postgresql':
+            # the tables are tiny; make the planner show what it can use
+            conn.exec_driver_sql('SET enable_seqscan = off')
+        for statement, params in statements:
+            plan = explain(conn, statement, params)
+            assert not full_scans(plan, dialect), '\n'.join([statement, *plan])
+        db.session.rollback()
@@ -1,7 +1,11 @@
+from datetime import datetime
 from unittest.mock import patch
 
-from airservice.services import order_service, item_service
-from airservice.models import db, Item
+import pytest
+
+from airservice.services import order_service, item_service, sales_service
+from airservice.models import db, Item, OrderItem, SalesRollup
+from conftest import auth_header
 
 
 def test_order_service_create_and_idempotent(app, sample_data):
@@ -18,6 +22,29 @@ def test_order_service_create_and_idempotent(app, sample_data):
             assert order.id == order2.id
 
 
+def test_create_order_is_atomic(app, sample_data):
+    from sqlalchemy import event
+    from sqlalchemy.exc import OperationalError
+    from airservice.models import Order
+    item_id = sample_data['items']['Паста Карбонара']
+
+    def fail_lines(conn, cursor, statement, *args):
+        if statement.startswith('INSERT INTO order_item'):
+            raise OperationalError(statement, None, Exception('disk I/O error'))
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', fail_lines)
+        try:
+            with patch('airservice.services.order_service.push_event') as pe, \
+                    pytest.raises(OperationalError):
+                order_service.create_order('3A', [{'item_id': item_id}])
+            pe.assert_not_called()
+            db.session.rollback()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', fail_lines)
+        assert Order.query.count() == 0
+
+
 def test_update_order_status(app, sample_data):
     item_id = sample_data['items']['Паста Карбонара']
     with app.app_context():
@@ -36,3 +63,171 @@ def test_item_service_crud(app):
         assert db.session.get(Item, item.id).price == 3.0
         item_service.delete_item(item)
         assert db.session.get(Item, item.id) is None
+
+
+def test_russian_stemming():
+    from airservice.services.search_service import stem_ru, tokens
+    assert stem_ru('подушка') == stem_ru('подушкой') == 'подушк'
+    assert stem_ru('красивейший') == 'красив'
+    assert stem_ru('ёлки') == 'елк'
+    assert tokens('Пиво Светлое, WiFi') == ['пив', 'светл', 'wifi']
+
+
+def test_item_service_keeps_search_index(app):
+    from airservice.services import search_service
+    with app.app_context(), patch('airservice.services.item_service.logging'):
+        item = item_service.create_item({'name_ru': 'Чай', 'name_en': 'Tea', 'price': 2.0})
+        assert search_service.search_item_ids('tea') == [item.id]
+        item_service.update_item(item, {'name_en': 'Coffee'})
+        assert search_service.search_item_ids('tea') == []
+        assert search_service.search_item_ids('coffee') == [item.id]
+        item_service.delete_item(item)
+        assert search_service.search_item_ids('coffee') == []
+        assert search_service.search_item_ids('чай') == []
+
+
+def test_idempotency_memory_store_bounds_and_expiry():
+    from airservice.services.idempotency import MemoryStore
+    store = MemoryStore(max_keys=2, ttl=60)
+    for n, key in enumerate(['a', 'b', 'c']):
+        assert store.claim(key) == (None, True)
+        store.complete(key, n)
+    assert list(store.entries) == ['b', 'c']
+    assert store.claim('b') == (1, False)
+
+    with patch('airservice.services.idempotency.time.monotonic', return_value=10 ** 9):
+        assert store.claim('c') == (None, True)
+
+
+def test_idempotency_duplicates_wait_for_first_request():
+    import threading
+    from airservice.services.idempotency import MemoryStore
+    store = MemoryStore(max_keys=10, ttl=60)
+    assert store.claim('k') == (None, True)
+    results = []
+    waiters = [threading.Thread(target=lambda: results.append(store.claim('k'))) for _ in range(5)]
+    for t in waiters:
+        t.start()
+    store.complete('k', 42)
+    for t in waiters:
+        t.join()
+    assert results == [(42, False)] * 5
+
+    # a released key passes to exactly one waiter
+    assert store.claim('x') == (None, True)
+    waiter = threading.Thread(target=lambda: results.append(store.claim('x')))
+    waiter.start()
+    store.release('x')
+    waiter.join()
+    assert results[-1] == (None, True)
+    assert store.claim('x', timeout=0.01) == (None, False)
+
+
+def rollup_rows():
+    return sorted(
+        (r.period, r.is_service, r.category_id, r.total_minor, r.quantity)
+        for r in SalesRollup.query
+    )
+
+
+def adhoc_rows():
+    return sorted(tuple(r) for r in db.session.execute(sales_service.aggregate()))
+
+
+def test_sales_rollup_matches_adhoc_aggregation(app, client, sample_data):
+    items = sample_data['items']
+    with app.app_context():
+        loose = Item(name_ru='Без категории', name_en='Loose', price=99.0)
+        db.session.add(loose)
+        db.session.commit()
+        loose_id = loose.id
+        # an order from an earlier month, loaded in bulk
+        order, _ = order_service.create_order('5F', [{'item_id': items['Борщ']}])
+        order.created_at = datetime(2025, 12, 31, 23, 59)
+        sales_service.rebuild()
+        db.session.commit()
+
+    ids = []
+    for n, (name, qty) in enumerate([('Паста Карбонара', 2), ('WiFi', 3), ('Вино красное сухое', 1),
+                                     ('Минеральная вода', 4)]):
+        rv = client.post('/orders', json={'seat': f'{n}A', 'items': [
+            {'item_id': items[name], 'quantity': qty}, {'item_id': loose_id},
+        ]})
+        ids.append(rv.get_json()['order_id'])
+    with app.app_context():
+        order_service.create_orders([
+            order_service.NewOrder('9C', order_service.price_lines([{'item_id': items['WiFi']}])),
+            order_service.NewOrder('9D', order_service.price_lines([{'item_id': items['Борщ'], 'quantity': 2}])),
+        ])
+
+    client.patch(f'/admin/orders/{ids[0]}', json={'status': 'cancelled'}, headers=auth_header())
+    client.patch(f'/admin/orders/{ids[1]}', json={'status': 'cancelled'}, headers=auth_header())
+    client.patch(f'/admin/orders/{ids[1]}', json={'status': 'done'}, headers=auth_header())
+    client.patch(f'/admin/orders/{ids[2]}', json={'status': 'done'}, headers=auth_header())
+
+    with app.app_context():
+        incremental = rollup_rows()
+        assert incremental == adhoc_rows()
+        assert (202512, False, sample_data['categories']['Food'], 48000, 1) in incremental
+        # lines of items without a category; the cancelled order's is gone
+        assert sum(r[4] for r in incremental if r[2] == 0) == 3
+
+    result = app.test_cli_runner().invoke(args=['rebuild-sales-rollup'])
+    assert 'rollup rows' in result.output
+    with app.app_context():
+        assert rollup_rows() == incremental
+
+
+def test_sales_rollup_rebuild_sums_stored_line_prices(app, client, sample_data):
+    with app.app_context():
+        item = Item(name_ru='Жвачка', name_en='Gum', price=0.285)
+        db.session.add(item)
+        db.session.commit()
+        item_id = item.id
+    client.post('/orders', json={'seat': '3B', 'items': [{'item_id': item_id, 'quantity': 3}]})
+    with app.app_context():
+        line = db.session.execute(db.select(OrderItem).where(OrderItem.item_id == item_id)).scalar_one()
+        assert line.unit_price_minor == sales_service.minor_units(0.285)
+        incremental = rollup_rows()
+        sales_service.rebuild()
+        assert rollup_rows() == incremental == [(incremental[0][0], False, 0, 3 * line.unit_price_minor, 3)]
+
+
+def test_sales_rollup_is_exact_for_fractional_prices(app, client, sample_data):
+    with app.app_context():
+        items = [Item(name_ru=f'Мелочь {n}', name_en=f'Trifle {n}', price=price)
+                 for n, price in enumerate([0.1, 0.2, 0.3])]
+        db.session.add_all(items)
+        db.session.commit()
+        ids = [i.id for i in items]
+    orders = [client.post('/orders', json={'seat': '3B', 'items': [{'item_id': item_id}]}).get_json()['order_id']
+              for item_id in ids + ids[:1]]
+    client.patch(f'/admin/orders/{orders[-1]}', json={'status': 'cancelled'}, headers=auth_header())
+
+    with app.app_context():
+        assert rollup_rows() == adhoc_rows()
+        assert [r[3] for r in rollup_rows()] == [60]
+        month = next(iter(sales_service.report()))
+        assert sales_service.report()[month]['goods'] == 0.6
+        client.patch(f'/admin/orders/{orders[0]}', json={'status': 'cancelled'}, headers=auth_header())
+        client.patch(f'/admin/orders/{orders[1]}', json={'status': 'cancelled'}, headers=auth_header())
+        client.patch(f'/admin/orders/{orders[2]}', json={'status': 'cancelled'}, headers=auth_header())
+        # nothing left to report, and no empty row left behind
+        assert rollup_rows() == adhoc_rows() == []
+        assert sales_service.report() == {}
+
+
+def test_sales_report_reads_rollup(app, client, sample_data):
+    items = sample_data['items']
+    wine = client.post('/orders', json={'seat': '1A', 'items': [{'item_id': items['Вино красное сухое'], 'quantity': 2}]})
+    client.post('/orders', json={'seat': '1B', 'items': [{'item_id': items['WiFi']}]})
+    pasta = client.post('/orders', json={'seat': '1C', 'items': [{'item_id': items['Паста Карбонара']}]})
+    client.patch(f'/admin/orders/{pasta.get_json()["order_id"]}', json={'status': 'cancelled'}, headers=auth_header())
+
+    (month, totals), = client.get('/admin/reports/sales', headers=auth_header()).get_json().items()
+    assert totals == {'goods': 1500.0, 'services': 10.0}
+    # Alcohol is a subcategory of Drinks
+    drinks = sample_data['categories']['Drinks']
+    report = client.get(f'/admin/reports/sales?category={drinks}', headers=auth_header()).get_json()
+    assert report == {month: {'goods': 1500.0, 'services': 0}}
+    assert wine.status_code == 201
@@ -0,0 +1,108 @@
+import os
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+from werkzeug.security import generate_password_hash
+
+from airservice.app import create_app
+from airservice.config import TestConfig
+from airservice.models import db
+from airservice.services import order_service
+from airservice.sqlite_profile import retry_on_busy
+
+
+def file_app(path, **overrides):
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['LOG_DIR'] = str(path.parent / 'logs')
+    os.environ['ADMIN_PASSWORD_HASH'] = generate_password_hash('admin')
+    cfg = TestConfig()
+    for key, value in overrides.items():
+        setattr(cfg, key, value)
+    try:
+        return create_app(cfg)
+    finally:
+        os.environ.pop('DATABASE_URL', None)
+        os.environ.pop('LOG_DIR', None)
+        os.environ.pop('ADMIN_PASSWORD_HASH', None)
+
+
+def pragma(name):
+    return db.session.execute(text(f'PRAGMA {name}')).scalar()
+
+
+def test_production_profile_sets_pragmas(tmp_path):
+    app = file_app(tmp_path / 'prod.db', SQLITE_BUSY_TIMEOUT_MS=1234)
+    with app.app_context():
+        assert isinstance(db.engine.pool, QueuePool)
+        assert db.engine.pool.size() == app.config['SQLITE_POOL_SIZE']
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1  # NORMAL
+        assert pragma('busy_timeout') == 1234
+        assert pragma('temp_store') == 2  # MEMORY
+        assert pragma('cache_size') == -app.config['SQLITE_CACHE_SIZE_KB']
+
+
+def test_default_profile_keeps_driver_defaults(tmp_path):
+    app = file_app(tmp_path / 'plain.db', SQLITE_PROFILE='default')
+    with app.app_context():
+        assert pragma('journal_mode') == 'delete'
+        assert pragma('synchronous') == 2  # FULL
+
+
+def locked():
+    return OperationalError('COMMIT', {}, Exception('database is locked'))
+
+
+def test_retry_on_busy_reruns_unit_of_work(app):
+    calls = []
+
+    @retry_on_busy
+    def write():
+        calls.append(1)
+        if len(calls) < 3:
+            raise locked()
+        return 'done'
+
+    with app.app_context(), patch('airservice.sqlite_profile.time.sleep'):
+        assert write() == 'done'
+        assert len(calls) == 3
+
+        app.config['SQLITE_BUSY_RETRIES'] = 1
+        calls.clear()
+        with pytest.raises(OperationalError):
+            write()
+        assert len(calls) == 2
+
+
+def test_retry_on_busy_ignores_other_errors(app):
+    calls = []
+
+    @retry_on_busy
+    def write():
+        calls.append(1)
+        raise OperationalError('SELECT', {}, Exception('no such table: x'))
+
+    with app.app_context(), pytest.raises(OperationalError):
+        write()
+    assert len(calls) == 1
+
+
+def test_order_creation_retries_when_locked(app, sample_data):
+    pasta = sample_data['items']['Паста Карбонара']
+    commit = db.session.commit
+    failures = [locked()]
+
+    def flaky_commit():
+        if failures:
+            raise failures.pop()
+        commit()
+
+    with app.app_context(), patch('airservice.sqlite_profile.time.sleep'), \
+            patch.object(db.session, 'commit', side_effect=flaky_commit):
+        order, created = order_service.create_order('5B', [{'item_id': pasta}])
+    assert created
+    with app.app_context():
+        assert order_service.get_order_view(order.id).seat == '5B'